@@ -1,9 +1,13 @@
 from fastapi import APIRouter, Query
 from datetime import date
+from functools import partial
 from typing import Optional, Tuple, List
 
-from KPI.DemoGraphic import get_demo_kpi_data
-from LLM.grok_client import generate_grok_insight
+from KPI.DemoGraphic import DEFAULT_COUNTRIES, MERCHANT_ID, get_demo_kpi_data
+from KPI.utils.window_batch import run_batch
+from LLM.grok_client import FAILED_PREFIX, generate_grok_insight
+from LLM.insight_cache import get_or_generate
+from LLM.prompt_compaction import compact_prompt
 
 router = APIRouter()
 
@@ -14,78 +18,60 @@ router = APIRouter()
 def demographic_kpis(
     filter_type: str = Query(default="YTD", description="Filter type like Daily, Weekly, MTD, etc."),
     start: Optional[date] = Query(default=None),
-    end: Optional[date] = Query(default=None)
+    end: Optional[date] = Query(default=None),
+    countries: Optional[List[str]] = Query(default=None, description="Country codes broken down by state/province (default US, GB)"),
+    merchant_id: int = Query(default=MERCHANT_ID, description="Merchant to report on"),
+    filter_types: Optional[List[str]] = Query(default=None, description="Batch: compute these presets at once and return {filter: payload}")
 ):
     custom = (start, end) if start and end else None
-    return get_demo_kpi_data(filter_type, custom)
+    countries = [c.upper() for c in countries] if countries else DEFAULT_COUNTRIES
+    if filter_types:
+        return run_batch(partial(get_demo_kpi_data, countries=countries, merchant_id=merchant_id), filter_types, custom)
+    return get_demo_kpi_data(filter_type, custom, countries, merchant_id)
 
 
 # ───────────────────────────
 # 2. INSIGHT-ONLY ENDPOINT
 # ───────────────────────────
+DEMO_INSTRUCTIONS = ("You are a data analyst reviewing performance metrics from a payments platform. "
+                     "Below is demographic KPI data:")
+DEMO_FOOTER = """⚡ Write a concise, 4–6 bullet summary highlighting:
+- Notable high/low performers across regions
+- Unusual patterns or outliers
+- Regions where user adoption appears strongest
+- Any insight the business team should know based on distribution
+
+Keep it tight, sharp, and focused on business relevance."""
+
+
 @router.get("/demographic/insight")
 def demographic_insight(
     filter_type: str = Query(default="YTD", description="Filter type like Daily, Weekly, MTD, etc."),
     start: Optional[date] = Query(default=None),
-    end: Optional[date] = Query(default=None)
+    end: Optional[date] = Query(default=None),
+    merchant_id: int = Query(default=MERCHANT_ID, description="Merchant to report on")
 ):
     custom = (start, end) if start and end else None
-    result = get_demo_kpi_data(filter_type, custom)
+    result = get_demo_kpi_data(filter_type, custom, merchant_id=merchant_id)
 
     chart = result.get("charts", [])[0] if result.get("charts") else None
     if not chart:
         return {"insight": "No data available to generate insight."}
 
-    # Unpack values from metrics for prompt generation
-    metrics = {m["title"]: m["value"] for m in result.get("metrics", [])}
-    country_count = metrics.get("Operational Countries", "N/A")
-    state_count = metrics.get("Operational States", "N/A")
-    us_sales = metrics.get("US Sales", "N/A")
-    gb_sales = metrics.get("GB Sales", "N/A")
-    us_success_rate = metrics.get("US Success Rate", "N/A")
-    gb_success_rate = metrics.get("GB Success Rate", "N/A")
-    top_issuer_country = metrics.get("Top Issuer Country", "N/A")
-    top_issuer_percent = metrics.get("Top Issuer Share", "N/A")
-    top_us_state = metrics.get("Top US State", "N/A")
-    us_txn_count = metrics.get("Top US State Txns", "N/A")
-    top_uk_state = metrics.get("Top UK State", "N/A")
-    gb_txn_count = metrics.get("Top UK State Txns", "N/A")
-
-    def build_demo_prompt() -> str:
-        return f"""
-You are a data analyst reviewing performance metrics from a payments platform. Below is demographic KPI data:
-
-- Operational Countries Count: {country_count}
-- Operational States Count: {state_count}
-
-- Sales by Region (US/GB):
-  - US: ${us_sales}
-  - GB: ${gb_sales}
-
-- Success Rate by Country (in %):
-  - US: {us_success_rate}%
-  - GB: {gb_success_rate}%
-
-- Card Issuing Country Distribution (Top % share):
-  - {top_issuer_country}: {top_issuer_percent}%
-
-- Top States/Provinces by Transaction Count (US & GB):
-  - US: {top_us_state} ({us_txn_count} txns)
-  - GB: {top_uk_state} ({gb_txn_count} txns)
-
-⚡ Write a concise, 4–6 bullet summary highlighting:
-- Notable high/low performers across regions
-- Unusual patterns or outliers
-- Regions where user adoption appears strongest
-- Any insight the business team should know based on distribution
+    compaction = None
 
-Keep it tight, sharp, and focused on business relevance.
-        """
+    def generate() -> str:
+        nonlocal compaction
+        prompt, compaction = compact_prompt("demographic", DEMO_INSTRUCTIONS, charts=result["charts"],
+                                            metrics=result.get("metrics", []), footer=DEMO_FOOTER)
+        return generate_grok_insight(prompt)
 
     try:
-        prompt = build_demo_prompt()
-        insight = generate_grok_insight(prompt)
+        # reused while the regional figures have not changed materially
+        insight, cache = get_or_generate("demographic", result["charts"], result.get("metrics", []), generate,
+                                         prompt=DEMO_INSTRUCTIONS + DEMO_FOOTER)
     except Exception as e:
-        insight = f"Insight generation failed: {str(e)}"
+        insight = f"{FAILED_PREFIX}: {str(e)}"
+        cache = None
 
-    return {"insight": insight}
+    return {"insight": insight, "prompt": compaction, "cache": cache}
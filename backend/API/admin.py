@@ -0,0 +1,92 @@
+import hmac
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+
+from config import ADMIN_TOKEN
+from DB.connector import shared_engine
+from KPI.utils import plan_capture, profiler
+
+
+def require_admin(
+    x_admin_token: Optional[str] = Header(None),
+    admin_token: Optional[str] = Query(None, description="Admin token (or send the X-Admin-Token header)"),
+):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Admin endpoints are disabled (ADMIN_TOKEN is not set)")
+    if not hmac.compare_digest(x_admin_token or admin_token or "", ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+
+router = APIRouter(prefix="/admin", dependencies=[Depends(require_admin)])
+# ─── Query Plans ─────────────────────────────────────────────────
+@router.get("/plans")
+def query_plans(regressed: bool = Query(False, description="Only labels whose latest plan regressed")):
+    """
+    Captured plans per query label (function, metric): the known-good
+    baseline and the latest plan (node tree, row estimates, buffers,
+    execution time), the latest plan's regressions and whether its shape
+    differs from the baseline.
+    """
+    return {"stats": plan_capture.stats(), "plans": plan_capture.report(shared_engine(), regressed_only=regressed)}
+
+
+@router.get("/plans/detail")
+def query_plan_detail(function: str, metric: str):
+    """The full EXPLAIN (ANALYZE, BUFFERS) output and statement of a label's baseline and latest plans."""
+    detail = plan_capture.plan_detail((function, metric), shared_engine())
+    if detail is None:
+        raise HTTPException(status_code=404, detail="No plan captured for this label")
+    return detail
+
+
+@router.post("/plans/accept")
+def accept_query_plan(function: str, metric: str):
+    """Accepts the label's latest plan as its known-good baseline (e.g. after an intended index change)."""
+    if not plan_capture.accept((function, metric), shared_engine()):
+        raise HTTPException(status_code=404, detail="No plan captured for this label")
+    return {"function": function, "metric": metric, "accepted": True}
+
+
+# ─── Profiles ────────────────────────────────────────────────────
+@router.get("/profiles")
+def list_profiles():
+    """
+    Stored per-request profiles, newest first: path, duration, sample count
+    and top hot frames. Profile a request by sending it with `X-Profile: 1`
+    (or ?profile=1) and the admin token.
+    """
+    return profiler.profiles()
+
+
+@router.get("/profiles/{profile_id}")
+def get_profile(profile_id: str):
+    """The profile in speedscope format (open it at https://www.speedscope.app)."""
+    stored = profiler.get_profile(profile_id)
+    if stored is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired profile id")
+    return stored["profile"]
+
+
+@router.get("/profile/continuous")
+def continuous_profile(limit: int = Query(30, ge=1, le=500),
+                       format: str = Query("hot", pattern="^(hot|speedscope)$")):
+    """
+    Continuous sampling across requests: hot frames by self time (with
+    inclusive time), or the aggregate as a speedscope profile.
+    """
+    if format == "speedscope":
+        profile = profiler.continuous_speedscope()
+        if profile is None:
+            raise HTTPException(status_code=404, detail="Continuous profiling is not running")
+        return profile
+    return profiler.continuous_report(limit)
+
+
+@router.post("/profile/continuous")
+def set_continuous_profile(enabled: bool = Query(...), reset: bool = Query(False)):
+    """Starts or stops continuous sampling; reset=true clears what it has aggregated so far."""
+    profiler.set_continuous(enabled)
+    if reset:
+        profiler.reset_continuous()
+    return {"running": enabled}
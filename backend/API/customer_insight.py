@@ -1,8 +1,12 @@
 from fastapi import APIRouter, Query
 from datetime import date
-from typing import Optional, Tuple
-from KPI.customer_insight import get_customer_insights_data
+from functools import partial
+from typing import List, Optional, Tuple
+from KPI.customer_insight import MERCHANT_ID, get_customer_insights_data
+from KPI.utils.window_batch import run_batch
 from LLM.grok_client import generate_grok_insight  # Correct import
+from LLM.insight_cache import get_or_generate
+from LLM.prompt_compaction import compact_prompt
 import asyncio
 
 router = APIRouter()
@@ -24,21 +28,33 @@ def customer_insights(
         description="Predefined time filter"
     ),
     start: Optional[date] = Query(None, description="Start date for custom range (YYYY-MM-DD)"),
-    end: Optional[date] = Query(None, description="End date for custom range (YYYY-MM-DD)")
+    end: Optional[date] = Query(None, description="End date for custom range (YYYY-MM-DD)"),
+    merchant_id: int = Query(MERCHANT_ID, description="Merchant to report on"),
+    filter_types: Optional[List[str]] = Query(None, description="Batch: compute these presets at once and return {filter: payload}")
 ):
     custom_range: Optional[Tuple[date, date]] = (start, end) if start and end else None
-    return get_customer_insights_data(filter_type, custom_range)
+    if filter_types:
+        return run_batch(partial(get_customer_insights_data, merchant_id=merchant_id), filter_types, custom_range)
+    return get_customer_insights_data(filter_type, custom_range, merchant_id)
 
 # ───────────────────────────────────────────────────────────────
+CHART_INSIGHT_INSTRUCTIONS = (
+    "You are an analytics assistant. Based on the following chart data, "
+    "generate a short and actionable business insight. "
+    "Keep it concise, relevant, and insightful."
+)
+
+
 @router.get("/customer-insights/insight")
 def customer_insights_ai_insight(
     chart_id: Optional[str] = Query(None, description="Chart title to identify which chart insight to generate"),
     filter_type: str = Query("YTD"),
     start: Optional[date] = Query(None),
-    end: Optional[date] = Query(None)
+    end: Optional[date] = Query(None),
+    merchant_id: int = Query(MERCHANT_ID)
 ):
     custom_range = (start, end) if start and end else None
-    dashboard_data = get_customer_insights_data(filter_type, custom_range)
+    dashboard_data = get_customer_insights_data(filter_type, custom_range, merchant_id)
 
     # Match the chart by its title
     chart_data = next((chart for chart in dashboard_data["charts"] if chart["title"] == chart_id), None)
@@ -46,12 +62,13 @@ def customer_insights_ai_insight(
     if chart_data is None:
         return {"error": "Please provide a valid chart_id."}
 
-    prompt = (
-        "You are an analytics assistant. Based on the following chart data, "
-        "generate a short and actionable business insight. "
-        "Keep it concise, relevant, and insightful.\n\n"
-        f"{chart_data}"
-    )
+    compaction = None
+
+    def generate() -> str:
+        nonlocal compaction
+        prompt, compaction = compact_prompt("customer", CHART_INSIGHT_INSTRUCTIONS, charts=[chart_data])
+        return generate_grok_insight(prompt=prompt)
 
-    insight = generate_grok_insight(prompt=prompt)
-    return {"insight": insight}
+    # reused while the chart has not changed materially (and filled ahead of time by the precompute jobs)
+    insight, cache = get_or_generate("customer", [chart_data], [], generate, prompt=CHART_INSIGHT_INSTRUCTIONS)
+    return {"insight": insight, "prompt": compaction, "cache": cache}
@@ -0,0 +1,16 @@
+from fastapi import APIRouter, HTTPException
+
+from KPI.utils.approx import exact_result
+
+router = APIRouter()
+
+@router.get("/exact-results/{token}")
+def get_exact_result(token: str):
+    """
+    Polls the exact follow-up of an `accuracy=approx&follow_up=true` request:
+    {"status": "pending" | "done" | "failed", "result": {...}}.
+    """
+    result = exact_result(token)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired result token")
+    return result
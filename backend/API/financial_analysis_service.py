@@ -1,6 +1,10 @@
 from fastapi import APIRouter, Query
 from datetime import date
+from functools import partial
+from typing import List, Optional
 from KPI.financial_analysis import get_financial_performance_data
+from KPI.utils.approx import Accuracy, run_page
+from KPI.utils.window_batch import run_batch
 
 router = APIRouter()
 
@@ -9,6 +13,13 @@ def financial_performance(
     filter_type: str = Query(default="YTD"),
     start: date = Query(default=None),
     end: date = Query(default=None),
+    accuracy: Accuracy = Query(default="auto"),
+    follow_up: bool = Query(default=False, description="with approx, also compute the exact result in the background"),
+    merchant_id: Optional[int] = Query(default=None, description="Restrict to one merchant (default: all merchants)"),
+    filter_types: Optional[List[str]] = Query(default=None, description="Batch: compute these presets in one pass and return {filter: payload}"),
 ):
     custom = (start, end) if start and end else None
-    return get_financial_performance_data(filter_type, custom)
+    page = partial(get_financial_performance_data, merchant_id=merchant_id)
+    if filter_types:
+        return run_batch(page, filter_types, custom)
+    return run_page(page, filter_type, custom, accuracy, follow_up)
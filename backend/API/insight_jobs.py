@@ -0,0 +1,50 @@
+from datetime import date
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Query
+
+from LLM import insight_jobs
+
+router = APIRouter()
+
+# ─── Insight Jobs ────────────────────────────────────────────────
+@router.post("/insight-jobs")
+def enqueue_insight_job(
+    page: str = Query(..., description="customer, demographic or gateway_fee"),
+    filter_type: str = Query("YTD"),
+    start: Optional[date] = Query(None),
+    end: Optional[date] = Query(None),
+    merchant_id: Optional[int] = Query(None),
+    chart_id: Optional[str] = Query(None, description="Chart title (customer insights only)"),
+):
+    """
+    Queues an insight for a page and filter and returns its job id at once.
+    An identical job that is still queued or running is returned instead.
+    Poll status_url until status is "done" (result holds the same body as
+    the page's /insight endpoint) or "failed".
+    """
+    params = {"filter_type": filter_type, "start": start, "end": end, "merchant_id": merchant_id, "chart_id": chart_id}
+    try:
+        job_id, created = insight_jobs.enqueue(page, params)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"job_id": job_id, "created": created, "status_url": f"/api/insight-jobs/{job_id}"}
+
+
+@router.get("/insight-jobs/{job_id}")
+def insight_job(job_id: int):
+    """A job's status (queued / running / done / failed), attempts, error and, once done, its result."""
+    job = insight_jobs.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown insight job")
+    return job
+
+
+@router.get("/insight-jobs")
+def list_insight_jobs(
+    status: Optional[str] = Query(None, description="Only jobs in this status"),
+    limit: int = Query(50, ge=1, le=500),
+):
+    """Recent jobs newest first (without results), jobs per status and this worker's job counters."""
+    return {"queue": insight_jobs.queue_depth(), "stats": insight_jobs.stats(),
+            "jobs": insight_jobs.recent_jobs(limit, status)}
@@ -0,0 +1,85 @@
+import asyncio
+import json
+from datetime import date
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Query, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+
+from config import LIVE_QUEUE_SIZE
+from KPI.live_feed import hub
+
+router = APIRouter()
+
+def _custom(start, end):
+    return (date.fromisoformat(str(start)), date.fromisoformat(str(end))) if start and end else None
+
+
+@router.websocket("/live")
+async def live_socket(websocket: WebSocket):
+    """
+    Live page updates over one WebSocket. Send
+      {"action": "subscribe" | "unsubscribe", "page": "dashboard" | "risk-and-fraud",
+       "filter_type": "MTD", "start": "YYYY-MM-DD", "end": "YYYY-MM-DD"}
+    and receive a "snapshot" message per subscription, then "delta" messages
+    carrying only the metrics / charts that changed.
+    """
+    await websocket.accept()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=LIVE_QUEUE_SIZE)
+    keys = set()
+
+    async def sender():
+        while True:
+            await websocket.send_text(json.dumps(await queue.get(), default=str))
+
+    send_task = asyncio.create_task(sender())
+    try:
+        while True:
+            msg = await websocket.receive_json()
+            action = msg.get("action", "subscribe")
+            try:
+                page = msg["page"]
+                filter_type = msg.get("filter_type", "YTD")
+                custom = _custom(msg.get("start"), msg.get("end"))
+                if action == "subscribe":
+                    keys.add(await hub.subscribe(queue, page, filter_type, custom))
+                elif action == "unsubscribe":
+                    key = next((k for k in keys if k[0] == page and k[1] in (filter_type, None)), None)
+                    if key:
+                        hub.unsubscribe(queue, key)
+                        keys.discard(key)
+                else:
+                    raise ValueError(f"Unsupported action: {action}")
+            except (KeyError, ValueError) as e:
+                await queue.put({"type": "error", "detail": str(e)})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        send_task.cancel()
+        for key in keys:
+            hub.unsubscribe(queue, key)
+
+
+@router.get("/live/stream")
+async def live_stream(
+    page: str = Query(..., enum=["dashboard", "risk-and-fraud"]),
+    filter_type: str = Query("YTD"),
+    start: Optional[date] = Query(None),
+    end: Optional[date] = Query(None),
+):
+    """Server-Sent Events variant of /live for a single page subscription."""
+    queue: asyncio.Queue = asyncio.Queue(maxsize=LIVE_QUEUE_SIZE)
+    try:
+        key = await hub.subscribe(queue, page, filter_type, _custom(start, end))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    async def events():
+        try:
+            while True:
+                msg = await queue.get()
+                yield f"event: {msg['type']}\ndata: {json.dumps(msg, default=str)}\n\n"
+        finally:
+            hub.unsubscribe(queue, key)
+
+    return StreamingResponse(events(), media_type="text/event-stream")
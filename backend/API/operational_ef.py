@@ -1,7 +1,10 @@
 from fastapi import APIRouter, Query
 from KPI.operational_efficiency import get_operational_efficiency_data
+from KPI.utils.approx import Accuracy, run_page
+from KPI.utils.window_batch import run_batch
 from datetime import date
-from typing import Optional, Tuple
+from functools import partial
+from typing import List, Optional, Tuple
 
 router = APIRouter()
 
@@ -9,8 +12,15 @@ router = APIRouter()
 def operational_efficiency(
     filter_type: str = Query(default="YTD", description="Time range filter (e.g., today, yesterday, daily, weekly, mtd, ytd)"),
     start: date = Query(None),
-    end:   date = Query(None)
+    end:   date = Query(None),
+    accuracy: Accuracy = Query("auto"),
+    follow_up: bool = Query(False, description="with approx, also compute the exact result in the background"),
+    merchant_id: Optional[int] = Query(None, description="Restrict to one merchant (default: all merchants)"),
+    filter_types: Optional[List[str]] = Query(None, description="Batch: compute these presets in one pass and return {filter: payload}"),
 ):
     
     custom = (start, end) if start and end else None
-    return get_operational_efficiency_data(filter_type, custom)
\ No newline at end of file
+    page = partial(get_operational_efficiency_data, merchant_id=merchant_id)
+    if filter_types:
+        return run_batch(page, filter_types, custom)
+    return run_page(page, filter_type, custom, accuracy, follow_up)
\ No newline at end of file
@@ -0,0 +1,21 @@
+from fastapi import APIRouter, HTTPException, Query
+from datetime import date
+from typing import Optional
+
+from KPI.portfolio import RANK_COLUMNS, get_portfolio_data
+
+router = APIRouter()
+
+@router.get("/portfolio")
+def merchant_portfolio(
+    filter_type: str = Query(default="YTD", description="Filter type like Daily, Weekly, MTD, etc."),
+    start: Optional[date] = Query(default=None),
+    end: Optional[date] = Query(default=None),
+    rank_by: str = Query(default="volume", enum=list(RANK_COLUMNS)),
+    limit: Optional[int] = Query(default=None, ge=1, description="Top-N merchants (default: all)"),
+):
+    custom = (start, end) if start and end else None
+    try:
+        return get_portfolio_data(filter_type, custom, rank_by, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
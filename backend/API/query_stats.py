@@ -0,0 +1,47 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from KPI.utils import admission, instrumentation, query_guard, replicas
+
+router = APIRouter()
+
+@router.get("/query-stats")
+def query_stats():
+    """
+    Cancelled work per endpoint since start: requests, cancelled_deadline,
+    cancelled_disconnect, cancelled_statement_timeout, statements_cancelled
+    (in flight when cancelled) and statements_skipped (never started).
+    """
+    return query_guard.stats()
+
+
+@router.get("/admission-stats")
+def admission_stats():
+    """
+    Admission control per cost class (cheap / heavy / insight): limits,
+    active requests, queue depth, average service time and the admitted,
+    queued and rejected_<reason> counters.
+    """
+    return admission.stats()
+
+
+@router.get("/replica-stats")
+def replica_stats():
+    """
+    Read replicas: whether each is up, its lag behind the primary, newest
+    replicated transaction and checked-out connections, plus the requests
+    routed to each engine by reason (open / closed window, fallback_lag,
+    fallback_down, primary).
+    """
+    return replicas.stats()
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """
+    Prometheus text exposition: per-(function, metric) SQL latency histograms
+    and row counts, per-route request latency with its db / llm / render
+    split, the query-deadline and admission counters, replica lag and
+    routing above, and insight prompt tokens before / after compaction.
+    """
+    return PlainTextResponse(instrumentation.render_metrics(), media_type="text/plain; version=0.0.4")
@@ -1,16 +1,139 @@
 import os
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+
 from dotenv import load_dotenv
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 
 load_dotenv()  # loads .env into environment
 
-def get_engine():
+_read_engine: ContextVar = ContextVar("read_engine", default=None)
+
+
+def get_engine(driver: str = None, host: str = None, port: str = None, **engine_kwargs):
     """
     Creates and returns a SQLAlchemy Engine using credentials from .env.
+    `driver` is "psycopg2" (default) or "psycopg" (psycopg 3, which enables
+    pipelined KPI queries); DB_DRIVER overrides the default. `host` and
+    `port` override DB_HOST / DB_PORT (replicas). Extra keyword arguments
+    (e.g. pool_size) are passed to create_engine.
     """
+    driver = driver or os.getenv('DB_DRIVER', 'psycopg2')
     url = (
-        f"postgresql+psycopg2://{os.getenv('DB_USER')}:"
-        f"{os.getenv('DB_PASSWORD')}@{os.getenv('DB_HOST')}:"
-        f"{os.getenv('DB_PORT')}/{os.getenv('DB_NAME')}"
+        f"postgresql+{driver}://{os.getenv('DB_USER')}:"
+        f"{os.getenv('DB_PASSWORD')}@{host or os.getenv('DB_HOST')}:"
+        f"{port or os.getenv('DB_PORT')}/{os.getenv('DB_NAME')}"
     )
-    return create_engine(url, future=True, pool_pre_ping=True)
\ No newline at end of file
+    engine = create_engine(url, future=True, pool_pre_ping=True, **engine_kwargs)
+    if driver == "psycopg":
+        _keep_prepared_statements(engine)
+    return engine
+
+
+# statements after which a transaction has only read; anything else counts as a write
+_READ_ONLY = ("SELECT", "SHOW", "EXPLAIN", "SET")
+
+
+def _keep_prepared_statements(engine):
+    """
+    psycopg 3 forgets its prepared statements whenever it sends ROLLBACK, and
+    SQLAlchemy rolls back every connection it closes or returns to the pool.
+    A transaction that only read is therefore committed just before that
+    rollback (same effect, as it changed nothing), which leaves the ROLLBACK
+    a no-op. The prepared statements (fetch_additive_many's pipelines) then
+    live as long as the pooled connection.
+    """
+    from psycopg.pq import TransactionStatus
+
+    @event.listens_for(engine, "begin")
+    def _begin(conn):
+        conn.info["wrote"] = False
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_execute(conn, cursor, statement, parameters, context, executemany):
+        if not statement.lstrip().upper().startswith(_READ_ONLY):
+            conn.info["wrote"] = True
+
+    @event.listens_for(engine, "rollback")
+    def _rollback(conn):
+        if conn.invalidated:
+            return
+        raw = conn.connection.dbapi_connection
+        # INTRANS: idle inside a healthy transaction (not failed, no statement running)
+        if not conn.info.get("wrote", True) and raw.info.transaction_status == TransactionStatus.INTRANS:
+            raw.commit()
+
+
+@lru_cache(maxsize=None)
+def shared_engine():
+    """
+    The process-wide Engine the KPI modules share, created on first use.
+    One pool of DB_POOL_SIZE (+ DB_MAX_OVERFLOW) connections serves every
+    page instead of one pool per module.
+    """
+    from config import DB_MAX_OVERFLOW, DB_POOL_SIZE
+
+    return get_engine(pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW)
+
+
+@lru_cache(maxsize=None)
+def replica_engines() -> dict:
+    """
+    {"host:port": Engine} for DB_REPLICA_HOSTS, created on first use. Their
+    sessions are read-only, so a write routed to a replica fails loudly
+    instead of diverging from the primary.
+    """
+    from config import DB_MAX_OVERFLOW, DB_POOL_SIZE, DB_REPLICA_HOSTS
+
+    engines = {}
+    for entry in DB_REPLICA_HOSTS:
+        name, engine = replica_engine(entry, pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW)
+        engines[name] = engine
+    return engines
+
+
+def replica_engine(entry: str, **engine_kwargs):
+    """("host:port", new read-only Engine) for one DB_REPLICA_HOSTS entry; extra kwargs go to create_engine."""
+    host, _, port = entry.partition(":")
+    port = port or os.getenv('DB_PORT')
+    connect_args = {"options": "-c default_transaction_read_only=on"}
+    if host.startswith("/"):  # a unix socket directory does not fit in the URL
+        connect_args["host"], host = host, None
+    name = entry if ":" in entry else f"{entry}:{port}"
+    return name, get_engine(host=host, port=port, connect_args=connect_args, **engine_kwargs)
+
+
+def is_replica(engine) -> bool:
+    return any(engine is e for e in replica_engines().values())
+
+
+def routed_engine():
+    """The engine this request reads from: its replica when one was picked (KPI/utils/replicas.py), else the primary."""
+    return _read_engine.get() or shared_engine()
+
+
+@contextmanager
+def reading_from(engine):
+    """Sends the LazyEngine reads made inside the block (and in contexts copied from it) to `engine`."""
+    token = _read_engine.set(engine)
+    try:
+        yield engine
+    finally:
+        _read_engine.reset(token)
+
+
+class LazyEngine:
+    """
+    Module-level stand-in for shared_engine(): importing a KPI module opens
+    nothing, and the first attribute access (engine.connect(), ...) creates
+    the shared Engine. Inside reading_from() it resolves to that engine
+    instead, which is how request reads reach a replica.
+    """
+
+    def __getattr__(self, name):
+        return getattr(routed_engine(), name)
+
+
+def lazy_engine() -> LazyEngine:
+    return LazyEngine()
@@ -0,0 +1,279 @@
+# backend/DB/daily_sketches.py
+
+import argparse
+import threading
+import time
+from datetime import date, datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import text
+
+from config import DAILY_SKETCHES_ENABLED, DAILY_SKETCHES_SECONDS
+from DB.connector import get_engine
+from KPI.utils.query_backend import once_per_request
+from KPI.utils.sketches import HyperLogLog, TDigest
+
+SCHEMA_SQL = [
+    """
+    CREATE TABLE IF NOT EXISTS daily_sketches (
+        day         DATE    NOT NULL,
+        merchant_id INTEGER NOT NULL,   -- 0 = all merchants
+        dimension   TEXT    NOT NULL,   -- column name, or 'usd_value' for the t-digest
+        sketch      BYTEA   NOT NULL,
+        PRIMARY KEY (day, merchant_id, dimension)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS daily_sketch_state (
+        id             SMALLINT PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+        first_day      DATE NOT NULL,
+        closed_through DATE NOT NULL
+    )
+    """,
+]
+
+DISTINCT_DIMENSIONS = ("country_code", "state_or_province", "credit_card_type")
+DIGEST_DIMENSION = "usd_value"
+ALL_MERCHANTS = 0
+
+
+def _as_date(value) -> Optional[date]:
+    return value.date() if isinstance(value, datetime) else value
+
+
+def _check_dimension(dimension: str):
+    if dimension not in DISTINCT_DIMENSIONS:
+        raise ValueError(f"No distinct-count sketch for column: {dimension}")
+
+
+# ─── Build ───────────────────────────────────────────────────────
+def build_daily_sketches(engine=None, through: Optional[date] = None) -> list[date]:
+    """
+    Sketches every closed day after the stored watermark: one HyperLogLog per
+    (day, merchant, distinct dimension) and one t-digest of usd_value per
+    (day, merchant), plus all-merchant rollups under merchant_id 0.
+    """
+    engine = engine or get_engine()
+    through = through or date.today() - timedelta(days=1)
+    built = []
+
+    with engine.begin() as conn:
+        for stmt in SCHEMA_SQL:
+            conn.execute(text(stmt))
+        state = conn.execute(text("SELECT first_day, closed_through FROM daily_sketch_state")).mappings().first()
+        if state:
+            first_day, day = state["first_day"], state["closed_through"] + timedelta(days=1)
+        else:
+            first_day = day = conn.execute(text("SELECT MIN(created_at)::date FROM live_transactions")).scalar()
+            if day is None:
+                return built
+
+    day_sql = "created_at >= :d AND created_at < :d + INTERVAL '1 day'"
+    while day <= through:
+        rows_out = []
+        with engine.begin() as conn:
+            for dim in DISTINCT_DIMENSIONS:
+                sketches = {ALL_MERCHANTS: HyperLogLog()}
+                for r in conn.execute(text(f"""
+                    SELECT merchant_id, {dim} AS v
+                      FROM live_transactions
+                     WHERE {day_sql} AND {dim} IS NOT NULL
+                     GROUP BY merchant_id, {dim}
+                """), {"d": day}):
+                    sketches.setdefault(r.merchant_id, HyperLogLog()).add(r.v)
+                    sketches[ALL_MERCHANTS].add(r.v)
+                rows_out += [(m, dim, s.to_bytes()) for m, s in sketches.items()]
+
+            values = {}
+            for r in conn.execute(text(f"""
+                SELECT merchant_id, usd_value::float8 AS v, COUNT(*) AS n
+                  FROM live_transactions
+                 WHERE {day_sql}
+                 GROUP BY merchant_id, usd_value
+            """), {"d": day}):
+                values.setdefault(r.merchant_id, ([], []))
+                values[r.merchant_id][0].append(r.v)
+                values[r.merchant_id][1].append(r.n)
+            overall = TDigest()
+            for m, (vs, ns) in values.items():
+                digest = TDigest().update(vs, ns)
+                overall.merge(digest)
+                rows_out.append((m, DIGEST_DIMENSION, digest.to_bytes()))
+            rows_out.append((ALL_MERCHANTS, DIGEST_DIMENSION, overall.to_bytes()))
+
+            conn.execute(text("""
+                INSERT INTO daily_sketches (day, merchant_id, dimension, sketch)
+                VALUES (:day, :m, :dim, :sketch)
+                ON CONFLICT (day, merchant_id, dimension) DO UPDATE SET sketch = EXCLUDED.sketch
+            """), [{"day": day, "m": m, "dim": dim, "sketch": blob} for m, dim, blob in rows_out])
+            conn.execute(text("""
+                INSERT INTO daily_sketch_state (id, first_day, closed_through) VALUES (1, :f, :c)
+                ON CONFLICT (id) DO UPDATE SET closed_through = EXCLUDED.closed_through
+            """), {"f": first_day, "c": day})
+        built.append(day)
+        day += timedelta(days=1)
+
+    return built
+
+
+def start_sketch_job(engine) -> Optional[threading.Thread]:
+    """
+    Background thread that sketches newly closed days every
+    DAILY_SKETCHES_SECONDS; run `python -m DB.daily_sketches` once first, or
+    the first pass builds the whole history. Every worker may run one; the
+    one holding the advisory lock builds, the rest skip.
+    """
+    if not DAILY_SKETCHES_ENABLED:
+        return None
+
+    def loop():
+        while True:
+            try:
+                with engine.connect() as conn:
+                    locked = conn.execute(text("SELECT pg_try_advisory_lock(hashtext('daily_sketches'))")).scalar()
+                    conn.commit()  # the session lock outlives it; don't sit idle in transaction while building
+                    if locked:
+                        try:
+                            days = build_daily_sketches(engine)
+                            if days:
+                                print(f"Sketched {len(days)} day(s) through {days[-1]}")
+                        finally:
+                            conn.execute(text("SELECT pg_advisory_unlock(hashtext('daily_sketches'))"))
+                    conn.commit()
+            except Exception as e:
+                print("🔴 Daily sketch build failed:", e)
+            time.sleep(DAILY_SKETCHES_SECONDS)
+
+    thread = threading.Thread(target=loop, name="daily-sketches", daemon=True)
+    thread.start()
+    return thread
+
+
+# ─── Query ───────────────────────────────────────────────────────
+def sketch_coverage(conn) -> Optional[tuple[date, date]]:
+    """(first_day, closed_through) of the stored sketches, or None if never built."""
+    if not conn.execute(text("SELECT to_regclass('daily_sketch_state')")).scalar():
+        return None
+    row = conn.execute(text("SELECT first_day, closed_through FROM daily_sketch_state")).first()
+    return (row[0], row[1]) if row else None
+
+
+def _merchant_filter(merchant_id: Optional[int]) -> tuple[str, dict]:
+    if merchant_id is None:
+        return "", {}
+    return " AND merchant_id = :m_id", {"m_id": merchant_id}
+
+
+def _sketches(conn, dimension: str, start: date, end: date, merchant_id: Optional[int]) -> list[bytes]:
+    return conn.execute(text("""
+        SELECT sketch FROM daily_sketches
+         WHERE dimension = :dim AND merchant_id = :m AND day BETWEEN :s AND :e
+    """), {"dim": dimension, "m": ALL_MERCHANTS if merchant_id is None else merchant_id,
+           "s": start, "e": end}).scalars().all()
+
+
+@once_per_request
+def window_distinct(conn, dimension: str, start=None, end=None, merchant_id: Optional[int] = None) -> int:
+    """
+    COUNT(DISTINCT dimension) over [start, end] (all time when omitted),
+    merged from daily sketches for closed days plus a raw DISTINCT over the
+    still-open days. Falls back to a raw scan if the window predates them.
+    """
+    _check_dimension(dimension)
+    start, end = _as_date(start), _as_date(end)
+    m_sql, m_params = _merchant_filter(merchant_id)
+    coverage = sketch_coverage(conn)
+
+    if coverage is None or (start is not None and start < coverage[0]):
+        date_sql = " AND created_at::date BETWEEN :s AND :e" if start is not None else ""
+        return int(conn.execute(text(f"""
+            SELECT COUNT(DISTINCT {dimension}) FROM live_transactions
+             WHERE TRUE{date_sql}{m_sql}
+        """), {"s": start, "e": end, **m_params}).scalar() or 0)
+
+    first_day, closed = coverage
+    start = start or first_day
+    end = end or date.today()
+    hll = HyperLogLog()
+    for blob in _sketches(conn, dimension, start, min(end, closed), merchant_id):
+        hll.merge(HyperLogLog.from_bytes(blob))
+    if end > closed:
+        hll.update(conn.execute(text(f"""
+            SELECT DISTINCT {dimension} FROM live_transactions
+             WHERE created_at >= :s AND created_at < :e + INTERVAL '1 day'
+               AND {dimension} IS NOT NULL{m_sql}
+        """), {"s": max(start, closed + timedelta(days=1)), "e": end, **m_params}).scalars())
+    return hll.count()
+
+
+@once_per_request
+def daily_distinct(conn, dimension: str, start, end, merchant_id: Optional[int] = None) -> list[float]:
+    """
+    Per-day COUNT(DISTINCT dimension) for the days in [start, end] that have
+    data, in day order, read straight from the daily sketches when covered.
+    """
+    _check_dimension(dimension)
+    start, end = _as_date(start), _as_date(end)
+    coverage = sketch_coverage(conn)
+    if coverage is None or start < coverage[0] or end > coverage[1]:
+        m_sql, m_params = _merchant_filter(merchant_id)
+        rows = conn.execute(text(f"""
+            SELECT created_at::date AS day, COUNT(DISTINCT {dimension})::float AS count
+              FROM live_transactions
+             WHERE created_at::date BETWEEN :s AND :e{m_sql}
+             GROUP BY created_at::date
+             ORDER BY day
+        """), {"s": start, "e": end, **m_params}).mappings().all()
+        return [r["count"] for r in rows]
+
+    rows = conn.execute(text("""
+        SELECT day, sketch FROM daily_sketches
+         WHERE dimension = :dim AND merchant_id = :m AND day BETWEEN :s AND :e
+         ORDER BY day
+    """), {"dim": dimension, "m": ALL_MERCHANTS if merchant_id is None else merchant_id,
+           "s": start, "e": end}).all()
+    return [float(HyperLogLog.from_bytes(r.sketch).count()) for r in rows]
+
+
+@once_per_request
+def window_quantiles(conn, start, end, quantiles: tuple, merchant_id: Optional[int] = None) -> list[float]:
+    """
+    usd_value quantiles over [start, end] from merged daily t-digests plus
+    the raw values of still-open days; exact percentile_cont if the window
+    predates the sketches.
+    """
+    start, end = _as_date(start), _as_date(end)
+    m_sql, m_params = _merchant_filter(merchant_id)
+    coverage = sketch_coverage(conn)
+
+    if coverage is None or start < coverage[0]:
+        row = conn.execute(text(f"""
+            SELECT percentile_cont(CAST(:qs AS float8[])) WITHIN GROUP (ORDER BY usd_value)
+              FROM live_transactions
+             WHERE created_at::date BETWEEN :s AND :e{m_sql}
+        """), {"qs": list(quantiles), "s": start, "e": end, **m_params}).scalar()
+        return [float(v or 0) for v in (row or [0] * len(quantiles))]
+
+    closed = coverage[1]
+    digest = TDigest()
+    for blob in _sketches(conn, DIGEST_DIMENSION, start, min(end, closed), merchant_id):
+        digest.merge(TDigest.from_bytes(blob))
+    if end > closed:
+        rows = conn.execute(text(f"""
+            SELECT usd_value::float8 AS v, COUNT(*) AS n
+              FROM live_transactions
+             WHERE created_at >= :s AND created_at < :e + INTERVAL '1 day'{m_sql}
+             GROUP BY usd_value
+        """), {"s": max(start, closed + timedelta(days=1)), "e": end, **m_params}).all()
+        digest.update([r.v for r in rows], [r.n for r in rows])
+    return [digest.quantile(q) for q in quantiles]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build daily HyperLogLog / t-digest sketches.")
+    parser.add_argument("--through", type=date.fromisoformat, default=None,
+                        help="last closed day to sketch (default: yesterday)")
+    args = parser.parse_args()
+
+    days = build_daily_sketches(through=args.through)
+    print(f"Sketched {len(days)} day(s)")
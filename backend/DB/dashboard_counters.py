@@ -0,0 +1,209 @@
+# backend/DB/dashboard_counters.py
+
+import argparse
+import threading
+import time
+from typing import Optional
+
+from sqlalchemy import text
+
+from config import (DASHBOARD_COUNTERS_BATCH_ROWS, DASHBOARD_COUNTERS_ENABLED,
+                    DASHBOARD_COUNTERS_SECONDS, DASHBOARD_RECONCILE_SECONDS)
+from DB.connector import get_engine
+
+SCHEMA_SQL = [
+    """
+    CREATE TABLE IF NOT EXISTS dashboard_counters (
+        dimension  TEXT    NOT NULL,   -- 'total' | 'currency' | 'acquirer' | 'method'
+        key        TEXT    NOT NULL,   -- category value ('' = NULL / the single total row)
+        volume     NUMERIC NOT NULL DEFAULT 0,
+        valued     BIGINT  NOT NULL DEFAULT 0,
+        total      BIGINT  NOT NULL DEFAULT 0,
+        fraud      BIGINT  NOT NULL DEFAULT 0,
+        fraud_loss NUMERIC NOT NULL DEFAULT 0,
+        PRIMARY KEY (dimension, key)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS dashboard_counters_state (
+        id            SMALLINT PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+        watermark     BIGINT NOT NULL,          -- last live_transactions.id folded in
+        reconciled_at TIMESTAMPTZ
+    )
+    """,
+]
+
+COLUMNS = ("volume", "valued", "total", "fraud", "fraud_loss")
+_LOCK_SQL = "SELECT pg_advisory_xact_lock(hashtext('dashboard_counters'))"
+
+
+def increments_sql(source: str) -> str:
+    """
+    Counter increments contributed by the rows of `source` (a table or
+    subquery with live_transactions' columns), one row per (dimension, key).
+    """
+    aggregates = """
+           COALESCE(SUM(usd_value), 0)                             AS volume,
+           COUNT(usd_value)                                        AS valued,
+           COUNT(*)                                                AS total,
+           COUNT(*) FILTER (WHERE fraud)                           AS fraud,
+           COALESCE(SUM(usd_value) FILTER (WHERE fraud = true), 0) AS fraud_loss
+    """
+    return f"""
+        SELECT 'total' AS dimension, '' AS key, {aggregates} FROM {source} s
+        UNION ALL
+        SELECT 'currency', COALESCE(transaction_currency, ''), {aggregates} FROM {source} s
+         GROUP BY transaction_currency
+        UNION ALL
+        SELECT 'acquirer', acquirer_id::text, {aggregates} FROM {source} s
+         WHERE acquirer_id IS NOT NULL
+         GROUP BY acquirer_id
+        UNION ALL
+        SELECT 'method', COALESCE(credit_card_type, ''), {aggregates} FROM {source} s
+         GROUP BY credit_card_type
+    """
+
+
+# ─── Maintenance ─────────────────────────────────────────────────
+def advance_counters(engine=None, batch_rows: int = DASHBOARD_COUNTERS_BATCH_ROWS) -> int:
+    """
+    Folds up to `batch_rows` rows past the watermark into the counters.
+    Returns how many ids the watermark moved (0 if not yet reconciled once).
+    """
+    engine = engine or get_engine()
+    with engine.begin() as conn:
+        conn.execute(text(_LOCK_SQL))
+        if not conn.execute(text("SELECT to_regclass('dashboard_counters_state')")).scalar():
+            return 0
+        watermark = conn.execute(text("SELECT watermark FROM dashboard_counters_state")).scalar()
+        if watermark is None:
+            return 0
+
+        hi = conn.execute(text("""
+            SELECT MAX(id) FROM (
+                SELECT id FROM live_transactions WHERE id > :wm ORDER BY id LIMIT :n
+            ) batch
+        """), {"wm": watermark, "n": batch_rows}).scalar()
+        if hi is None:
+            return 0
+
+        updates = ", ".join(f"{c} = dashboard_counters.{c} + EXCLUDED.{c}" for c in COLUMNS)
+        source = "(SELECT * FROM live_transactions WHERE id > :wm AND id <= :hi)"
+        conn.execute(text(f"""
+            INSERT INTO dashboard_counters (dimension, key, {', '.join(COLUMNS)})
+            {increments_sql(source)}
+            ON CONFLICT (dimension, key) DO UPDATE SET {updates}
+        """), {"wm": watermark, "hi": hi})
+        conn.execute(text("UPDATE dashboard_counters_state SET watermark = :hi"), {"hi": hi})
+    return hi - watermark
+
+
+def reconcile_counters(engine=None) -> int:
+    """
+    Rebuilds the counters from a full scan up to the current watermark (or,
+    the first time, up to MAX(id)). Catches rows that committed behind the
+    watermark and any drift; returns the number of (dimension, key) rows
+    that differed from the stored counters.
+    """
+    engine = engine or get_engine()
+    with engine.begin() as conn:
+        for stmt in SCHEMA_SQL:
+            conn.execute(text(stmt))
+        conn.execute(text(_LOCK_SQL))
+
+        watermark = conn.execute(text("SELECT watermark FROM dashboard_counters_state")).scalar()
+        if watermark is None:
+            watermark = conn.execute(text("SELECT COALESCE(MAX(id), 0) FROM live_transactions")).scalar()
+
+        def snapshot(rows):
+            return {(r.dimension, r.key): tuple(float(getattr(r, c)) for c in COLUMNS) for r in rows}
+
+        source = "(SELECT * FROM live_transactions WHERE id <= :wm)"
+        rows = conn.execute(text(increments_sql(source)), {"wm": watermark}).all()
+        fresh = snapshot(rows)
+        stored = snapshot(conn.execute(text(f"SELECT dimension, key, {', '.join(COLUMNS)} FROM dashboard_counters")))
+        drift = sum(1 for k in set(fresh) | set(stored) if fresh.get(k) != stored.get(k))
+
+        # the scan's rows are written back as they are, not recomputed by a second scan
+        conn.execute(text("DELETE FROM dashboard_counters"))
+        if rows:
+            conn.execute(text(f"""
+                INSERT INTO dashboard_counters (dimension, key, {', '.join(COLUMNS)})
+                VALUES (:dimension, :key, {', '.join(':' + c for c in COLUMNS)})
+            """), [r._asdict() for r in rows])
+        conn.execute(text("""
+            INSERT INTO dashboard_counters_state (id, watermark, reconciled_at) VALUES (1, :wm, now())
+            ON CONFLICT (id) DO UPDATE SET watermark = EXCLUDED.watermark, reconciled_at = now()
+        """), {"wm": watermark})
+    return drift
+
+
+# ─── Read ────────────────────────────────────────────────────────
+def read_counters(conn) -> Optional[dict]:
+    """
+    Current all-time counters as {(dimension, key): {column: value}}: the
+    stored counters plus the rows past the watermark, read in one statement
+    so a concurrent advance cannot double-count. None if the counters are
+    disabled or were never reconciled.
+    """
+    if not DASHBOARD_COUNTERS_ENABLED:
+        return None
+    if not conn.execute(text("SELECT to_regclass('dashboard_counters_state')")).scalar():
+        return None
+    if conn.execute(text("SELECT watermark FROM dashboard_counters_state")).scalar() is None:
+        return None
+
+    sums = ", ".join(f"SUM({c}) AS {c}" for c in COLUMNS)
+    tail = "(SELECT * FROM live_transactions WHERE id > (SELECT watermark FROM dashboard_counters_state))"
+    rows = conn.execute(text(f"""
+        SELECT dimension, key, {sums}
+          FROM (
+                SELECT dimension, key, {', '.join(COLUMNS)} FROM dashboard_counters
+                UNION ALL
+                {increments_sql(tail)}
+               ) parts
+         GROUP BY dimension, key
+    """)).all()
+    return {(r.dimension, r.key): {c: float(getattr(r, c) or 0) for c in COLUMNS} for r in rows}
+
+
+def start_counter_job(engine) -> Optional[threading.Thread]:
+    """
+    Background thread that advances the counters every DASHBOARD_COUNTERS_SECONDS
+    and reconciles them every DASHBOARD_RECONCILE_SECONDS (the first run builds
+    them). Every worker may run one; an advisory lock serialises the writers.
+    """
+    if not DASHBOARD_COUNTERS_ENABLED:
+        return None
+
+    def loop():
+        last_reconcile = None
+        while True:
+            try:
+                if last_reconcile is None or time.monotonic() - last_reconcile > DASHBOARD_RECONCILE_SECONDS:
+                    drift = reconcile_counters(engine)
+                    last_reconcile = time.monotonic()
+                    if drift:
+                        print(f"Dashboard counters reconciled, {drift} row(s) corrected")
+                while advance_counters(engine):
+                    pass
+            except Exception as e:
+                print("🔴 Dashboard counter refresh failed:", e)
+            time.sleep(DASHBOARD_COUNTERS_SECONDS)
+
+    thread = threading.Thread(target=loop, name="dashboard-counters", daemon=True)
+    thread.start()
+    return thread
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintain the all-time dashboard counters.")
+    parser.add_argument("--reconcile", action="store_true", help="rebuild from a full scan first")
+    args = parser.parse_args()
+
+    if args.reconcile:
+        print(f"Reconciled, {reconcile_counters()} row(s) corrected")
+    moved = 0
+    while (step := advance_counters()):
+        moved += step
+    print(f"Watermark advanced by {moved}")
@@ -0,0 +1,175 @@
+# backend/DB/geo_daily.py
+
+import argparse
+import threading
+import time
+from datetime import date, datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import text
+
+from config import GEO_DAILY_ENABLED, GEO_DAILY_SECONDS
+from DB.connector import get_engine
+
+SCHEMA_SQL = [
+    """
+    CREATE TABLE IF NOT EXISTS geo_daily (
+        day                 DATE    NOT NULL,
+        merchant_id         INTEGER NOT NULL,
+        country_code        TEXT,
+        state_or_province   TEXT,
+        issuer_country_code TEXT,
+        sales               NUMERIC NOT NULL,
+        success_count       BIGINT  NOT NULL,
+        txn_count           BIGINT  NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS geo_daily_merchant_day_idx ON geo_daily (merchant_id, day)",
+    """
+    CREATE TABLE IF NOT EXISTS geo_daily_state (
+        id             SMALLINT PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+        first_day      DATE NOT NULL,
+        closed_through DATE NOT NULL
+    )
+    """,
+]
+
+# day × merchant × country × state × issuer country, from any live_transactions-shaped source
+GEO_SELECT = """
+    SELECT {day} AS day, merchant_id, country_code, state_or_province, issuer_country_code,
+           COALESCE(SUM(usd_value), 0)                           AS sales,
+           COUNT(*) FILTER (WHERE payment_successful = true)     AS success_count,
+           COUNT(*)                                              AS txn_count
+      FROM live_transactions
+     WHERE {where}
+     GROUP BY {group}merchant_id, country_code, state_or_province, issuer_country_code
+"""
+
+
+def _as_date(value) -> date:
+    return value.date() if isinstance(value, datetime) else value
+
+
+def geo_coverage(conn) -> Optional[tuple[date, date]]:
+    """(first_day, closed_through) of the stored aggregate, or None if never built."""
+    if not conn.execute(text("SELECT to_regclass('geo_daily_state')")).scalar():
+        return None
+    row = conn.execute(text("SELECT first_day, closed_through FROM geo_daily_state")).first()
+    return (row[0], row[1]) if row else None
+
+
+# ─── Build ───────────────────────────────────────────────────────
+def refresh_geo_daily(engine=None, through: Optional[date] = None) -> int:
+    """
+    Aggregates every closed day after the stored watermark (first run:
+    from the earliest transaction) and advances it. Returns days added.
+    """
+    engine = engine or get_engine()
+    through = through or date.today() - timedelta(days=1)
+
+    with engine.begin() as conn:
+        for stmt in SCHEMA_SQL:
+            conn.execute(text(stmt))
+        coverage = geo_coverage(conn)
+        if coverage:
+            first_day, start = coverage[0], coverage[1] + timedelta(days=1)
+        else:
+            first_day = start = conn.execute(text("SELECT MIN(created_at)::date FROM live_transactions")).scalar()
+        if start is None or start > through:
+            return 0
+
+        conn.execute(text("DELETE FROM geo_daily WHERE day BETWEEN :s AND :e"), {"s": start, "e": through})
+        conn.execute(text("INSERT INTO geo_daily " + GEO_SELECT.format(
+            day="created_at::date",
+            where="created_at >= :s AND created_at < :e + INTERVAL '1 day'",
+            group="created_at::date, ",
+        )), {"s": start, "e": through})
+        conn.execute(text("""
+            INSERT INTO geo_daily_state (id, first_day, closed_through) VALUES (1, :f, :c)
+            ON CONFLICT (id) DO UPDATE SET closed_through = EXCLUDED.closed_through
+        """), {"f": first_day, "c": through})
+    return (through - start).days + 1
+
+
+def start_geo_daily_job(engine) -> Optional[threading.Thread]:
+    """
+    Background thread that adds newly closed days every GEO_DAILY_SECONDS;
+    run `python -m DB.geo_daily` once first, or the first pass aggregates the
+    whole history. Every worker may run one; the one holding the advisory
+    lock refreshes, the rest skip.
+    """
+    if not GEO_DAILY_ENABLED:
+        return None
+
+    def loop():
+        while True:
+            try:
+                with engine.connect() as conn:
+                    locked = conn.execute(text("SELECT pg_try_advisory_lock(hashtext('geo_daily'))")).scalar()
+                    conn.commit()  # the session lock outlives it; don't sit idle in transaction while refreshing
+                    if locked:
+                        try:
+                            days = refresh_geo_daily(engine)
+                            if days:
+                                print(f"Aggregated {days} geo day(s)")
+                        finally:
+                            conn.execute(text("SELECT pg_advisory_unlock(hashtext('geo_daily'))"))
+                    conn.commit()
+            except Exception as e:
+                print("🔴 Geo daily refresh failed:", e)
+            time.sleep(GEO_DAILY_SECONDS)
+
+    thread = threading.Thread(target=loop, name="geo-daily", daemon=True)
+    thread.start()
+    return thread
+
+
+# ─── Read ────────────────────────────────────────────────────────
+def geo_rows(conn, merchant_id: int, start, end) -> list[dict]:
+    """
+    (country_code, state_or_province, issuer_country_code, sales,
+    success_count, txn_count) for one merchant over [start, end], in one
+    statement: stored closed days plus a raw aggregate of the open ones.
+    Falls back to a single raw grouped scan if the window predates the table.
+    """
+    start, end = _as_date(start), _as_date(end)
+    params = {"m_id": merchant_id, "s": start, "e": end}
+    coverage = geo_coverage(conn)
+
+    if coverage is None or start < coverage[0]:
+        source = GEO_SELECT.format(
+            day="NULL::date",
+            where="merchant_id = :m_id AND created_at::date BETWEEN :s AND :e",
+            group="",
+        )
+    else:
+        params["c"] = coverage[1]
+        source = """
+            SELECT day, merchant_id, country_code, state_or_province, issuer_country_code,
+                   sales, success_count, txn_count
+              FROM geo_daily
+             WHERE merchant_id = :m_id AND day BETWEEN :s AND LEAST(:e, :c)
+            UNION ALL
+        """ + GEO_SELECT.format(
+            day="NULL::date",
+            where="merchant_id = :m_id AND created_at >= GREATEST(:s, :c + 1) AND created_at < :e + INTERVAL '1 day'",
+            group="",
+        )
+
+    return conn.execute(text(f"""
+        SELECT country_code, state_or_province, issuer_country_code,
+               SUM(sales)::float         AS sales,
+               SUM(success_count)::float AS success_count,
+               SUM(txn_count)::float     AS txn_count
+          FROM ({source}) g
+         GROUP BY country_code, state_or_province, issuer_country_code
+    """), params).mappings().all()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Refresh the daily geo aggregate.")
+    parser.add_argument("--through", type=date.fromisoformat, default=None,
+                        help="last closed day to aggregate (default: yesterday)")
+    args = parser.parse_args()
+
+    print(f"Aggregated {refresh_geo_daily(through=args.through)} day(s)")
@@ -0,0 +1,96 @@
+# backend/DB/parquet_export.py
+
+import argparse
+import json
+import os
+from datetime import date, timedelta
+from typing import Optional
+
+import pandas as pd
+from sqlalchemy import text
+
+from DB.connector import get_engine
+from config import PARQUET_DIR
+
+MANIFEST = "_manifest.json"
+
+
+def day_path(out_dir: str, day: date) -> str:
+    """Location of the Parquet file holding one closed day of live_transactions."""
+    return os.path.join(out_dir, "live_transactions", f"day={day.isoformat()}", "part-0.parquet")
+
+
+def read_manifest(out_dir: str = PARQUET_DIR) -> dict:
+    path = os.path.join(out_dir, MANIFEST)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def _write_atomic(df: pd.DataFrame, path: str):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    df.to_parquet(tmp, index=False)
+    os.replace(tmp, path)
+
+
+def export_closed_days(
+    engine=None,
+    out_dir: str = PARQUET_DIR,
+    through: Optional[date] = None
+) -> list[date]:
+    """
+    Writes every closed day of live_transactions that is not exported yet to
+    date-partitioned Parquet files, plus the small dimension tables the KPI
+    queries join against. Days up to and including `through` (default:
+    yesterday) are considered closed. Returns the list of exported days.
+    """
+    engine = engine or get_engine()
+    through = through or date.today() - timedelta(days=1)
+    manifest = read_manifest(out_dir)
+    exported = []
+
+    with engine.connect() as conn:
+        if manifest.get("closed_through"):
+            first = date.fromisoformat(manifest["closed_through"]) + timedelta(days=1)
+        else:
+            first = conn.execute(text("SELECT MIN(created_at)::date FROM live_transactions")).scalar()
+            if first is None:
+                return exported
+
+        day = first
+        while day <= through:
+            df = pd.read_sql(text("""
+                SELECT *
+                  FROM live_transactions
+                 WHERE created_at >= :d
+                   AND created_at <  :d + INTERVAL '1 day'
+            """), conn, params={"d": day})
+            _write_atomic(df, day_path(out_dir, day))
+            exported.append(day)
+            day += timedelta(days=1)
+
+        for table in ("acquirer", "merchant"):
+            _write_atomic(pd.read_sql(text(f"SELECT * FROM {table}"), conn),
+                          os.path.join(out_dir, f"{table}.parquet"))
+
+    # The manifest is written last so readers never see a watermark whose files are missing
+    if exported or not manifest:
+        manifest = {"closed_through": through.isoformat()}
+        with open(os.path.join(out_dir, MANIFEST) + ".tmp", "w") as f:
+            json.dump(manifest, f)
+        os.replace(os.path.join(out_dir, MANIFEST) + ".tmp", os.path.join(out_dir, MANIFEST))
+
+    return exported
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export closed days of live_transactions to Parquet.")
+    parser.add_argument("--out", default=PARQUET_DIR)
+    parser.add_argument("--through", type=date.fromisoformat, default=None,
+                        help="last closed day to export (default: yesterday)")
+    args = parser.parse_args()
+
+    days = export_closed_days(out_dir=args.out, through=args.through)
+    print(f"Exported {len(days)} day(s) to {args.out}")
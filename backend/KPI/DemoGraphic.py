@@ -1,147 +1,114 @@
 from datetime import date
-from sqlalchemy import text
-from DB.connector import get_engine
-from KPI.utils.time_utils import get_date_ranges, fetch_one
-from typing import Optional, Tuple
+from DB.connector import lazy_engine
+from DB.geo_daily import geo_rows
+from KPI.utils.time_utils import get_date_ranges
+from typing import Optional, Sequence, Tuple
 
-engine = get_engine()
-MERCHANT_ID = 26  # Hardcoded merchant ID
+engine = lazy_engine()
+MERCHANT_ID = 26  # default merchant when the request names none
+
+DEFAULT_COUNTRIES = ('US', 'GB')
+REGION_LABELS = {'US': 'USA', 'GB': 'UK'}  # frontend geo map names; other countries use their code
 
 def get_demo_kpi_data(
     filter_type: str = "YTD",
-    custom: Optional[Tuple[date, date]] = None
+    custom: Optional[Tuple[date, date]] = None,
+    countries: Sequence[str] = DEFAULT_COUNTRIES,
+    merchant_id: int = MERCHANT_ID
 ) -> dict:
     """
-    Returns demographic KPI metrics and chart data based on the selected date range filter.
-    Uses live_transactions table for all lookups.
+    Returns demographic KPI metrics and chart data for one merchant based on the selected date range filter.
+    Every metric and chart is derived from one read of the daily geo aggregate
+    (DB/geo_daily.py); `countries` selects the countries broken down by region
+    sales and state/province.
     """
     # Determine the current and comparison windows
     start, end, comp_start, comp_end = get_date_ranges(filter_type, custom)
-    metrics, charts = [], []
 
     with engine.connect() as conn:
-        # ─── Metric: Unique countries where merchant operates ─────────────
-        country_count = fetch_one(
-            conn,
-            """
-            SELECT COUNT(DISTINCT t.country_code)
-              FROM live_transactions t
-             WHERE t.merchant_id = :m_id
-               AND t.created_at::date BETWEEN :s AND :e
-            """,
-            {"m_id": MERCHANT_ID, "s": start, "e": end}
-        )
-        metrics.append({
-            "title": "Countries Operational",
-            "value": int(country_count)
-        })
-
-        # ─── Metric: Unique US/UK states/provinces ───────────────────────
-        state_count = fetch_one(
-            conn,
-            """
-            SELECT COUNT(DISTINCT t.state_or_province)
-              FROM live_transactions t
-             WHERE t.merchant_id = :m_id
-               AND t.created_at::date BETWEEN :s AND :e
-               AND t.state_or_province IS NOT NULL
-            """,
-            {"m_id": MERCHANT_ID, "s": start, "e": end}
-        )
-        metrics.append({
-            "title": "States Operational",
-            "value": int(state_count)
-        })
-
-        # ─── Chart 1: Sales by Region (US/UK only) ───────────────────────
-        region_rows = conn.execute(text("""
-            SELECT t.country_code, SUM(t.usd_value) AS total_sales
-              FROM live_transactions t
-             WHERE t.merchant_id = :m_id
-               AND t.created_at::date BETWEEN :s AND :e
-               AND t.country_code IN ('US','GB')
-             GROUP BY t.country_code
-             ORDER BY total_sales DESC
-        """), {"m_id": MERCHANT_ID, "s": start, "e": end}).mappings().all()
-
-        charts.append({
-            "title": "Sales by Region",
-            "type":  "bar",
-            "x":     [r["country_code"] for r in region_rows],
-            "y":     [round(r["total_sales"], 2) for r in region_rows]
-        })
-
-        # ─── Chart 2: Success Rate by Country ────────────────────────────
-        perf_rows = conn.execute(text("""
-            SELECT
-              t.country_code,
-              COUNT(*) FILTER (WHERE t.payment_successful = true)::float
-                / NULLIF(COUNT(*),0) * 100 AS success_rate
-            FROM live_transactions t
-           WHERE t.merchant_id = :m_id
-             AND t.created_at::date BETWEEN :s AND :e
-           GROUP BY t.country_code
-           ORDER BY success_rate DESC
-        """), {"m_id": MERCHANT_ID, "s": start, "e": end}).mappings().all()
-
-        charts.append({
-            "title": "Success Rate by Country",
-            "type":  "bar",
-            "x":     [r["country_code"] for r in perf_rows],
-            "y":     [round(r["success_rate"], 2) for r in perf_rows]
-        })
-
-        # ─── Chart 3: Transactions by Card Issuing Country (Pie) ────────
-        pie_rows = conn.execute(text("""
-            SELECT
-              t.issuer_country_code AS name,
-              COUNT(*)                   AS txn_count
-            FROM live_transactions t
-           WHERE t.merchant_id = :m_id
-             AND t.created_at::date BETWEEN :s AND :e
-             AND t.issuer_country_code IS NOT NULL
-           GROUP BY t.issuer_country_code
-        """), {"m_id": MERCHANT_ID, "s": start, "e": end}).mappings().all()
-
-        total_txns = sum(r["txn_count"] for r in pie_rows) or 1
-        charts.append({
-            "title": "Transactions by Card Issuing Country",
-            "type":  "pie",
-            "data": [
-                {
-                    "name":  r["name"],
-                    "value": round(r["txn_count"] / total_txns * 100, 1)
-                }
-                for r in pie_rows
-            ]
-        })
-
-        # ─── Chart 4: Transactions by State or Province (USA & UK) ──────
-        for country_code, region_label in [('US', 'USA'), ('GB', 'UK')]:
-            map_rows = conn.execute(text("""
-                SELECT
-                  t.state_or_province,
-                  COUNT(*) AS txn_count
-                FROM live_transactions t
-               WHERE t.merchant_id = :m_id
-                 AND t.created_at::date BETWEEN :s AND :e
-                 AND t.country_code = :c
-                 AND t.state_or_province IS NOT NULL
-               GROUP BY t.state_or_province
-               ORDER BY txn_count DESC
-            """), {"m_id": MERCHANT_ID, "s": start, "e": end, "c": country_code}).mappings().all()
-
-            if map_rows:
-                charts.append({
-                    "title": "Transactions by State or Province",
-                    "type":  "horizontal_bar",
-                    "region": region_label,  # Used by frontend to select geo map
-                    "y":     [r["state_or_province"] for r in map_rows],
-                    "series": [{
-                        "name": "Transactions",
-                        "data": [r["txn_count"] for r in map_rows]
-                    }]
-                })
+        rows = geo_rows(conn, merchant_id, start, end)
+
+    return build_demo_payload(rows, countries)
+
+
+def _group(rows, key: str) -> dict:
+    """Sums sales / success_count / txn_count of geo rows by one dimension, first-seen order."""
+    out = {}
+    for r in rows:
+        acc = out.setdefault(r[key], {'sales': 0.0, 'success_count': 0.0, 'txn_count': 0.0})
+        for col in acc:
+            acc[col] += r[col]
+    return out
+
+
+def build_demo_payload(rows, countries: Sequence[str] = DEFAULT_COUNTRIES) -> dict:
+    metrics, charts = [], []
+    by_country = _group(rows, 'country_code')
+
+    # ─── Metric: Unique countries where merchant operates ─────────────
+    metrics.append({
+        "title": "Countries Operational",
+        "value": sum(1 for c in by_country if c is not None)
+    })
+
+    # ─── Metric: Unique states/provinces ─────────────────────────────
+    metrics.append({
+        "title": "States Operational",
+        "value": sum(1 for s in _group(rows, 'state_or_province') if s is not None)
+    })
+
+    # ─── Chart 1: Sales by Region (selected countries) ───────────────
+    region_rows = sorted(((c, by_country[c]['sales']) for c in countries if c in by_country),
+                         key=lambda r: r[1], reverse=True)
+    charts.append({
+        "title": "Sales by Region",
+        "type":  "bar",
+        "x":     [c for c, _ in region_rows],
+        "y":     [round(sales, 2) for _, sales in region_rows]
+    })
+
+    # ─── Chart 2: Success Rate by Country ────────────────────────────
+    perf_rows = sorted(((c, v['success_count'] / v['txn_count'] * 100) for c, v in by_country.items() if v['txn_count']),
+                       key=lambda r: r[1], reverse=True)
+    charts.append({
+        "title": "Success Rate by Country",
+        "type":  "bar",
+        "x":     [c for c, _ in perf_rows],
+        "y":     [round(rate, 2) for _, rate in perf_rows]
+    })
+
+    # ─── Chart 3: Transactions by Card Issuing Country (Pie) ────────
+    pie_rows = [(name, v['txn_count']) for name, v in _group(rows, 'issuer_country_code').items() if name is not None]
+    total_txns = sum(n for _, n in pie_rows) or 1
+    charts.append({
+        "title": "Transactions by Card Issuing Country",
+        "type":  "pie",
+        "data": [
+            {
+                "name":  name,
+                "value": round(n / total_txns * 100, 1)
+            }
+            for name, n in pie_rows
+        ]
+    })
+
+    # ─── Chart 4: Transactions by State or Province (per country) ───
+    for country_code in countries:
+        states = _group([r for r in rows if r['country_code'] == country_code], 'state_or_province')
+        map_rows = sorted(((s, int(v['txn_count'])) for s, v in states.items() if s is not None),
+                          key=lambda r: (-r[1], r[0]))
+
+        if map_rows:
+            charts.append({
+                "title": "Transactions by State or Province",
+                "type":  "horizontal_bar",
+                "region": REGION_LABELS.get(country_code, country_code),  # Used by frontend to select geo map
+                "y":     [s for s, _ in map_rows],
+                "series": [{
+                    "name": "Transactions",
+                    "data": [n for _, n in map_rows]
+                }]
+            })
 
     return {
         "metrics": metrics,
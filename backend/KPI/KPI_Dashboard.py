@@ -1,146 +1,182 @@
 from datetime import datetime, timedelta
 from sqlalchemy import text
-from DB.connector import get_engine
+from DB.connector import lazy_engine
+from DB.dashboard_counters import COLUMNS, read_counters
+from KPI.utils.dimensions import get_dimensions, label_rows
 
-engine = get_engine()
+engine = lazy_engine()
 
 def fetch_dashboard_data() -> dict:
     """
     Returns combined metrics and charts for the dashboard.
     """
-    metrics = []
-    charts = []
-
     with engine.connect() as conn:
+        return build_dashboard_payload(dashboard_components(conn))
+
+
+# ─── Additive Components ─────────────────────────────────────────
+# All-time figures as sums/counts (plus per-category counts), so the live
+# feed (KPI/live_feed.py) can keep them current through `add_dashboard_row`.
+# Once the running counters exist they replace the full-table scans below.
+SQL_TOTALS = """
+    SELECT COALESCE(SUM(usd_value), 0)                               AS volume,
+           COUNT(usd_value)::float                                   AS valued,
+           COUNT(*)::float                                           AS total,
+           COUNT(*) FILTER (WHERE fraud)::float                      AS fraud,
+           COALESCE(SUM(usd_value) FILTER (WHERE fraud = true), 0)   AS fraud_loss
+      FROM live_transactions
+"""
+
+
+def dashboard_components(conn) -> dict:
+    counters = read_counters(conn)
+    if counters is not None:
+        return _components_from_counters(conn, counters)
+
+    totals = conn.execute(text(SQL_TOTALS)).mappings().one()
+    currency = conn.execute(text("""
+        SELECT transaction_currency AS name, SUM(usd_value) AS total
+          FROM live_transactions
+      GROUP BY transaction_currency
+    """)).all()
+    acquirer = conn.execute(text("""
+        SELECT acquirer_id, COUNT(*) AS cnt
+          FROM live_transactions
+      GROUP BY acquirer_id
+    """)).mappings().all()
+    dims = get_dimensions()
+    acquirer = label_rows(acquirer, "acquirer_id", dims.acquirer_names(conn), "acquirer")
+    method = conn.execute(text("""
+        SELECT credit_card_type AS method, COUNT(*) AS cnt
+          FROM live_transactions
+      GROUP BY credit_card_type
+    """)).all()
 
-        # ─── Metrics ──────────────────────────────────────────────
-        total_volume = conn.execute(
-            text(f"SELECT COALESCE(SUM(usd_value), 0) FROM live_transactions ")
-        ).scalar() or 0.0
-        avg_value = conn.execute(
-            text(f"SELECT COALESCE(AVG(usd_value),   0) FROM live_transactions ")
-        ).scalar() or 0.0
-
-        metrics += [
-            {"title": "Total Transaction Volume",  "value": round(float(total_volume), 2)},
-            {"title": "Average Transaction Value", "value": round(float(avg_value),    2)},
-        ]
+    return {
+        "totals":   {k: float(v or 0) for k, v in totals.items()},
+        "currency": {name: float(total or 0) for name, total in currency},
+        "acquirer": {r["acquirer"]: int(r["cnt"]) for r in acquirer},
+        "method":   {name: int(cnt) for name, cnt in method},
+        "partners": len(dims.acquirer_names(conn)),
+        "regions":  len(dims.merchant_countries(conn)),
+    }
 
-        processing_partners = conn.execute(
-            text("SELECT COUNT(*) FROM acquirer")
-        ).scalar() or 0
-        payment_methods = conn.execute(
-            text(f"SELECT COUNT(DISTINCT credit_card_type) FROM live_transactions ")
-        ).scalar() or 0
-        geographic_regions = conn.execute(
-            text("SELECT COUNT(DISTINCT country) FROM merchant")
-        ).scalar() or 0
-
-        metrics += [
-            {"title": "Processing Partners", "value": processing_partners},
-            {"title": "Payment Methods",     "value": payment_methods},
-            {"title": "Geographic Regions",  "value": geographic_regions},
-        ]
 
-        fraud_rate = conn.execute(
-            text(f"""
-                SELECT COUNT(*) FILTER (WHERE fraud) * 100.0 
-                  / NULLIF(COUNT(*),0)
-                  FROM live_transactions 
-            """)
-        ).scalar() or 0.0
-        metrics.append({"title": "Fraud Rate (%)", "value": round(float(fraud_rate), 2)})
-
-        fraud_loss = conn.execute(
-            text(f"""
-                SELECT COALESCE(SUM(usd_value),0) 
-                  FROM live_transactions 
-                 WHERE fraud = true
-            """)
-        ).scalar() or 0.0
-        metrics.append({"title": "Fraud Loss", "value": round(float(fraud_loss), 2)})
-
-        # ─── Charts ───────────────────────────────────────────────
-
-        # 1) Revenue by Currency (Pie)
-        rows = conn.execute(
-            text(f"""
-                SELECT transaction_currency AS name, SUM(usd_value) AS total
-                  FROM live_transactions 
-              GROUP BY transaction_currency
-            """)
-        ).mappings().all()
-        total = sum(r["total"] for r in rows) or 1
-        charts.append({
-            "title": "Revenue by Currency",
-            "type":  "pie",
-            "data": [
-                {"name": r["name"], "value": round(r["total"] / total * 100, 1)}
-                for r in rows
-            ]
-        })
-
-        # 2) Top 5 Acquirers by Volume (Bar)
-        rows = conn.execute(
-            text(f"""
-                SELECT a.name AS acquirer, COUNT(*) AS cnt
-                  FROM live_transactions t
-                  JOIN acquirer a ON t.acquirer_id = a.id
-                  
-              GROUP BY a.name
-              ORDER BY cnt DESC
-              LIMIT 5
-            """)
-        ).mappings().all()
-        charts.append({
-            "title": "Top 5 Acquirers by Volume",
-            "type":  "bar",
-            "x":     [r["acquirer"] for r in rows],
-            "y":     [r["cnt"]      for r in rows]
-        })
-
-        # 3) Payment Method Distribution (Bar)
-        rows = conn.execute(
-            text(f"""
-                SELECT credit_card_type AS method, COUNT(*) AS cnt
-                  FROM live_transactions 
-              GROUP BY credit_card_type
-            """)
-        ).mappings().all()
-        charts.append({
-            "title": "Payment Method Distribution",
-            "type":  "bar",
-            "x":     [r["method"] for r in rows],
-            "y":     [r["cnt"]    for r in rows]
-        })
-
-        # 4) AI-Powered Insights (List)
-        insights = [
-            "Implement ML-based fraud detection to reduce losses by 20–30%",
-            "Optimize partner allocation on success performance",
-            "Enhance 3DS flows to improve conversion rates",
-            "Build market-specific geographic growth strategies",
-            "Enable real-time alerting on KPI thresholds"
-        ]
-        charts.append({
-            "title": "AI-Powered Insights",
-            "type":  "list",
-            "data":  insights
-        })
-
-        # 5) Recent Activity (List)
-        now = datetime.utcnow()
-        activity = [
-            {"time": (now - timedelta(minutes=2)).isoformat(), "type": "alert",       "message": "Transaction volume spike detected"},
-            {"time": (now - timedelta(hours=1)).isoformat(),   "type": "report",      "message": "Weekly performance report generated"},
-            {"time": (now - timedelta(hours=3)).isoformat(),   "type": "analysis",    "message": "Fraud pattern analysis updated"},
-            {"time": (now - timedelta(days=1)).isoformat(),    "type": "integration", "message": "New payment method integrated"},
+def _components_from_counters(conn, counters: dict) -> dict:
+    """Same components, read from the running counters (DB/dashboard_counters.py)."""
+    dims = get_dimensions()
+    names = {str(a_id): name for a_id, name in dims.acquirer_names(conn).items()}
+    acquirer = {}
+    for (dimension, key), v in counters.items():
+        if dimension == "acquirer" and key in names:
+            acquirer[names[key]] = acquirer.get(names[key], 0) + int(v["total"])
+
+    return {
+        "totals":   counters.get(("total", ""), dict.fromkeys(COLUMNS, 0.0)),
+        "currency": {key or None: v["volume"] for (dim, key), v in counters.items() if dim == "currency"},
+        "acquirer": acquirer,
+        "method":   {key or None: int(v["total"]) for (dim, key), v in counters.items() if dim == "method"},
+        "partners": len(names),
+        "regions":  len(dims.merchant_countries(conn)),
+    }
+
+
+def add_dashboard_row(c: dict, row) -> None:
+    """Adds one live_transactions row to the components (mirror of the queries above)."""
+    usd = row["usd_value"]
+    fraud = row["fraud"] is True
+    totals = c["totals"]
+    totals["total"] += 1
+    totals["fraud"] += fraud
+    if usd is not None:
+        totals["volume"] += float(usd)
+        totals["valued"] += 1
+        totals["fraud_loss"] += float(usd) if fraud else 0.0
+    c["currency"][row["transaction_currency"]] = c["currency"].get(row["transaction_currency"], 0.0) + float(usd or 0)
+    if row["acquirer"] is not None:
+        c["acquirer"][row["acquirer"]] = c["acquirer"].get(row["acquirer"], 0) + 1
+    c["method"][row["credit_card_type"]] = c["method"].get(row["credit_card_type"], 0) + 1
+
+
+def build_dashboard_payload(c: dict) -> dict:
+    metrics = []
+    charts = []
+    totals = c["totals"]
+
+    # ─── Metrics ──────────────────────────────────────────────
+    avg_value = totals["volume"] / totals["valued"] if totals["valued"] else 0.0
+    metrics += [
+        {"title": "Total Transaction Volume",  "value": round(totals["volume"], 2)},
+        {"title": "Average Transaction Value", "value": round(avg_value,        2)},
+    ]
+
+    metrics += [
+        {"title": "Processing Partners", "value": c["partners"]},
+        {"title": "Payment Methods",     "value": sum(1 for m, n in c["method"].items() if m is not None and n)},
+        {"title": "Geographic Regions",  "value": c["regions"]},
+    ]
+
+    fraud_rate = totals["fraud"] * 100.0 / totals["total"] if totals["total"] else 0.0
+    metrics.append({"title": "Fraud Rate (%)", "value": round(fraud_rate, 2)})
+    metrics.append({"title": "Fraud Loss", "value": round(totals["fraud_loss"], 2)})
+
+    # ─── Charts ───────────────────────────────────────────────
+
+    # 1) Revenue by Currency (Pie)
+    total = sum(c["currency"].values()) or 1
+    charts.append({
+        "title": "Revenue by Currency",
+        "type":  "pie",
+        "data": [
+            {"name": name, "value": round(value / total * 100, 1)}
+            for name, value in c["currency"].items()
         ]
-        charts.append({
-            "title": "Recent Activity",
-            "type":  "list",
-            "data":  activity
-        })
+    })
+
+    # 2) Top 5 Acquirers by Volume (Bar)
+    top = sorted(c["acquirer"].items(), key=lambda kv: kv[1], reverse=True)[:5]
+    charts.append({
+        "title": "Top 5 Acquirers by Volume",
+        "type":  "bar",
+        "x":     [name for name, _ in top],
+        "y":     [cnt  for _, cnt in top]
+    })
+
+    # 3) Payment Method Distribution (Bar)
+    charts.append({
+        "title": "Payment Method Distribution",
+        "type":  "bar",
+        "x":     list(c["method"]),
+        "y":     list(c["method"].values())
+    })
+
+    # 4) AI-Powered Insights (List)
+    insights = [
+        "Implement ML-based fraud detection to reduce losses by 20–30%",
+        "Optimize partner allocation on success performance",
+        "Enhance 3DS flows to improve conversion rates",
+        "Build market-specific geographic growth strategies",
+        "Enable real-time alerting on KPI thresholds"
+    ]
+    charts.append({
+        "title": "AI-Powered Insights",
+        "type":  "list",
+        "data":  insights
+    })
+
+    # 5) Recent Activity (List)
+    now = datetime.utcnow()
+    activity = [
+        {"time": (now - timedelta(minutes=2)).isoformat(), "type": "alert",       "message": "Transaction volume spike detected"},
+        {"time": (now - timedelta(hours=1)).isoformat(),   "type": "report",      "message": "Weekly performance report generated"},
+        {"time": (now - timedelta(hours=3)).isoformat(),   "type": "analysis",    "message": "Fraud pattern analysis updated"},
+        {"time": (now - timedelta(days=1)).isoformat(),    "type": "integration", "message": "New payment method integrated"},
+    ]
+    charts.append({
+        "title": "Recent Activity",
+        "type":  "list",
+        "data":  activity
+    })
 
     return {
         "metrics": metrics,
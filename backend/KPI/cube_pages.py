@@ -0,0 +1,288 @@
+# backend/KPI/cube_pages.py
+"""
+KPI page payloads computed from the in-memory columnar cube
+(KPI/utils/columnar_cube.py) instead of Postgres. Each function mirrors the
+SQL path of its page module metric-for-metric; the page modules call these
+only when the cube covers every window the page needs.
+"""
+
+from datetime import date, timedelta
+
+import numpy as np
+
+from KPI.utils.columnar_cube import CubeSnapshot, distinct_count, grouped, window_mask
+from KPI.utils.stat_tests import compare_to_historical_single_point
+from KPI.utils.time_utils import pct_diff
+
+
+def _totals(cube: CubeSnapshot, mask: np.ndarray) -> dict:
+    return {
+        "volume":    float(cube.col("usd_value")[mask].sum()),
+        "txns":      float(mask.sum()),
+        "success":   float((mask & cube.col("payment_successful")).sum()),
+        "fraud":     float((mask & cube.col("fraud")).sum()),
+        "fraud_loss": float(cube.col("usd_value")[mask & cube.col("fraud")].sum()),
+        "detected":  float((mask & cube.col("pred_fraud")).sum()),
+        "fraud_3ds": float((mask & cube.col("fraud") & cube.col("three_ds")).sum()),
+        "total_3ds": float((mask & cube.col("three_ds")).sum()),
+    }
+
+
+def _per_day(cube: CubeSnapshot, mask: np.ndarray, values: np.ndarray = None) -> np.ndarray:
+    """Per-day totals (count, or sum of `values`) for days that have rows, in day order."""
+    day = cube.col("day")[mask]
+    if day.size == 0:
+        return np.array([])
+    offset = day - day.min()
+    counts = np.bincount(offset)
+    sums = np.bincount(offset, weights=values[mask]) if values is not None else counts
+    return sums[counts > 0]
+
+
+def _ticket_quantiles(cube: CubeSnapshot, mask: np.ndarray, qs=(0.5, 0.95, 0.99)) -> list[float]:
+    values = cube.col("usd_value")[mask]
+    if not values.size:
+        return [0.0] * len(qs)
+    return [float(v) for v in np.quantile(values, qs)]
+
+
+# ─── Financial Performance ───────────────────────────────────────
+def financial_performance(cube: CubeSnapshot, filter_type, start, end, comp_start, comp_end, merchant_id=None) -> dict:
+    curr = _totals(cube, window_mask(cube, start, end, merchant_id))
+    prev = _totals(cube, window_mask(cube, comp_start, comp_end, merchant_id))
+    metrics, charts = [], []
+
+    prev_vol, prev_cnt = prev["volume"], prev["txns"]
+    if filter_type == 'Daily':
+        prev_vol /= 7
+        prev_cnt /= 7
+    if filter_type == 'Weekly':
+        prev_vol /= 4
+        prev_cnt /= 4
+    curr_avg = curr["volume"] / curr["txns"] if curr["txns"] else 0.0
+    prev_avg = prev["volume"] / prev["txns"] if prev["txns"] else 0.0
+
+    metrics += [
+        {'title': 'Total Transaction Volume',  'value': round(curr["volume"], 2), 'diff': pct_diff(curr["volume"], prev_vol)},
+        {'title': 'Total Transactions',        'value': int(curr["txns"]),        'diff': pct_diff(curr["txns"], prev_cnt)},
+        {'title': 'Average Transaction Value', 'value': round(curr_avg, 2),       'diff': pct_diff(curr_avg, prev_avg)},
+    ]
+
+    # exact over the cube rows (the SQL path merges daily t-digests instead)
+    for title, c, p in zip(('Median Ticket Size', 'P95 Ticket Size', 'P99 Ticket Size'),
+                           _ticket_quantiles(cube, window_mask(cube, start, end, merchant_id)),
+                           _ticket_quantiles(cube, window_mask(cube, comp_start, comp_end, merchant_id))):
+        metrics.append({'title': title, 'value': round(c, 2), 'diff': pct_diff(c, p)})
+
+    mask = window_mask(cube, start, end, merchant_id)
+    rows = grouped(cube, "transaction_currency", mask, cube.col("usd_value"))
+    total_usd = sum(r[2] for r in rows) or 1
+    charts.append({
+        'title': 'Sales by Currency',
+        'type':  'pie',
+        'data':  [{'name': name, 'value': round(usd / total_usd * 100, 1)} for name, _, usd in rows],
+    })
+
+    fees = dict((name, fee) for name, _, fee in grouped(cube, "acquirer", mask, cube.col("fee"), include_null=False))
+    amts = grouped(cube, "acquirer", mask, cube.col("usd_value"), include_null=False)
+    amts.sort(key=lambda r: (not r[2], fees[r[0]] / r[2] if r[2] else 0))
+    pct = [round(fees[name] / amt * 100, 2) if amt else 0 for name, _, amt in amts]
+    charts.append({
+        'title': 'Processing Fee Analysis',
+        'type':  'horizontal_bar',
+        'x':      pct,
+        'y':      [name for name, _, _ in amts],
+        'series': [{'name': 'Fee % of Volume', 'data': pct}],
+    })
+    return {'metrics': metrics, 'charts': charts}
+
+
+# ─── Operational Efficiency ──────────────────────────────────────
+def operational_efficiency(cube: CubeSnapshot, filter_type, start, end, comp_start, comp_end, merchant_id=None) -> dict:
+    curr = _totals(cube, window_mask(cube, start, end, merchant_id))
+    prev = _totals(cube, window_mask(cube, comp_start, comp_end, merchant_id))
+    curr_rate = round(curr["success"] / (curr["txns"] or 1) * 100, 2)
+    prev_rate = round(prev["success"] / (prev["txns"] or 1) * 100, 2)
+    metrics = [{"title": "Transaction Success Rate (%)", "value": curr_rate, "diff": pct_diff(curr_rate, prev_rate)}]
+    charts = []
+
+    mask = window_mask(cube, start, end, merchant_id)
+    success = cube.col("payment_successful").astype(np.float64)
+    rows = grouped(cube, "acquirer", mask, success, include_null=False)
+    charts.append({
+        "title": "Processing Partner Efficiency",
+        "type": "double_bar_dual_axis",
+        "x": [name for name, _, _ in rows],
+        "yAxis": [
+            {"name": "Success Rate (%)", "type": "value", "min": 0,   "max": 100,     "position": "left"},
+            {"name": "Total Transactions", "type": "value",            "position": "right"},
+        ],
+        "series": [
+            {"name": "Success Rate (%)",   "type": "bar", "data": [round(ok * 100.0 / n, 2) if n else None for _, n, ok in rows], "yAxisIndex": 0},
+            {"name": "Total Transactions", "type": "bar", "data": [float(n) for _, n, _ in rows],                          "yAxisIndex": 1},
+        ],
+    })
+
+    funding = cube.col("funding_source")
+    funding_labels = cube.labels("funding_source")
+    series = {}
+    for kind in ("CREDIT", "DEBIT", "PREPAID"):
+        is_kind = (funding == funding_labels.index(kind)) if kind in funding_labels else np.zeros_like(mask)
+        series[kind] = dict((name, s) for name, _, s in grouped(cube, "credit_card_type", mask, is_kind.astype(np.float64)))
+    card_types = [name for name, _ in grouped(cube, "credit_card_type", mask)]
+    charts.append({
+        "title": "Payment Method Distribution",
+        "type": "stacked_bar",
+        "x": card_types,
+        "series": [
+            {"name": "Credit Funded",  "data": [series["CREDIT"][c]  for c in card_types]},
+            {"name": "Debit Funded",   "data": [series["DEBIT"][c]   for c in card_types]},
+            {"name": "Prepaid Funded", "data": [series["PREPAID"][c] for c in card_types]},
+        ],
+    })
+    return {"metrics": metrics, "charts": charts}
+
+
+# ─── Risk & Fraud ────────────────────────────────────────────────
+def risk_and_fraud(cube: CubeSnapshot, filter_type, start, end, comp_start, comp_end, merchant_id=None) -> dict:
+    curr = _totals(cube, window_mask(cube, start, end, merchant_id))
+    prev = _totals(cube, window_mask(cube, comp_start, comp_end, merchant_id))
+
+    curr_total, prev_total = curr["txns"] or 1, prev["txns"] or 1
+    curr_rate = round(curr["fraud"] / curr_total * 100, 2)
+    prev_rate = round(prev["fraud"] / prev_total * 100, 2)
+    curr_detect_pct = round(curr["detected"] / curr_total * 100, 2)
+    prev_detect_pct = round(prev["detected"] / prev_total * 100, 2)
+    avg_fraud_loss = curr["fraud_loss"] / curr["fraud"] if curr["fraud"] else 0
+    prev_avg_fraud = prev["fraud_loss"] / prev["fraud"] if prev["fraud"] else 0
+    curr_saving = round(curr_detect_pct / 100 * avg_fraud_loss, 2)
+    prev_saving = round(prev_detect_pct / 100 * prev_avg_fraud, 2)
+    effectiveness = round(curr["fraud_3ds"] / (curr["total_3ds"] or 1) * 100, 2)
+    prev_effectiveness = round(prev["fraud_3ds"] / (prev["total_3ds"] or 1) * 100, 2)
+
+    metrics = [
+        {'title': 'Fraud Loss',               'value': round(curr["fraud_loss"], 2), 'diff': pct_diff(curr["fraud_loss"], prev["fraud_loss"])},
+        {'title': 'Fraud Rate (%)',           'value': curr_rate,                    'diff': pct_diff(curr_rate, prev_rate)},
+        {'title': 'Fraud Detection Rate (%)', 'value': curr_detect_pct,              'diff': pct_diff(curr_detect_pct, prev_detect_pct)},
+        {'title': 'Fraud Detections (count)', 'value': int(curr["detected"]),        'diff': pct_diff(curr["detected"], prev["detected"])},
+        {'title': 'Potential Fraud Saving',   'value': curr_saving,                  'diff': pct_diff(curr_saving, prev_saving)},
+        {'title': '3DS Authentication Effectiveness (%)', 'value': effectiveness,    'diff': pct_diff(effectiveness, prev_effectiveness)},
+    ]
+
+    mask = window_mask(cube, start, end, merchant_id)
+    by_region = {name: (n, f) for name, n, f in grouped(cube, "region", mask, cube.col("fraud").astype(np.float64))}
+    x, y = [], []
+    for region in cube.meta["region_enum"]:
+        n, f = by_region.get(region, (0, 0.0))
+        x.append(region)
+        y.append(round(f / n * 100, 2) if n else 0.0)
+    charts = [{'title': 'Risk Analysis by Region', 'type': 'bar', 'x': x, 'y': y}]
+    return {'metrics': metrics, 'charts': charts}
+
+
+# ─── Gateway Fee Report ──────────────────────────────────────────
+def gateway_fee_analysis(cube: CubeSnapshot, filter_type, start, end, merchant_id=None) -> dict:
+    mask = window_mask(cube, start, end, merchant_id)
+    rows = grouped(cube, "acquirer", mask, cube.col("gateway_fee"), include_null=False)
+    rows.sort(key=lambda r: r[2], reverse=True)
+    fees = [round(fee, 2) for _, _, fee in rows]
+    charts = [{
+        'title': 'Gateway Fee Distribution',
+        'type': 'bar',
+        'x': [name for name, _, _ in rows],
+        'y': fees,
+        'series': [{'name': 'Gateway Fee (USD)', 'data': fees}],
+    }]
+
+    today = date.today()
+    hist_values = list(_per_day(cube, window_mask(cube, today - timedelta(days=7), today - timedelta(days=1), merchant_id),
+                                cube.col("gateway_fee")))
+    hist_avg = sum(hist_values) / len(hist_values) if hist_values else 0
+    y_mask = window_mask(cube, today - timedelta(days=1), today - timedelta(days=1), merchant_id)
+    yesterday_val = float(cube.col("gateway_fee")[y_mask].sum()) or 0
+    comparison_result = compare_to_historical_single_point(yesterday_val, hist_values)
+
+    metrics = [{
+        'title': 'Gateway Fee (Stat Insight)',
+        'value': round(yesterday_val, 2),
+        'insight': comparison_result['insight'],
+        'z_score': comparison_result['z_score'],
+        'p_value': comparison_result['p_value'],
+        'is_significant': bool(comparison_result['is_significant']),
+        'historical_avg': round(hist_avg, 2),
+    }]
+    return {'metrics': metrics, 'charts': charts}
+
+
+
+# ─── Merchant Portfolio ──────────────────────────────────────────
+def portfolio_components(cube: CubeSnapshot, start, end, comp_start, comp_end) -> list[dict]:
+    """Same rows as KPI.portfolio.SQL_PORTFOLIO: per merchant and window, the additive components."""
+    merchants = cube.col("merchant_id")
+    usd, fee, fraud = cube.col("usd_value"), cube.col("gateway_fee"), cube.col("fraud")
+    rows = []
+    for period, mask in (("current", window_mask(cube, start, end)),
+                         ("comparison", window_mask(cube, comp_start, comp_end))):
+        ids, codes = np.unique(merchants[mask], return_inverse=True)
+        n = len(ids)
+        columns = {
+            "volume":       np.bincount(codes, weights=usd[mask], minlength=n),
+            "txns":         np.bincount(codes, minlength=n).astype(float),
+            "success":      np.bincount(codes, weights=cube.col("payment_successful")[mask], minlength=n),
+            "fraud":        np.bincount(codes, weights=fraud[mask], minlength=n),
+            "fraud_loss":   np.bincount(codes, weights=np.where(fraud[mask], usd[mask], 0.0), minlength=n),
+            "gateway_fees": np.bincount(codes, weights=fee[mask], minlength=n),
+        }
+        for i, m_id in enumerate(ids.tolist()):
+            rows.append({"merchant_id": m_id, "period": period, **{k: float(v[i]) for k, v in columns.items()}})
+    return rows
+
+
+# ─── Customer Insights ───────────────────────────────────────────
+def customer_insights(cube: CubeSnapshot, merchant_id: int, start, end, comp_start, comp_end) -> dict:
+    cards = cube.col("credit_card_type")
+    curr_methods = distinct_count(cards, window_mask(cube, start, end, merchant_id), skip_null=True)
+    prev_methods = distinct_count(cards, window_mask(cube, comp_start, comp_end, merchant_id), skip_null=True)
+    metrics = [{'title': 'Unique Payment Methods', 'value': int(curr_methods), 'diff': pct_diff(curr_methods, prev_methods)}]
+
+    today = date.today()
+    hist_mask = window_mask(cube, today - timedelta(days=180), today - timedelta(days=1), merchant_id)
+    hist_values = []
+    if hist_mask.any():
+        days = cube.col("day")[hist_mask]
+        codes = cards[hist_mask]
+        known = codes > 0
+        # distinct (day, card type) pairs packed into one int64, then counted per day
+        pairs = np.unique((days[known].astype(np.int64) << 32) | codes[known])
+        present_days, per_day = np.unique(pairs >> 32, return_counts=True)
+        all_days = np.unique(days)
+        lookup = dict(zip(present_days.tolist(), per_day.tolist()))
+        hist_values = [float(lookup.get(int(d), 0)) for d in all_days]
+    yesterday_val = float(distinct_count(cards, window_mask(cube, today - timedelta(days=1), today - timedelta(days=1), merchant_id)))
+    comparison_result = compare_to_historical_single_point(yesterday_val, hist_values)
+    metrics.append({
+        'title': 'Unique Payment Methods (Stat Insight)',
+        'value': int(yesterday_val),
+        'diff': None,
+        'insight': comparison_result['insight'],
+        'z_score': comparison_result['z_score'],
+        'p_value': comparison_result['p_value'],
+        'is_significant': comparison_result['is_significant'],
+    })
+
+    mask = window_mask(cube, start, end, merchant_id)
+    acquirers = sorted(grouped(cube, "acquirer", mask, include_null=False), key=lambda r: r[1], reverse=True)
+    txn_types = sorted(grouped(cube, "transaction_type", mask), key=lambda r: r[1], reverse=True)
+    creations = sorted(grouped(cube, "creation_type", mask), key=lambda r: r[1], reverse=True)
+    charts = [
+        {'title': 'Transactions by Acquirer',      'type': 'pie', 'data': [{'name': n, 'value': c} for n, c in acquirers]},
+        {'title': 'Transaction Type Distribution', 'type': 'bar', 'x': [n for n, _ in txn_types], 'y': [c for _, c in txn_types]},
+        {'title': 'Payment Creation Patterns',     'type': 'bar', 'x': [n for n, _ in creations], 'y': [c for _, c in creations]},
+    ]
+    return {'metrics': metrics, 'charts': charts}
+
+
+def customer_history_start(today: date = None) -> date:
+    """Oldest day the customer-insights stat test reads (180-day history)."""
+    return (today or date.today()) - timedelta(days=180)
+
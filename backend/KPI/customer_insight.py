@@ -1,19 +1,24 @@
-from datetime import date
+from datetime import date, timedelta
 from typing import Optional, Tuple
 from sqlalchemy import text
-from DB.connector import get_engine
-from KPI.utils.time_utils import get_date_ranges, fetch_one, pct_diff
+from DB.connector import lazy_engine
+from KPI.utils.time_utils import get_date_ranges, pct_diff
 from KPI.utils.stat_tests import compare_to_historical_single_point
+from KPI.utils.columnar_cube import get_cube
+from KPI.utils.dimensions import get_dimensions, label_rows
+from KPI import cube_pages
+from DB.daily_sketches import window_distinct, daily_distinct
 
-engine = get_engine()
-MERCHANT_ID = 26  # Adjust as needed
+engine = lazy_engine()
+MERCHANT_ID = 26  # default merchant when the request names none
 
 def get_customer_insights_data(
     filter_type: str = 'YTD',
-    custom: Optional[Tuple[date, date]] = None
+    custom: Optional[Tuple[date, date]] = None,
+    merchant_id: int = MERCHANT_ID
 ) -> dict:
     """
-    Returns customer-insights metrics and charts based on the selected date range filter.
+    Returns customer-insights metrics and charts for one merchant based on the selected date range filter.
 
     Metrics:
       - Unique Payment Methods (with % diff vs comparison period)
@@ -27,23 +32,18 @@ def get_customer_insights_data(
     # Determine current vs comparison windows
     start, end, comp_start, comp_end = get_date_ranges(filter_type, custom)
 
+    cube = get_cube()
+    if cube and cube.covers(comp_start, end, history_from=cube_pages.customer_history_start()):
+        return cube_pages.customer_insights(cube.snapshot(), merchant_id, start, end, comp_start, comp_end)
+
+
     metrics = []
     charts  = []
 
     with engine.connect() as conn:
         # ─── Metric: Unique Payment Methods ──────────────────────────────
-        sql_methods = """
-            SELECT COUNT(DISTINCT credit_card_type)::float
-              FROM live_transactions
-             WHERE merchant_id = :m_id
-               AND created_at::date BETWEEN :s AND :e
-        """
-        curr_methods = fetch_one(conn, sql_methods, {
-            'm_id': MERCHANT_ID, 's': start, 'e': end
-        })
-        prev_methods = fetch_one(conn, sql_methods, {
-            'm_id': MERCHANT_ID, 's': comp_start, 'e': comp_end
-        })
+        curr_methods = window_distinct(conn, 'credit_card_type', start, end, merchant_id)
+        prev_methods = window_distinct(conn, 'credit_card_type', comp_start, comp_end, merchant_id)
         metrics.append({
             'title': 'Unique Payment Methods',
             'value': int(curr_methods),
@@ -51,24 +51,9 @@ def get_customer_insights_data(
         })
 
         # ─── Metric: Statistical Insight for Yesterday ───────────────────
-        sql_hist_methods = """
-            SELECT created_at::date AS day, COUNT(DISTINCT credit_card_type)::float AS count
-              FROM live_transactions
-             WHERE merchant_id = :m_id
-               AND created_at::date BETWEEN CURRENT_DATE - INTERVAL '180 days' AND CURRENT_DATE - INTERVAL '1 day'
-             GROUP BY created_at::date
-             ORDER BY day
-        """
-        hist_rows = conn.execute(text(sql_hist_methods), {'m_id': MERCHANT_ID}).mappings().all()
-        hist_values = [row['count'] for row in hist_rows]
-
-        sql_yesterday = """
-            SELECT COUNT(DISTINCT credit_card_type)::float AS count
-              FROM live_transactions
-             WHERE merchant_id = :m_id
-               AND created_at::date = CURRENT_DATE - INTERVAL '1 day'
-        """
-        yesterday_val = fetch_one(conn, sql_yesterday, {'m_id': MERCHANT_ID})
+        yesterday = date.today() - timedelta(days=1)
+        hist_values = daily_distinct(conn, 'credit_card_type', yesterday - timedelta(days=179), yesterday, merchant_id)
+        yesterday_val = float(window_distinct(conn, 'credit_card_type', yesterday, yesterday, merchant_id))
 
         comparison_result = compare_to_historical_single_point(yesterday_val, hist_values)
 
@@ -84,14 +69,14 @@ def get_customer_insights_data(
 
         # ─── Chart 1: Transactions by Acquirer ───────────────────────────
         acquirer_rows = conn.execute(text("""
-            SELECT a.name AS name, COUNT(*) AS value
+            SELECT lt.acquirer_id, COUNT(*) AS value
               FROM live_transactions lt
-              JOIN acquirer a ON lt.acquirer_id = a.id
              WHERE lt.merchant_id = :m_id
                AND lt.created_at::date BETWEEN :s AND :e
-             GROUP BY a.name
-             ORDER BY value DESC
-        """), {'m_id': MERCHANT_ID, 's': start, 'e': end}).mappings().all()
+             GROUP BY lt.acquirer_id
+        """), {'m_id': merchant_id, 's': start, 'e': end}).mappings().all()
+        acquirer_rows = label_rows(acquirer_rows, 'acquirer_id', get_dimensions().acquirer_names(conn), 'name')
+        acquirer_rows.sort(key=lambda r: r['value'], reverse=True)
 
         charts.append({
             'title': 'Transactions by Acquirer',
@@ -107,7 +92,7 @@ def get_customer_insights_data(
                AND created_at::date BETWEEN :s AND :e
              GROUP BY transaction_type
              ORDER BY txn_count DESC
-        """), {'m_id': MERCHANT_ID, 's': start, 'e': end}).mappings().all()
+        """), {'m_id': merchant_id, 's': start, 'e': end}).mappings().all()
 
         charts.append({
             'title': 'Transaction Type Distribution',
@@ -124,7 +109,7 @@ def get_customer_insights_data(
                AND created_at::date BETWEEN :s AND :e
              GROUP BY creation_type
              ORDER BY txn_count DESC
-        """), {'m_id': MERCHANT_ID, 's': start, 'e': end}).mappings().all()
+        """), {'m_id': merchant_id, 's': start, 'e': end}).mappings().all()
 
         charts.append({
             'title': 'Payment Creation Patterns',
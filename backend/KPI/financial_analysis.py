@@ -1,41 +1,73 @@
 from datetime import date
-from sqlalchemy import text
-from DB.connector import get_engine
-from KPI.utils.time_utils import get_date_ranges, pct_diff, fetch_one
+from DB.connector import lazy_engine
+from KPI.utils.time_utils import get_date_ranges, pct_diff
+from KPI.utils.query_backend import fetch_additive_many, first_row
+from KPI.utils.dimensions import get_dimensions, label_rows
 from typing import Optional, Tuple
+from KPI.utils.columnar_cube import get_cube
+from KPI import cube_pages
+from DB.daily_sketches import window_quantiles
 
-engine = get_engine()
+engine = lazy_engine()
+
+TICKET_QUANTILES = (0.5, 0.95, 0.99)
+TICKET_TITLES = ('Median Ticket Size', 'P95 Ticket Size', 'P99 Ticket Size')
 
 def get_financial_performance_data(filter_type: str = 'YTD',
-                                   custom: Optional[Tuple[date, date]] = None) -> dict:
+                                   custom: Optional[Tuple[date, date]] = None,
+                                   merchant_id: Optional[int] = None) -> dict:
     """
-    Returns financial KPI metrics and chart data (live_transactions) based on the selected date range filter.
+    Returns financial KPI metrics and chart data (live_transactions) based on the selected date range filter,
+    for one merchant or (merchant_id=None) all of them.
     """
     start, end, comp_start, comp_end = get_date_ranges(filter_type, custom)
-    print(f"Financial Performance Data: {start} to {end}, Comparison: {comp_start} to {comp_end}")
+
+    cube = get_cube()
+    if cube and cube.covers(comp_start, end):
+        return cube_pages.financial_performance(cube.snapshot(), filter_type, start, end, comp_start, comp_end, merchant_id)
+
     metrics, charts = [], []
 
     with engine.connect() as conn:
-        # ─── Common SQL Templates ─────────────────────────────────────────────────
-        sql_sum   = """
-            SELECT COALESCE(SUM(usd_value), 0)
+        # ─── Window Totals (additive components) ─────────────────────────────────
+        sql_totals = """
+            SELECT COALESCE(SUM(usd_value), 0) AS volume,
+                   COUNT(*)::float             AS txns
               FROM live_transactions t
              WHERE t.created_at::date BETWEEN :s AND :e
+               AND (CAST(:m_id AS INTEGER) IS NULL OR t.merchant_id = :m_id)
         """
-        sql_count = """
-            SELECT COUNT(*)::float
+        sql_currency = """
+            SELECT t.transaction_currency AS name,
+                   SUM(t.usd_value)            AS total_usd
               FROM live_transactions t
              WHERE t.created_at::date BETWEEN :s AND :e
+               AND (CAST(:m_id AS INTEGER) IS NULL OR t.merchant_id = :m_id)
+             GROUP BY t.transaction_currency
         """
-        sql_avg   = """
-            SELECT COALESCE(AVG(usd_value), 0)
+        sql_fees = """
+            SELECT t.acquirer_id,
+                   SUM((t.pricing_ic/100.0)*t.usd_value + t.gateway_fee) AS total_fees,
+                   SUM(t.usd_value)            AS total_amt
               FROM live_transactions t
              WHERE t.created_at::date BETWEEN :s AND :e
+               AND (CAST(:m_id AS INTEGER) IS NULL OR t.merchant_id = :m_id)
+             GROUP BY t.acquirer_id
         """
+        # the four additive queries are independent, so they go out together
+        params = {'s': start, 'e': end, 'm_id': merchant_id}
+        curr, prev, currencies, fees = fetch_additive_many(conn, [
+            (sql_totals,   params, ()),
+            (sql_totals,   {**params, 's': comp_start, 'e': comp_end}, ()),
+            (sql_currency, params, ('name',)),
+            (sql_fees,     params, ('acquirer_id',)),
+        ])
+        curr, prev = first_row(curr), first_row(prev)
+        fees = label_rows(fees, 'acquirer_id', get_dimensions().acquirer_names(conn), 'acquirer')
 
         # ─── Total Transaction Volume ────────────────────────────────────────────
-        curr_vol = fetch_one(conn, sql_sum,   {'s': start,      'e': end})
-        prev_vol = fetch_one(conn, sql_sum,   {'s': comp_start, 'e': comp_end})
+        curr_vol = curr['volume']
+        prev_vol = prev['volume']
         if filter_type == 'Daily':   prev_vol /= 7
         if filter_type == 'Weekly':  prev_vol /= 4
         metrics.append({
@@ -45,8 +77,8 @@ def get_financial_performance_data(filter_type: str = 'YTD',
         })
 
         # ─── Total Transactions ────────────────────────────────────────────────
-        curr_cnt = fetch_one(conn, sql_count, {'s': start,      'e': end})
-        prev_cnt = fetch_one(conn, sql_count, {'s': comp_start, 'e': comp_end})
+        curr_cnt = curr['txns']
+        prev_cnt = prev['txns']
         if filter_type == 'Daily':   prev_cnt /= 7
         if filter_type == 'Weekly':  prev_cnt /= 4
         metrics.append({
@@ -56,20 +88,10 @@ def get_financial_performance_data(filter_type: str = 'YTD',
         })
 
         # ─── Average Transaction Value ────────────────────────────────────────
-        if filter_type == 'Daily':
-            # yesterday’s AVG
-            curr_avg = fetch_one(conn,
-                """
-                SELECT COALESCE(AVG(usd_value), 0)
-                  FROM live_transactions t
-                 WHERE t.created_at::date = :d
-                """,
-                {'d': start}
-            )
-            prev_avg = fetch_one(conn, sql_avg, {'s': comp_start, 'e': comp_end})
-        else:
-            curr_avg = fetch_one(conn, sql_avg, {'s': start, 'e': end})
-            prev_avg = fetch_one(conn, sql_avg, {'s': comp_start, 'e': comp_end})
+        # Derived from the un-normalised window totals, so the average stays
+        # mergeable across backends instead of averaging averages.
+        curr_avg = curr['volume'] / curr['txns'] if curr['txns'] else 0.0
+        prev_avg = prev['volume'] / prev['txns'] if prev['txns'] else 0.0
 
         metrics.append({
             'title': 'Average Transaction Value',
@@ -77,14 +99,19 @@ def get_financial_performance_data(filter_type: str = 'YTD',
             'diff':  pct_diff(curr_avg, prev_avg)
         })
 
+        # ─── Ticket Size Percentiles ─────────────────────────────────────────
+        # Merged from the daily t-digests; exact only outside sketched days.
+        curr_q = window_quantiles(conn, start, end, TICKET_QUANTILES, merchant_id)
+        prev_q = window_quantiles(conn, comp_start, comp_end, TICKET_QUANTILES, merchant_id)
+        for title, c, p in zip(TICKET_TITLES, curr_q, prev_q):
+            metrics.append({
+                'title': title,
+                'value': round(c, 2),
+                'diff':  pct_diff(c, p)
+            })
+
         # ─── Sales by Currency (Pie) ───────────────────────────────────────────
-        rows = conn.execute(text("""
-            SELECT t.transaction_currency AS name,
-                   SUM(t.usd_value)            AS total_usd
-              FROM live_transactions t
-             WHERE t.created_at::date BETWEEN :s AND :e
-             GROUP BY t.transaction_currency
-        """), {'s': start, 'e': end}).mappings().all()
+        rows = currencies
 
         total_usd = sum(r['total_usd'] for r in rows) or 1
         charts.append({
@@ -100,18 +127,9 @@ def get_financial_performance_data(filter_type: str = 'YTD',
         })
 
         # ─── Processing Fee Analysis (Horizontal Bar) ─────────────────────────
-        rows = conn.execute(text("""
-            SELECT a.name                      AS acquirer,
-                   SUM((t.pricing_ic/100.0)*t.usd_value + t.gateway_fee) AS total_fees,
-                   SUM(t.usd_value)            AS total_amt
-              FROM live_transactions t
-              JOIN acquirer a
-                ON t.acquirer_id = a.id
-             WHERE t.created_at::date BETWEEN :s AND :e
-             GROUP BY a.name
-             ORDER BY (SUM((t.pricing_ic/100.0)*t.usd_value + t.gateway_fee)
-                       / NULLIF(SUM(t.usd_value),0)) ASC
-        """), {'s': start, 'e': end}).mappings().all()
+        rows = fees
+        # cheapest acquirer first; acquirers without volume last
+        rows.sort(key=lambda r: (not r['total_amt'], r['total_fees'] / r['total_amt'] if r['total_amt'] else 0))
 
         charts.append({
             'title': 'Processing Fee Analysis',
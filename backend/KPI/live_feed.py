@@ -0,0 +1,246 @@
+# backend/KPI/live_feed.py
+"""
+Live push for the dashboard and risk pages.
+
+Each distinct (page, filter) that has at least one subscriber owns one
+aggregate: the page's additive components, loaded once from a consistent
+snapshot and then kept current by a single tailer that reads new
+live_transactions rows past an id watermark. After each poll only the
+aggregates that actually received rows are re-derived, and subscribers get
+just the metrics/charts whose values changed, so N viewers of the same page
+cost one incremental update instead of N full queries.
+"""
+
+import asyncio
+from datetime import date, datetime
+from typing import Optional, Tuple
+
+from sqlalchemy import text
+from starlette.concurrency import run_in_threadpool
+
+from config import LIVE_BATCH_ROWS, LIVE_POLL_SECONDS
+from DB.connector import lazy_engine
+from KPI.KPI_Dashboard import add_dashboard_row, build_dashboard_payload, dashboard_components
+from KPI.risk_and_fraud_management import (add_risk_row, build_risk_payload, region_labels,
+                                           risk_regions, risk_totals)
+from KPI.utils.dimensions import get_dimensions
+from KPI.utils.query_backend import direct_backend, use_backend
+from KPI.utils.time_utils import get_date_ranges
+
+engine = lazy_engine()
+
+TAIL_SQL = """
+    SELECT t.id, t.created_at, t.usd_value, t.transaction_currency, t.credit_card_type,
+           t.fraud, t.pred_fraud, t.sca_type, t.region::text AS region, t.acquirer_id
+      FROM live_transactions t
+     WHERE t.id > :wm
+     ORDER BY t.id
+     LIMIT :n
+"""
+
+
+def _as_date(value) -> date:
+    return value.date() if isinstance(value, datetime) else value
+
+
+# ─── Aggregates ──────────────────────────────────────────────────
+class DashboardAggregate:
+    """All-time dashboard components; every new row applies."""
+
+    def __init__(self, filter_type: Optional[str] = None, custom=None):
+        self.components = None
+        self.watermark = 0
+
+    def stale(self) -> bool:
+        return False
+
+    def load(self, conn):
+        self.components = dashboard_components(conn)
+
+    def add(self, row) -> bool:
+        add_dashboard_row(self.components, row)
+        return True
+
+    def payload(self) -> dict:
+        return build_dashboard_payload(self.components)
+
+
+class RiskAggregate:
+    """Risk page components for one filter's current and comparison windows."""
+
+    def __init__(self, filter_type: str, custom: Optional[Tuple[date, date]] = None):
+        self.filter_type = filter_type
+        self.custom = custom
+        self.windows = None
+        self.watermark = 0
+
+    def stale(self) -> bool:
+        # relative filters move at midnight; the aggregate is then rebuilt
+        return get_date_ranges(self.filter_type, self.custom) != self.windows
+
+    def load(self, conn):
+        self.windows = get_date_ranges(self.filter_type, self.custom)
+        start, end, comp_start, comp_end = self.windows
+        self.curr = risk_totals(conn, start, end)
+        self.prev = risk_totals(conn, comp_start, comp_end)
+        self.regions = risk_regions(conn, start, end)
+        self.labels = region_labels(conn)
+
+    def add(self, row) -> bool:
+        start, end, comp_start, comp_end = (_as_date(w) for w in self.windows)
+        day = row["created_at"].date()
+        changed = False
+        if start <= day <= end:
+            add_risk_row(self.curr, self.regions, row)
+            changed = True
+        if comp_start <= day <= comp_end:
+            add_risk_row(self.prev, {}, row)
+            changed = True
+        return changed
+
+    def payload(self) -> dict:
+        return build_risk_payload(self.curr, self.prev, self.regions, self.labels)
+
+
+PAGES = {
+    "dashboard":      DashboardAggregate,
+    "risk-and-fraud": RiskAggregate,
+}
+
+
+def payload_delta(old: dict, new: dict) -> dict:
+    """Metrics and charts of `new` that differ from `old`, matched by title."""
+    old_metrics = {m["title"]: m for m in old["metrics"]}
+    old_charts = {c["title"]: c for c in old["charts"]}
+    return {
+        "metrics": [m for m in new["metrics"] if old_metrics.get(m["title"]) != m],
+        "charts":  [c for c in new["charts"] if old_charts.get(c["title"]) != c],
+    }
+
+
+# ─── Hub ─────────────────────────────────────────────────────────
+class LiveHub:
+    """
+    Owns the aggregates and subscriber queues and runs the tailer. All state
+    is touched only from the event loop; database work goes to the threadpool.
+    """
+
+    def __init__(self, engine=engine):
+        self.engine = engine
+        self.aggregates: dict = {}
+        self.payloads: dict = {}
+        self.subscribers: dict = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def _load(self, agg):
+        # components and watermark from one snapshot, so no row is counted twice or missed;
+        # shards would read on their own connections, outside that snapshot
+        with self.engine.connect().execution_options(isolation_level="REPEATABLE READ") as conn:
+            with conn.begin(), use_backend(direct_backend()):
+                agg.load(conn)
+                agg.watermark = conn.execute(text("SELECT COALESCE(MAX(id), 0) FROM live_transactions")).scalar()
+
+    def _fetch(self, watermark: int) -> list:
+        with self.engine.connect() as conn:
+            rows = conn.execute(text(TAIL_SQL), {"wm": watermark, "n": LIVE_BATCH_ROWS}).mappings().all()
+            names = get_dimensions().acquirer_names(conn)
+        return [{**r, "acquirer": names.get(r["acquirer_id"])} for r in rows]
+
+    def _message(self, key, kind: str, **body) -> dict:
+        page, filter_type, custom = key
+        return {
+            "type": kind,
+            "page": page,
+            "filter_type": filter_type,
+            "custom": [d.isoformat() for d in custom] if custom else None,
+            "watermark": self.aggregates[key].watermark,
+            **body,
+        }
+
+    def _offer(self, key, queue: asyncio.Queue, message: dict):
+        try:
+            queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # a slow client skips ahead to a full snapshot instead of a backlog of deltas
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait(self._message(key, "snapshot", payload=self.payloads[key]))
+
+    def _publish(self, key, message: dict):
+        for queue in self.subscribers.get(key, ()):
+            self._offer(key, queue, message)
+
+    async def subscribe(self, queue: asyncio.Queue, page: str, filter_type: str = "YTD",
+                        custom: Optional[Tuple[date, date]] = None):
+        """Registers `queue` for a page/filter and sends it the current snapshot; returns the key."""
+        if page not in PAGES:
+            raise ValueError(f"Unsupported live page: {page}")
+        key = (page, filter_type if page != "dashboard" else None, custom if page != "dashboard" else None)
+
+        if key not in self.aggregates:
+            agg = PAGES[page](filter_type, custom)
+            await run_in_threadpool(self._load, agg)
+            if key not in self.aggregates:  # another subscriber may have loaded it meanwhile
+                self.aggregates[key] = agg
+                self.payloads[key] = agg.payload()
+
+        self.subscribers.setdefault(key, set()).add(queue)
+        self._offer(key, queue, self._message(key, "snapshot", payload=self.payloads[key]))
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        return key
+
+    def unsubscribe(self, queue: asyncio.Queue, key):
+        queues = self.subscribers.get(key)
+        if queues is None:
+            return
+        queues.discard(queue)
+        if not queues:
+            del self.subscribers[key]
+            self.aggregates.pop(key, None)
+            self.payloads.pop(key, None)
+
+    async def _run(self):
+        while self.subscribers:
+            await asyncio.sleep(LIVE_POLL_SECONDS)
+            try:
+                await self.tick()
+            except Exception as e:
+                print(f"Live feed tick failed: {e}")
+
+    async def tick(self):
+        """One poll: rebuild aggregates whose windows moved, then apply new rows."""
+        for key, agg in list(self.aggregates.items()):
+            if agg.stale():
+                await run_in_threadpool(self._load, agg)
+                self.payloads[key] = agg.payload()
+                self._publish(key, self._message(key, "snapshot", payload=self.payloads[key]))
+
+        while self.aggregates:
+            aggs = list(self.aggregates.items())
+            rows = await run_in_threadpool(self._fetch, min(agg.watermark for _, agg in aggs))
+            if not rows:
+                return
+
+            changed = set()
+            for row in rows:
+                for key, agg in aggs:
+                    if row["id"] > agg.watermark and agg.add(row):
+                        changed.add(key)
+            for _, agg in aggs:
+                agg.watermark = max(agg.watermark, rows[-1]["id"])
+
+            for key in changed:
+                if key not in self.aggregates:  # unsubscribed while rows were being fetched
+                    continue
+                payload = self.aggregates[key].payload()
+                delta = payload_delta(self.payloads[key], payload)
+                self.payloads[key] = payload
+                if delta["metrics"] or delta["charts"]:
+                    self._publish(key, self._message(key, "delta", **delta))
+
+            if len(rows) < LIVE_BATCH_ROWS:
+                return
+
+
+hub = LiveHub()
@@ -0,0 +1,139 @@
+from datetime import date, datetime
+from typing import Optional, Tuple
+from DB.connector import lazy_engine
+from KPI.utils.time_utils import get_date_ranges, pct_diff
+from KPI.utils.query_backend import fetch_additive
+from KPI.utils.columnar_cube import get_cube
+from KPI.utils.dimensions import get_dimensions
+from KPI import cube_pages
+
+engine = lazy_engine()
+
+# ─── Additive Components ─────────────────────────────────────────
+# One pass over the span covering both windows, grouped by merchant and by
+# which window the row falls in. :s/:e is the whole span so the hybrid
+# backend can still split it at the export watermark; the CASE label keeps
+# the current and comparison sums apart.
+SQL_PORTFOLIO = """
+    SELECT t.merchant_id,
+           CASE WHEN t.created_at::date BETWEEN :cur_s AND :cur_e THEN 'current' ELSE 'comparison' END AS period,
+           COALESCE(SUM(t.usd_value), 0)                                   AS volume,
+           COUNT(*)::float                                                 AS txns,
+           COUNT(*) FILTER (WHERE t.payment_successful = true)::float      AS success,
+           COUNT(*) FILTER (WHERE t.fraud = true)::float                   AS fraud,
+           COALESCE(SUM(t.usd_value) FILTER (WHERE t.fraud = true), 0)     AS fraud_loss,
+           COALESCE(SUM(t.gateway_fee), 0)                                 AS gateway_fees
+      FROM live_transactions t
+     WHERE t.created_at::date BETWEEN :s AND :e
+       AND (t.created_at::date BETWEEN :cur_s AND :cur_e
+            OR t.created_at::date BETWEEN :cmp_s AND :cmp_e)
+     GROUP BY t.merchant_id, period
+"""
+
+COMPONENTS = ('volume', 'txns', 'success', 'fraud', 'fraud_loss', 'gateway_fees')
+
+# per-merchant table columns (key → title); any key can be the ranking
+RANK_COLUMNS = {
+    'volume':       'Total Transaction Volume',
+    'txns':         'Total Transactions',
+    'avg_value':    'Average Transaction Value',
+    'success_rate': 'Success Rate (%)',
+    'fraud_rate':   'Fraud Rate (%)',
+    'fraud_loss':   'Fraud Loss',
+    'gateway_fees': 'Gateway Fees',
+}
+
+
+def _as_date(value) -> date:
+    return value.date() if isinstance(value, datetime) else value
+
+
+def portfolio_components(conn, start, end, comp_start, comp_end) -> list[dict]:
+    """(merchant_id, period, *COMPONENTS) rows for every merchant with activity in either window."""
+    start, end, comp_start, comp_end = (_as_date(d) for d in (start, end, comp_start, comp_end))
+    return fetch_additive(conn, SQL_PORTFOLIO, {
+        's': min(start, comp_start), 'e': max(end, comp_end),
+        'cur_s': start, 'cur_e': end, 'cmp_s': comp_start, 'cmp_e': comp_end,
+    }, keys=('merchant_id', 'period'))
+
+
+def merchant_names(conn) -> dict:
+    return get_dimensions().merchant_names(conn)
+
+
+def _derive(c: dict, normalise: float = 1.0) -> dict:
+    """Per-merchant KPIs from one window's components. The window totals (volume, count, fraud
+    loss, fees) are divided by `normalise`, so a longer comparison window is compared per
+    period; the ratios are left as they are."""
+    txns = c['txns']
+    return {
+        'volume':       c['volume'] / normalise,
+        'txns':         txns / normalise,
+        'avg_value':    c['volume'] / txns if txns else 0.0,
+        'success_rate': c['success'] / txns * 100 if txns else 0.0,
+        'fraud_rate':   c['fraud'] / txns * 100 if txns else 0.0,
+        'fraud_loss':   c['fraud_loss'] / normalise,
+        'gateway_fees': c['gateway_fees'] / normalise,
+    }
+
+
+def build_portfolio_payload(rows: list, names: dict, filter_type: str,
+                            rank_by: str = 'volume', limit: Optional[int] = None) -> dict:
+    """Ranks merchants by `rank_by` (current window, descending) into one table chart."""
+    empty = dict.fromkeys(COMPONENTS, 0.0)
+    windows: dict = {}
+    for r in rows:
+        windows.setdefault(r['merchant_id'], {})[r['period']] = r
+
+    normalise = {'Daily': 7, 'Weekly': 4}.get(filter_type, 1)
+    table = []
+    for m_id, w in windows.items():
+        curr = _derive(w.get('current', empty))
+        prev = _derive(w.get('comparison', empty), normalise)
+        row = {'merchant_id': m_id, 'merchant': names.get(m_id, str(m_id))}
+        for col in RANK_COLUMNS:
+            row[col] = round(curr[col], 2)
+            row[f'{col}_diff'] = pct_diff(curr[col], prev[col])
+        table.append(row)
+
+    table.sort(key=lambda r: (-r[rank_by], r['merchant_id']))
+    for rank, row in enumerate(table, 1):
+        row['rank'] = rank
+    active = sum(1 for r in table if r['txns'])
+
+    return {
+        'metrics': [{'title': 'Active Merchants', 'value': active}],
+        'charts': [{
+            'title':   'Merchant Portfolio',
+            'type':    'table',
+            'rank_by': rank_by,
+            'columns': [{'key': 'rank', 'title': 'Rank'}, {'key': 'merchant', 'title': 'Merchant'}]
+                       + [{'key': k, 'title': t, 'diff_key': f'{k}_diff'} for k, t in RANK_COLUMNS.items()],
+            'rows':    table[:limit] if limit else table,
+        }],
+    }
+
+
+def get_portfolio_data(filter_type: str = 'YTD',
+                       custom: Optional[Tuple[date, date]] = None,
+                       rank_by: str = 'volume',
+                       limit: Optional[int] = None) -> dict:
+    """
+    Returns the merchant portfolio: every merchant's headline KPIs (volume,
+    transactions, average value, success and fraud rate, fraud loss, gateway
+    fees) with % diff vs the comparison window, ranked by `rank_by`, computed
+    in a single grouped pass instead of one page query per merchant.
+    """
+    if rank_by not in RANK_COLUMNS:
+        raise ValueError(f"Unsupported rank_by: {rank_by}")
+    start, end, comp_start, comp_end = get_date_ranges(filter_type, custom)
+
+    with engine.connect() as conn:
+        cube = get_cube()
+        if cube and cube.covers(comp_start, end):
+            rows = cube_pages.portfolio_components(cube.snapshot(), start, end, comp_start, comp_end)
+        else:
+            rows = portfolio_components(conn, start, end, comp_start, comp_end)
+        names = merchant_names(conn)
+
+    return build_portfolio_payload(rows, names, filter_type, rank_by, limit)
@@ -1,37 +1,48 @@
-from datetime import date
+from datetime import date, timedelta
 from typing import Optional, Tuple
 from sqlalchemy import text
-from DB.connector import get_engine
+from DB.connector import lazy_engine
 from KPI.utils.time_utils import get_date_ranges
+from KPI.utils.query_backend import fetch_additive, once_per_request
+from KPI.utils.dimensions import get_dimensions, label_rows
 from KPI.utils.stat_tests import compare_to_historical_single_point
+from KPI.utils.columnar_cube import get_cube
+from KPI import cube_pages
 
-engine = get_engine()
+engine = lazy_engine()
 
 def get_gateway_fee_analysis(filter_type: str = 'YTD',
-                             custom: Optional[Tuple[date, date]] = None) -> dict:
+                             custom: Optional[Tuple[date, date]] = None,
+                             merchant_id: Optional[int] = None) -> dict:
     """
     Returns a bar chart showing gateway fee distribution by acquirer
     from live_transactions within the selected time range, along with
     statistical insight comparing yesterday's total fee to historical trend.
+    merchant_id=None covers all merchants.
     """
     start, end, _, _ = get_date_ranges(filter_type, custom)
-    print(f"Gateway Fee Analysis: {start} to {end}")
+
+    # the stat insight reads the last 7 closed days, so those must be cached too
+    cube = get_cube()
+    if cube and cube.covers(start, end, history_from=date.today() - timedelta(days=7)):
+        return cube_pages.gateway_fee_analysis(cube.snapshot(), filter_type, start, end, merchant_id)
 
     charts = []
     metrics = []
 
     with engine.connect() as conn:
         # ─── Chart: Gateway Fee Distribution by Acquirer ────────────────
-        rows = conn.execute(text("""
-            SELECT a.name AS acquirer,
+        rows = fetch_additive(conn, """
+            SELECT t.acquirer_id,
                    SUM(t.gateway_fee) AS total_gateway_fee,
                    COUNT(*) AS txn_count
               FROM live_transactions t
-              JOIN acquirer a ON t.acquirer_id = a.id
              WHERE t.created_at::date BETWEEN :s AND :e
-             GROUP BY a.name
-             ORDER BY total_gateway_fee DESC
-        """), {'s': start, 'e': end}).mappings().all()
+               AND (CAST(:m_id AS INTEGER) IS NULL OR t.merchant_id = :m_id)
+             GROUP BY t.acquirer_id
+        """, {'s': start, 'e': end, 'm_id': merchant_id}, keys=('acquirer_id',))
+        rows = label_rows(rows, 'acquirer_id', get_dimensions().acquirer_names(conn), 'acquirer')
+        rows.sort(key=lambda r: r['total_gateway_fee'], reverse=True)
 
         chart_data = {
             'title': 'Gateway Fee Distribution',
@@ -46,23 +57,9 @@ def get_gateway_fee_analysis(filter_type: str = 'YTD',
         charts.append(chart_data)
 
         # ─── Metric: Gateway Fee Statistical Insight ────────────────────
-        hist_rows = conn.execute(text("""
-            SELECT created_at::date AS day,
-                   SUM(gateway_fee)::float AS total_fee
-              FROM live_transactions
-             WHERE created_at::date BETWEEN CURRENT_DATE - INTERVAL '7 days' AND CURRENT_DATE - INTERVAL '1 day'
-             GROUP BY created_at::date
-             ORDER BY day
-        """)).mappings().all()
-        hist_values = [r['total_fee'] for r in hist_rows]
+        hist_values, yesterday_val = gateway_fee_history(conn, merchant_id)
         hist_avg = sum(hist_values) / len(hist_values) if hist_values else 0
 
-        yesterday_val = conn.execute(text("""
-            SELECT SUM(gateway_fee)::float AS total_fee
-              FROM live_transactions
-             WHERE created_at::date = CURRENT_DATE - INTERVAL '1 day'
-        """)).scalar() or 0
-
         comparison_result = compare_to_historical_single_point(yesterday_val, hist_values)
 
         metrics.append({
@@ -80,4 +77,25 @@ def get_gateway_fee_analysis(filter_type: str = 'YTD',
     return {
         'metrics': metrics,
         'charts': charts
-    }
\ No newline at end of file
+    }
+
+
+@once_per_request
+def gateway_fee_history(conn, merchant_id: Optional[int] = None) -> Tuple[list, float]:
+    """Daily gateway fees of the last 7 closed days, and yesterday's total."""
+    hist_rows = conn.execute(text("""
+        SELECT created_at::date AS day,
+               SUM(gateway_fee)::float AS total_fee
+          FROM live_transactions
+         WHERE created_at::date BETWEEN CURRENT_DATE - INTERVAL '7 days' AND CURRENT_DATE - INTERVAL '1 day'
+           AND (CAST(:m_id AS INTEGER) IS NULL OR merchant_id = :m_id)
+         GROUP BY created_at::date
+         ORDER BY day
+    """), {'m_id': merchant_id}).mappings().all()
+    yesterday_val = conn.execute(text("""
+        SELECT SUM(gateway_fee)::float AS total_fee
+          FROM live_transactions
+         WHERE created_at::date = CURRENT_DATE - INTERVAL '1 day'
+           AND (CAST(:m_id AS INTEGER) IS NULL OR merchant_id = :m_id)
+    """), {'m_id': merchant_id}).scalar() or 0
+    return [r['total_fee'] for r in hist_rows], yesterday_val
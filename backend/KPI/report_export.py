@@ -0,0 +1,274 @@
+# backend/KPI/report_export.py
+"""
+Bulk export of KPI page reports for scheduled reporting.
+
+A batch is every merchant × page × window of a spec. Each report is
+computed by a pool of EXPORT_WORKERS processes, which split a budget of
+EXPORT_DB_CONNECTIONS pooled connections between them (no overflow). Each
+worker writes its report to its own file as soon as it is done, so nothing
+is held in memory until the end:
+
+    <out>/page=<page>/window=<window>/merchant=<id>/<start>_<end>.<csv|parquet|json>
+
+CSV and Parquet hold one row per metric and per chart point (the columns
+are in COLUMNS). JSON holds the page payload as the API returns it. Files
+are written under a temporary name and then renamed, so a file that exists
+is complete. A rerun with the same spec skips those files and only
+computes what is missing or failed. Preset windows are resolved to dates
+when the batch is expanded, so the next day's run writes new files.
+Progress goes to stdout and _progress.jsonl. Throughput (reports and rows
+per second, overall and per page) goes to _summary.json.
+
+    python -m KPI.report_export --merchants all --pages financial,risk --windows Monthly,2026-01-01:2026-03-31
+    python -m KPI.report_export --spec monthly.json --format parquet --workers 8 --connections 8
+"""
+
+import argparse
+import json
+import numbers
+import os
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date, datetime
+from multiprocessing import get_context
+from typing import Optional
+
+import pandas as pd
+
+from config import EXPORT_DB_CONNECTIONS, EXPORT_DIR, EXPORT_FORMAT, EXPORT_WORKERS
+from DB.connector import shared_engine
+from KPI.customer_insight import get_customer_insights_data
+from KPI.DemoGraphic import get_demo_kpi_data
+from KPI.financial_analysis import get_financial_performance_data
+from KPI.operational_efficiency import get_operational_efficiency_data
+from KPI.report import get_gateway_fee_analysis
+from KPI.risk_and_fraud_management import get_risk_and_fraud_data
+from KPI.utils.dimensions import get_dimensions
+from KPI.utils.time_utils import get_date_ranges
+from LLM.prompt_compaction import chart_series
+
+# every page takes (filter_type, custom, merchant_id=...)
+PAGES = {
+    "financial": get_financial_performance_data,
+    "operational": get_operational_efficiency_data,
+    "risk": get_risk_and_fraud_data,
+    "gateway_fee": get_gateway_fee_analysis,
+    "customer": get_customer_insights_data,
+    "demographic": get_demo_kpi_data,
+}
+FORMATS = ("csv", "parquet", "json")
+COLUMNS = ["merchant_id", "page", "window", "start", "end", "section", "title", "series", "label",
+           "value", "diff", "historical_avg", "z_score", "p_value", "is_significant"]
+PROGRESS_LOG = "_progress.jsonl"
+SUMMARY = "_summary.json"
+
+
+def _day(value) -> date:
+    return value.date() if isinstance(value, datetime) else value
+
+
+def _num(value) -> Optional[float]:
+    if isinstance(value, bool) or not isinstance(value, numbers.Real):
+        return None
+    return float(value)
+
+
+# ─── Batch Spec ──────────────────────────────────────────────────
+def parse_window(window: str) -> tuple[str, str, Optional[tuple[date, date]]]:
+    """(label, filter_type, custom range) of a preset name or a "YYYY-MM-DD:YYYY-MM-DD" range."""
+    if ":" not in window:
+        get_date_ranges(window)  # raises ValueError for an unknown preset
+        return window, window, None
+    start, end = (date.fromisoformat(part.strip()) for part in window.split(":", 1))
+    if start > end:
+        raise ValueError(f"Window starts after it ends: {window}")
+    return f"{start}_{end}", "custom", (start, end)
+
+
+def expand(merchants, pages: list[str], windows: list[str]) -> list[dict]:
+    """
+    One report per merchant × page × window. `merchants` is a list of ids
+    or "all" (every merchant in the dimension table).
+    """
+    unknown = [page for page in pages if page not in PAGES]
+    if unknown:
+        raise ValueError(f"Unknown page(s): {', '.join(unknown)} (expected any of {', '.join(PAGES)})")
+    if merchants == "all" or merchants == ["all"]:
+        with shared_engine().connect() as conn:
+            merchants = sorted(get_dimensions().merchant_names(conn))
+    reports = []
+    for window in windows:
+        label, filter_type, custom = parse_window(window)
+        start, end, _, _ = get_date_ranges(filter_type, custom)
+        for page in pages:
+            for merchant_id in merchants:
+                reports.append({"merchant_id": int(merchant_id), "page": page, "window": label,
+                                "filter_type": filter_type, "custom": custom,
+                                "start": _day(start).isoformat(), "end": _day(end).isoformat()})
+    return reports
+
+
+def report_path(out_dir: str, report: dict, fmt: str) -> str:
+    return os.path.join(out_dir, f"page={report['page']}", f"window={report['window']}",
+                        f"merchant={report['merchant_id']}", f"{report['start']}_{report['end']}.{fmt}")
+
+
+# ─── Worker ──────────────────────────────────────────────────────
+def rows(report: dict, payload: dict) -> list[dict]:
+    """One row per metric and per chart point of a page payload."""
+    context = {k: report[k] for k in ("merchant_id", "page", "window", "start", "end")}
+    out = []
+    for metric in payload.get("metrics", []):
+        value = metric.get("value")
+        out.append({**context, "section": "metric", "title": metric.get("title"), "series": None,
+                    "label": None if _num(value) is not None else value, "value": _num(value),
+                    "diff": _num(metric.get("diff")), "historical_avg": _num(metric.get("historical_avg")),
+                    "z_score": _num(metric.get("z_score")), "p_value": _num(metric.get("p_value")),
+                    "is_significant": bool(metric["is_significant"]) if "is_significant" in metric else None})
+    for chart in payload.get("charts", []):
+        for series, labels, values in chart_series(chart):
+            out += [{**context, "section": "chart", "title": chart.get("title"), "series": series,
+                     "label": str(label), "value": _num(value)} for label, value in zip(labels, values)]
+    return out
+
+
+def _write(path: str, fmt: str, report: dict, payload: dict, table: list[dict]):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    if fmt == "json":
+        with open(tmp, "w") as f:
+            json.dump({**{k: v for k, v in report.items() if k != "custom"}, **payload}, f,
+                      default=lambda v: v.item() if hasattr(v, "item") else str(v))
+    else:
+        df = pd.DataFrame(table, columns=COLUMNS)
+        if fmt == "parquet":
+            df.to_parquet(tmp, index=False)
+        else:
+            df.to_csv(tmp, index=False)
+    os.replace(tmp, path)
+
+
+def export_one(report: dict, out_dir: str, fmt: str) -> dict:
+    """Computes one report and writes its file; returns its path, row count and seconds."""
+    t0 = time.perf_counter()
+    payload = PAGES[report["page"]](report["filter_type"], report["custom"], merchant_id=report["merchant_id"])
+    table = rows(report, payload)
+    path = report_path(out_dir, report, fmt)
+    _write(path, fmt, report, payload, table)
+    return {"path": path, "rows": len(table), "seconds": time.perf_counter() - t0}
+
+
+def _init_worker(connections: int):
+    # runs before the worker opens its engine: its pool is its share of the export's budget
+    import config
+
+    config.DB_POOL_SIZE = connections
+    config.DB_MAX_OVERFLOW = 0
+
+
+# ─── Driver ──────────────────────────────────────────────────────
+def _log(f, report: dict, **fields):
+    f.write(json.dumps({"at": datetime.now().isoformat(timespec="seconds"),
+                        **{k: report[k] for k in ("merchant_id", "page", "window", "start", "end")}, **fields}) + "\n")
+    f.flush()
+
+
+def run_export(reports: list[dict], out_dir: str = EXPORT_DIR, fmt: str = EXPORT_FORMAT,
+               workers: int = EXPORT_WORKERS, connections: int = EXPORT_DB_CONNECTIONS,
+               progress_seconds: float = 2.0) -> dict:
+    """Exports every report whose file is missing; returns the throughput summary."""
+    if fmt not in FORMATS:
+        raise ValueError(f"Unsupported format: {fmt} (expected one of {', '.join(FORMATS)})")
+    pending = [r for r in reports if not os.path.exists(report_path(out_dir, r, fmt))]
+    workers = max(1, min(workers, connections, len(pending) or 1))
+    per_worker = max(1, connections // workers)
+    print(f"{len(reports)} report(s): {len(reports) - len(pending)} already exported, {len(pending)} to go "
+          f"on {workers} worker(s) x {per_worker} connection(s)")
+
+    os.makedirs(out_dir, exist_ok=True)
+    pages = defaultdict(lambda: {"reports": 0, "rows": 0, "seconds": 0.0})
+    done = failed = total_rows = 0
+    t0 = last_print = time.perf_counter()
+    with open(os.path.join(out_dir, PROGRESS_LOG), "a") as log, \
+            ProcessPoolExecutor(workers, mp_context=get_context("spawn"),
+                                initializer=_init_worker, initargs=(per_worker,)) as pool:
+        futures = {pool.submit(export_one, r, out_dir, fmt): r for r in pending}
+        for future in as_completed(futures):
+            report = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                failed += 1
+                print(f"🔴 Export of {report['page']} / {report['window']} / merchant {report['merchant_id']} failed: {e}")
+                _log(log, report, status="failed", error=f"{type(e).__name__}: {e}")
+            else:
+                done += 1
+                total_rows += result["rows"]
+                page = pages[report["page"]]
+                page["reports"] += 1
+                page["rows"] += result["rows"]
+                page["seconds"] += result["seconds"]
+                _log(log, report, status="done", rows=result["rows"], seconds=round(result["seconds"], 3),
+                     path=os.path.relpath(result["path"], out_dir))
+
+            now = time.perf_counter()
+            if now - last_print >= progress_seconds or done + failed == len(pending):
+                last_print, elapsed = now, now - t0
+                rate = (done + failed) / elapsed if elapsed else 0.0
+                eta = (len(pending) - done - failed) / rate if rate else 0.0
+                print(f"  {done + failed}/{len(pending)} ({failed} failed)  {rate:.1f} reports/s  "
+                      f"{total_rows / elapsed if elapsed else 0:,.0f} rows/s  eta {eta:.0f}s")
+
+    elapsed = time.perf_counter() - t0
+    summary = {
+        "at": datetime.now().isoformat(timespec="seconds"), "format": fmt, "workers": workers,
+        "connections_per_worker": per_worker, "reports": len(reports), "resumed": len(reports) - len(pending),
+        "exported": done, "failed": failed, "rows": total_rows, "seconds": round(elapsed, 3),
+        "reports_per_second": round(done / elapsed, 2) if elapsed else None,
+        "rows_per_second": round(total_rows / elapsed, 1) if elapsed else None,
+        "pages": {name: {"reports": p["reports"], "rows": p["rows"],
+                         "mean_seconds": round(p["seconds"] / p["reports"], 3)} for name, p in sorted(pages.items())},
+    }
+    with open(os.path.join(out_dir, SUMMARY) + ".tmp", "w") as f:
+        json.dump(summary, f, indent=2)
+    os.replace(os.path.join(out_dir, SUMMARY) + ".tmp", os.path.join(out_dir, SUMMARY))
+    return summary
+
+
+def _split(value) -> list[str]:
+    return [v.strip() for v in value.split(",") if v.strip()] if isinstance(value, str) else list(value)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export KPI page reports for many merchants and windows in parallel.")
+    parser.add_argument("--spec", help='JSON file with any of "merchants", "pages", "windows", "format", "out"')
+    parser.add_argument("--merchants", help='comma-separated merchant ids, or "all" (default)')
+    parser.add_argument("--pages", help=f"comma-separated pages (default: {','.join(PAGES)})")
+    parser.add_argument("--windows", help='comma-separated presets or "YYYY-MM-DD:YYYY-MM-DD" ranges (default: Monthly)')
+    parser.add_argument("--format", choices=FORMATS)
+    parser.add_argument("--out")
+    parser.add_argument("--workers", type=int, default=EXPORT_WORKERS)
+    parser.add_argument("--connections", type=int, default=EXPORT_DB_CONNECTIONS,
+                        help="pooled connections shared by all workers")
+    args = parser.parse_args()
+
+    spec = {}
+    if args.spec:
+        with open(args.spec) as f:
+            spec = json.load(f)
+    merchants = _split(args.merchants or spec.get("merchants", "all"))
+    try:
+        batch = expand(merchants if merchants == ["all"] else [int(m) for m in merchants],
+                       _split(args.pages or spec.get("pages", list(PAGES))),
+                       _split(args.windows or spec.get("windows", ["Monthly"])))
+        summary = run_export(batch, args.out or spec.get("out", EXPORT_DIR),
+                             args.format or spec.get("format", EXPORT_FORMAT), args.workers, args.connections)
+    except ValueError as e:
+        raise SystemExit(f"🔴 {e}")
+
+    print(f"\nexported {summary['exported']} report(s), {summary['rows']:,} rows in {summary['seconds']:.1f}s "
+          f"({summary['reports_per_second']} reports/s, {summary['rows_per_second']:,} rows/s); "
+          f"{summary['resumed']} resumed, {summary['failed']} failed")
+    for name, page in summary["pages"].items():
+        print(f"  {name:<14}{page['reports']:>6} reports {page['rows']:>9,} rows  {page['mean_seconds']:.3f}s each")
@@ -1,13 +1,17 @@
 from datetime import date
-from sqlalchemy import text
-from DB.connector import get_engine
-from KPI.utils.time_utils import get_date_ranges, pct_diff, fetch_one
+from DB.connector import lazy_engine
+from KPI.utils.time_utils import get_date_ranges, pct_diff
+from KPI.utils.query_backend import fetch_additive, fetch_additive_many, fetch_additive_row, first_row
 from typing import Optional, Tuple
+from KPI.utils.columnar_cube import get_cube
+from KPI.utils.dimensions import get_dimensions
+from KPI import cube_pages
 
-engine = get_engine()
+engine = lazy_engine()
 
 def get_risk_and_fraud_data(filter_type: str = 'YTD',
-                            custom: Optional[Tuple[date, date]] = None) -> dict:
+                            custom: Optional[Tuple[date, date]] = None,
+                            merchant_id: Optional[int] = None) -> dict:
     """
     Returns risk & fraud KPI metrics and chart data based on the selected date range filter.
     KPIs:
@@ -20,146 +24,170 @@ def get_risk_and_fraud_data(filter_type: str = 'YTD',
       - Risk Analysis by Region
     """
     start, end, comp_start, comp_end = get_date_ranges(filter_type, custom)
-    metrics, charts = [], []
+
+    cube = get_cube()
+    if cube and cube.covers(comp_start, end):
+        return cube_pages.risk_and_fraud(cube.snapshot(), filter_type, start, end, comp_start, comp_end, merchant_id)
 
     with engine.connect() as conn:
-        # ─── 1) Fraud Loss ──────────────────────────────────────────────
-        sql_loss = """
-          SELECT COALESCE(SUM(usd_value),0)
-            FROM live_transactions
-           WHERE fraud = true
-             AND created_at::date BETWEEN :s AND :e
-        """
-        curr_loss = fetch_one(conn, sql_loss, {'s': start, 'e': end})
-        prev_loss = fetch_one(conn, sql_loss, {'s': comp_start, 'e': comp_end})
-        metrics.append({
-            'title': 'Fraud Loss',
-            'value': round(curr_loss, 2),
-            'diff': pct_diff(curr_loss, prev_loss)
-        })
-
-        # ─── 2) Fraud Rate (%) ─────────────────────────────────────────
-        sql_total = "SELECT COUNT(*)::float FROM live_transactions WHERE created_at::date BETWEEN :s AND :e"
-        sql_fraud = """
-          SELECT COUNT(*)::float
-            FROM live_transactions
-           WHERE fraud = true
-             AND created_at::date BETWEEN :s AND :e
-        """
-        curr_total = fetch_one(conn, sql_total, {'s': start, 'e': end}) or 1
-        prev_total = fetch_one(conn, sql_total, {'s': comp_start, 'e': comp_end}) or 1
-        curr_fraud = fetch_one(conn, sql_fraud, {'s': start, 'e': end})
-        prev_fraud = fetch_one(conn, sql_fraud, {'s': comp_start, 'e': comp_end})
-        curr_rate = round(curr_fraud / curr_total * 100, 2)
-        prev_rate = round(prev_fraud / prev_total * 100, 2)
-        metrics.append({
-            'title': 'Fraud Rate (%)',
-            'value': curr_rate,
-            'diff': pct_diff(curr_rate, prev_rate)
-        })
-
-        # ─── 3) Fraud Detection Rate & Count ───────────────────────────
-        sql_detect = """
-          SELECT COUNT(*)::float
-            FROM live_transactions
-           WHERE pred_fraud = true
-             AND created_at::date BETWEEN :s AND :e
-        """
-        curr_detect = fetch_one(conn, sql_detect, {'s': start, 'e': end})
-        prev_detect = fetch_one(conn, sql_detect, {'s': comp_start, 'e': comp_end})
-        curr_detect_pct = round(curr_detect / curr_total * 100, 2)
-        prev_detect_pct = round(prev_detect / prev_total * 100, 2)
-        metrics += [
-            {
-                'title': 'Fraud Detection Rate (%)',
-                'value': curr_detect_pct,
-                'diff': pct_diff(curr_detect_pct, prev_detect_pct)
-            },
-            {
-                'title': 'Fraud Detections (count)',
-                'value': int(curr_detect),
-                'diff': pct_diff(curr_detect, prev_detect)
-            }
-        ]
-
-        # ─── 4) Potential Fraud Saving ──────────────────────────────────
-        avg_fraud_loss = curr_loss / curr_fraud if curr_fraud else 0
-        curr_saving = round(curr_detect_pct / 100 * avg_fraud_loss, 2)
-        prev_avg_fraud = prev_loss / prev_fraud if prev_fraud else 0
-        prev_saving = round(prev_detect_pct / 100 * prev_avg_fraud, 2)
-        metrics.append({
-            'title': 'Potential Fraud Saving',
-            'value': curr_saving,
-            'diff': pct_diff(curr_saving, prev_saving)
-        })
-
-        # ─── 5) 3DS Authentication Effectiveness (Metric) ─────────────
-        rows_3ds = conn.execute(text("""
-          SELECT
-            COUNT(*) FILTER (WHERE fraud = true AND sca_type = 'THREEDS_2_0')::float AS fraud_3ds,
-            COUNT(*) FILTER (WHERE sca_type = 'THREEDS_2_0')::float               AS total_3ds
-          FROM live_transactions
-         WHERE created_at::date BETWEEN :s AND :e
-        """), {'s': start, 'e': end}).mappings().all()
-        fraud_3ds = rows_3ds[0]['fraud_3ds']
-        total_3ds = rows_3ds[0]['total_3ds'] or 1
-        effectiveness = round(fraud_3ds / total_3ds * 100, 2)
-        # comparison window
-        prev_3ds_rows = conn.execute(text("""
-          SELECT
-            COUNT(*) FILTER (WHERE fraud = true AND sca_type = 'THREEDS_2_0')::float AS fraud_3ds,
-            COUNT(*) FILTER (WHERE sca_type = 'THREEDS_2_0')::float               AS total_3ds
-          FROM live_transactions
-         WHERE created_at::date BETWEEN :s AND :e
-        """), {'s': comp_start, 'e': comp_end}).mappings().all()
-        prev_fraud_3ds = prev_3ds_rows[0]['fraud_3ds']
-        prev_total_3ds = prev_3ds_rows[0]['total_3ds'] or 1
-        prev_effectiveness = round(prev_fraud_3ds / prev_total_3ds * 100, 2)
-
-        metrics.append({
-            'title': '3DS Authentication Effectiveness (%)',
-            'value': effectiveness,
-            'diff': pct_diff(effectiveness, prev_effectiveness)
-        })
-
-        # ─── Chart: Risk Analysis by Region ─────────────────────────────
-        rows = conn.execute(text("""
-            SELECT
-              t.region,
-              COUNT(*) FILTER (WHERE t.fraud = true)::float AS fraud_count,
-              COUNT(*)::float                             AS total_count
-            FROM live_transactions t
-            WHERE t.created_at::date BETWEEN :s AND :e
-            GROUP BY t.region
-        """), {'s': start, 'e': end}).mappings().all()
-
-        # 2) fetch every label in the region_enum
-        all_regions = conn.execute(text("""
-            SELECT unnest(enum_range(NULL::region_enum)) AS region
-        """)).scalars().all()
-
-        # 3) build a quick lookup of your fetched counts
-        row_map = { r['region']: r for r in rows }
-
-        # 4) for each enum value, compute a rate (or 0 if no data)
-        x = []
-        y = []
-        for region in all_regions:
-            rec = row_map.get(region)
-            if rec and rec['total_count']:
-                rate = round(rec['fraud_count'] / rec['total_count'] * 100, 2)
-            else:
-                rate = 0.0
-            x.append(region)
-            y.append(rate)
-
-        charts.append({
-            'title': 'Risk Analysis by Region',
-            'type':  'bar',
-            'x':      x,
-            'y':      y
-        })
+        # the three additive queries are independent, so they go out together
+        params = {'s': start, 'e': end, 'm_id': merchant_id}
+        curr, prev, regions = fetch_additive_many(conn, [
+            (SQL_TOTALS, params, ()),
+            (SQL_TOTALS, {**params, 's': comp_start, 'e': comp_end}, ()),
+            (SQL_REGIONS, params, ('region',)),
+        ])
+        all_regions = region_labels(conn)
+    return build_risk_payload(first_row(curr), first_row(prev), region_components(regions), all_regions)
+
+
+# ─── Additive Components ─────────────────────────────────────────
+# Every KPI on this page is a ratio of these sums/counts, so one pass per
+# window replaces per-metric queries, and the live feed (KPI/live_feed.py)
+# can keep them current by adding new rows through `add_risk_row`.
+SQL_TOTALS = """
+  SELECT
+    COALESCE(SUM(usd_value) FILTER (WHERE fraud = true), 0)                  AS fraud_loss,
+    COUNT(*)::float                                                        AS total,
+    COUNT(*) FILTER (WHERE fraud = true)::float                            AS fraud,
+    COUNT(*) FILTER (WHERE pred_fraud = true)::float                       AS detected,
+    COUNT(*) FILTER (WHERE fraud = true AND sca_type = 'THREEDS_2_0')::float AS fraud_3ds,
+    COUNT(*) FILTER (WHERE sca_type = 'THREEDS_2_0')::float                AS total_3ds
+    FROM live_transactions
+   WHERE created_at::date BETWEEN :s AND :e
+     AND (CAST(:m_id AS INTEGER) IS NULL OR merchant_id = :m_id)
+"""
+
+SQL_REGIONS = """
+    SELECT
+      t.region,
+      COUNT(*) FILTER (WHERE t.fraud = true)::float AS fraud_count,
+      COUNT(*)::float                             AS total_count
+    FROM live_transactions t
+    WHERE t.created_at::date BETWEEN :s AND :e
+      AND (CAST(:m_id AS INTEGER) IS NULL OR t.merchant_id = :m_id)
+    GROUP BY t.region
+"""
+
+
+def risk_totals(conn, start, end, merchant_id: Optional[int] = None) -> dict:
+    return fetch_additive_row(conn, SQL_TOTALS, {'s': start, 'e': end, 'm_id': merchant_id})
+
+
+def risk_regions(conn, start, end, merchant_id: Optional[int] = None) -> dict:
+    rows = fetch_additive(conn, SQL_REGIONS, {'s': start, 'e': end, 'm_id': merchant_id}, keys=('region',))
+    return region_components(rows)
+
+
+def region_components(rows: list) -> dict:
+    return {r['region']: {'fraud_count': r['fraud_count'], 'total_count': r['total_count']} for r in rows}
+
+
+def region_labels(conn) -> list:
+    """Every region_enum label, so regions without data still get a bar."""
+    return get_dimensions().enum_labels(conn, 'region_enum')
+
+
+def add_risk_row(totals: dict, regions: dict, row) -> None:
+    """Adds one live_transactions row to the components (mirror of SQL_TOTALS / SQL_REGIONS)."""
+    three_ds = row['sca_type'] == 'THREEDS_2_0'
+    fraud = row['fraud'] is True
+    for key, inc in (('fraud_loss', float(row['usd_value'] or 0) if fraud else 0.0),
+                     ('total', 1.0),
+                     ('fraud', float(fraud)),
+                     ('detected', float(row['pred_fraud'] is True)),
+                     ('fraud_3ds', float(fraud and three_ds)),
+                     ('total_3ds', float(three_ds))):
+        totals[key] = totals.get(key, 0.0) + inc
+    region = regions.setdefault(row['region'], {'fraud_count': 0.0, 'total_count': 0.0})
+    region['fraud_count'] += float(fraud)
+    region['total_count'] += 1.0
+
+
+def build_risk_payload(curr: dict, prev: dict, regions: dict, all_regions: list) -> dict:
+    """Derives the page's metrics and chart from the additive components."""
+    metrics, charts = [], []
+
+    # ─── 1) Fraud Loss ──────────────────────────────────────────────
+    curr_loss = curr['fraud_loss']
+    prev_loss = prev['fraud_loss']
+    metrics.append({
+        'title': 'Fraud Loss',
+        'value': round(curr_loss, 2),
+        'diff': pct_diff(curr_loss, prev_loss)
+    })
+
+    # ─── 2) Fraud Rate (%) ─────────────────────────────────────────
+    curr_total = curr['total'] or 1
+    prev_total = prev['total'] or 1
+    curr_fraud = curr['fraud']
+    prev_fraud = prev['fraud']
+    curr_rate = round(curr_fraud / curr_total * 100, 2)
+    prev_rate = round(prev_fraud / prev_total * 100, 2)
+    metrics.append({
+        'title': 'Fraud Rate (%)',
+        'value': curr_rate,
+        'diff': pct_diff(curr_rate, prev_rate)
+    })
+
+    # ─── 3) Fraud Detection Rate & Count ───────────────────────────
+    curr_detect = curr['detected']
+    prev_detect = prev['detected']
+    curr_detect_pct = round(curr_detect / curr_total * 100, 2)
+    prev_detect_pct = round(prev_detect / prev_total * 100, 2)
+    metrics += [
+        {
+            'title': 'Fraud Detection Rate (%)',
+            'value': curr_detect_pct,
+            'diff': pct_diff(curr_detect_pct, prev_detect_pct)
+        },
+        {
+            'title': 'Fraud Detections (count)',
+            'value': int(curr_detect),
+            'diff': pct_diff(curr_detect, prev_detect)
+        }
+    ]
+
+    # ─── 4) Potential Fraud Saving ──────────────────────────────────
+    avg_fraud_loss = curr_loss / curr_fraud if curr_fraud else 0
+    curr_saving = round(curr_detect_pct / 100 * avg_fraud_loss, 2)
+    prev_avg_fraud = prev_loss / prev_fraud if prev_fraud else 0
+    prev_saving = round(prev_detect_pct / 100 * prev_avg_fraud, 2)
+    metrics.append({
+        'title': 'Potential Fraud Saving',
+        'value': curr_saving,
+        'diff': pct_diff(curr_saving, prev_saving)
+    })
+
+    # ─── 5) 3DS Authentication Effectiveness (Metric) ─────────────
+    effectiveness = round(curr['fraud_3ds'] / (curr['total_3ds'] or 1) * 100, 2)
+    prev_effectiveness = round(prev['fraud_3ds'] / (prev['total_3ds'] or 1) * 100, 2)
+
+    metrics.append({
+        'title': '3DS Authentication Effectiveness (%)',
+        'value': effectiveness,
+        'diff': pct_diff(effectiveness, prev_effectiveness)
+    })
+
+    # ─── Chart: Risk Analysis by Region ─────────────────────────────
+    # for each enum value, compute a rate (or 0 if no data)
+    x = []
+    y = []
+    for region in all_regions:
+        rec = regions.get(region)
+        if rec and rec['total_count']:
+            rate = round(rec['fraud_count'] / rec['total_count'] * 100, 2)
+        else:
+            rate = 0.0
+        x.append(region)
+        y.append(rate)
 
+    charts.append({
+        'title': 'Risk Analysis by Region',
+        'type':  'bar',
+        'x':      x,
+        'y':      y
+    })
 
     return {
         'metrics': metrics,
@@ -0,0 +1,253 @@
+# backend/KPI/utils/admission.py
+"""
+Admission control for the /api routes.
+
+Every request is put in a cost class before it reaches the threadpool:
+"insight" (the LLM-backed /insight endpoints), "heavy" (windows scanning
+more than ADMISSION_HEAVY_DAYS days that neither the cube nor the prefix
+index answers, multi-window batches, the all-time dashboard without its
+counters) or "cheap". Each class has its own concurrency limit and bounded
+queue (ADMISSION_LIMITS), so a burst of YTD scans or insight clicks queues
+behind itself instead of taking the threadpool and DB pool from `Today`
+requests. Requests that find the queue full, or wait longer than
+ADMISSION_QUEUE_SECONDS, are shed with 503 and a Retry-After estimated from
+the class's recent service time.
+
+Classifying runs on the event loop, so it reads the days the cube and
+prefix index answer from a snapshot that a background thread refreshes every
+ADMISSION_COVERAGE_SECONDS; without a check (before startup), long windows
+class heavy.
+"""
+
+import asyncio
+import math
+import threading
+import time
+from collections import defaultdict
+from datetime import date, timedelta
+from typing import Optional
+from urllib.parse import parse_qs
+
+from config import (ADMISSION_CLIENT_LIMIT, ADMISSION_COVERAGE_SECONDS, ADMISSION_ENABLED,
+                    ADMISSION_HEAVY_DAYS, ADMISSION_LIMITS, ADMISSION_QUEUE_SECONDS,
+                    CUBE_MAX_STALENESS_SECONDS, DASHBOARD_COUNTERS_ENABLED)
+from KPI.utils.time_utils import get_date_ranges
+
+EXEMPT = ("/api/live",)
+# pages whose cost follows their filter window (filter_type defaults to YTD)
+WINDOWED = ("/api/financial-performance", "/api/operational-efficiency", "/api/risk-and-fraud",
+            "/api/gateway-fee", "/api/demographic", "/api/customer-insights", "/api/portfolio")
+
+
+def _param_date(params: dict, *names) -> Optional[date]:
+    for name in names:
+        if name in params:
+            try:
+                return date.fromisoformat(params[name][0])
+            except ValueError:
+                return None
+    return None
+
+
+# ─── Coverage ────────────────────────────────────────────────────
+# cube_from / cube_until: the cube's first day and when its last refresh goes
+# stale; backend: the query backend, whose covers() is a date comparison once built
+_coverage: dict = {"cube_from": None, "cube_until": 0.0, "backend": None}
+_monitor: Optional[threading.Thread] = None
+
+
+def check_coverage():
+    """Re-reads the cube's metadata and builds the query backend; both may do IO."""
+    from KPI.utils.columnar_cube import get_cube
+    from KPI.utils.query_backend import get_backend
+
+    cube, cube_from, cube_until = get_cube(), None, 0.0
+    if cube is not None and cube.size:  # size re-reads the metadata
+        cube_from = date(1970, 1, 1) + timedelta(days=cube.meta["min_day"])
+        cube_until = cube.meta["refreshed_at"] + CUBE_MAX_STALENESS_SECONDS
+    _coverage.update(cube_from=cube_from, cube_until=cube_until, backend=get_backend())
+
+
+def start_coverage_monitor() -> Optional[threading.Thread]:
+    """Checks coverage once, then every ADMISSION_COVERAGE_SECONDS in the background; no-op unless ADMISSION_ENABLED."""
+    global _monitor
+    if _monitor is not None or not ADMISSION_ENABLED:
+        return _monitor
+
+    def loop():
+        while True:
+            time.sleep(ADMISSION_COVERAGE_SECONDS)
+            try:
+                check_coverage()
+            except Exception as e:
+                print(f"🔴 Admission coverage check failed: {e}")
+
+    try:
+        check_coverage()
+    except Exception as e:
+        print(f"🔴 Admission coverage check failed: {e}")
+
+    _monitor = threading.Thread(target=loop, name="admission-coverage", daemon=True)
+    _monitor.start()
+    return _monitor
+
+
+def _covered(start: date, end: date) -> bool:
+    """Whether the cube or prefix index answers [start, end], per the last coverage check."""
+    cube_from = _coverage["cube_from"]
+    if cube_from is not None and time.time() < _coverage["cube_until"] and cube_from <= start and end <= date.today():
+        return True
+    return getattr(_coverage["backend"], "covers", lambda _: False)(start)
+
+
+def scanned_days(filter_type: str, custom) -> Optional[int]:
+    """Days of live_transactions a page reads for this filter (current + comparison window),
+    0 when the cube or prefix index answers it, None for a filter the page will reject."""
+    try:
+        start, end, comp_start, comp_end = get_date_ranges(filter_type, custom)
+    except (ValueError, TypeError):
+        return None
+    start, end, comp_start, comp_end = (d.date() if hasattr(d, "date") else d for d in (start, end, comp_start, comp_end))
+    if _covered(comp_start, end):
+        return 0
+    return (end - start).days + (comp_end - comp_start).days + 2
+
+
+def classify(path: str, query_string: bytes) -> str:
+    """The cost class of a request: "insight", "heavy" or "cheap"."""
+    if path.endswith("/insight"):
+        return "insight"
+    if path.startswith("/api/dashboard"):
+        return "cheap" if DASHBOARD_COUNTERS_ENABLED else "heavy"
+    if not path.startswith(WINDOWED):
+        return "cheap"
+
+    params = parse_qs(query_string.decode("latin-1"))
+    if "filter_types" in params:
+        return "heavy"  # a batch scans the hull of all its windows
+    # approx pages are classed by window too: their non-additive reads (percentiles, distinct counts) stay exact
+    start = _param_date(params, "start", "start_date")
+    end = _param_date(params, "end", "end_date")
+    custom = (start, end) if start and end else None
+    filter_type = params.get("filter_type", ["YTD"])[0]
+    days = scanned_days("custom" if custom and filter_type.lower() == "custom" else filter_type, custom)
+    return "heavy" if days and days > ADMISSION_HEAVY_DAYS else "cheap"
+
+
+class CostClass:
+    """One class's concurrency limit, bounded queue and counters."""
+
+    def __init__(self, name: str, limit: int, queue: int):
+        self.name = name
+        self.limit = limit
+        self.queue = queue
+        self.active = 0
+        self.waiting = 0
+        self.counters: dict = defaultdict(int)
+        self.avg_seconds = 1.0  # moving average of admitted requests' service time
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    def retry_after(self) -> int:
+        """Seconds until a slot is likely free: the queue ahead drained at `limit` at a time."""
+        return max(1, math.ceil(self.avg_seconds * (self.waiting + 1) / max(self.limit, 1)))
+
+    async def acquire(self) -> Optional[str]:
+        """Takes a slot, waiting in the queue if needed; returns the rejection reason instead if shed."""
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.limit)
+        if self._slots.locked():
+            if self.waiting >= self.queue:
+                return "queue_full"
+            self.waiting += 1
+            self.counters["queued"] += 1
+            try:
+                await asyncio.wait_for(self._slots.acquire(), ADMISSION_QUEUE_SECONDS)
+            except asyncio.TimeoutError:
+                return "queue_timeout"
+            finally:
+                self.waiting -= 1
+        else:
+            await self._slots.acquire()
+        self.active += 1
+        self.counters["admitted"] += 1
+        return None
+
+    def release(self, elapsed: float):
+        self.active -= 1
+        self.avg_seconds = 0.8 * self.avg_seconds + 0.2 * elapsed
+        self._slots.release()
+
+    def stats(self) -> dict:
+        return {"limit": self.limit, "queue_limit": self.queue, "active": self.active,
+                "queue_depth": self.waiting, "avg_seconds": round(self.avg_seconds, 3), **self.counters}
+
+
+_classes = {name: CostClass(name, limit, queue) for name, (limit, queue) in ADMISSION_LIMITS.items()}
+_clients: dict = defaultdict(int)
+_clients_lock = threading.Lock()
+
+
+def stats() -> dict:
+    """Per class: limit, queue_limit, active, queue_depth, avg_seconds and admitted/queued/rejected_* counters."""
+    return {name: c.stats() for name, c in _classes.items()}
+
+
+def _client_id(scope) -> str:
+    for name, value in scope.get("headers", []):
+        if name == b"x-client-id":
+            return value.decode("latin-1")
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+async def _reject(send, status: int, retry_after: int, detail: str):
+    body = ('{"detail": "%s"}' % detail).encode()
+    await send({"type": "http.response.start", "status": status, "headers": [
+        (b"content-type", b"application/json"),
+        (b"content-length", str(len(body)).encode()),
+        (b"retry-after", str(retry_after).encode()),
+    ]})
+    await send({"type": "http.response.body", "body": body})
+
+
+class AdmissionMiddleware:
+    """Admits each /api request through its cost class, shedding what does not fit."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        path = scope.get("path", "")
+        if scope["type"] != "http" or not path.startswith("/api") or path.startswith(EXEMPT):
+            await self.app(scope, receive, send)
+            return
+
+        cost = _classes[classify(path, scope.get("query_string", b""))]
+        client = _client_id(scope)
+        if ADMISSION_CLIENT_LIMIT > 0:
+            with _clients_lock:
+                over = _clients[client] >= ADMISSION_CLIENT_LIMIT
+                if not over:
+                    _clients[client] += 1
+            if over:
+                cost.counters["rejected_client_quota"] += 1
+                await _reject(send, 429, cost.retry_after(), "Too many concurrent requests from this client")
+                return
+
+        try:
+            rejected = await cost.acquire()
+            if rejected:
+                cost.counters[f"rejected_{rejected}"] += 1
+                await _reject(send, 503, cost.retry_after(), f"Server busy ({cost.name} requests), retry later")
+                return
+            t0 = time.perf_counter()
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                cost.release(time.perf_counter() - t0)
+        finally:
+            if ADMISSION_CLIENT_LIMIT > 0:
+                with _clients_lock:
+                    _clients[client] -= 1
+                    if not _clients[client]:
+                        del _clients[client]
@@ -0,0 +1,306 @@
+# backend/KPI/utils/approx.py
+"""
+Approximate query mode for the KPI pages that go through
+KPI.utils.query_backend.
+
+A page is evaluated once per replicate, each time with fetch_additive routed
+to a SampledBackend reading an independent TABLESAMPLE SYSTEM sample and
+scaling its SUM/COUNT components by the inverse sampling rate. Because every
+derived metric (rates, averages, shares) is recomputed per replicate, the
+spread across replicates gives a confidence interval for each value without
+the pages knowing anything about sampling. Reads that are not additive
+(quantiles, distinct counts, stat-test history) stay exact; they are
+memoized for the request, so they run once rather than once per replicate.
+"""
+
+import copy
+import json
+import re
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from functools import lru_cache
+from typing import Callable, Literal, Optional, Tuple, get_args
+
+import numpy as np
+from sqlalchemy import text
+
+from config import (APPROX_COST_BUDGET, APPROX_REPLICATES, APPROX_RESULT_TTL_SECONDS,
+                    APPROX_SAMPLE_PERCENT)
+from DB.connector import routed_engine, shared_engine
+from KPI.utils.columnar_cube import get_cube
+from KPI.utils.query_backend import PostgresBackend, get_backend, memoizing, merge_additive, use_backend
+from KPI.utils.time_utils import get_date_ranges
+
+Accuracy = Literal["exact", "approx", "auto"]
+ACCURACY_MODES = get_args(Accuracy)
+CONFIDENCE = 0.95
+
+_FROM_LIVE = re.compile(
+    r"\bFROM\s+live_transactions"
+    r"(?:\s+(?:AS\s+)?(?!(?:WHERE|JOIN|LEFT|RIGHT|INNER|GROUP|ORDER)\b)(\w+))?",
+    re.IGNORECASE,
+)
+
+
+def sample_sql(sql: str, percent: float, seed: int) -> str:
+    """Adds `TABLESAMPLE SYSTEM (percent) REPEATABLE (seed)` to every live_transactions scan."""
+    def repl(m):
+        alias = f" {m.group(1)}" if m.group(1) else ""
+        return f"FROM live_transactions{alias} TABLESAMPLE SYSTEM ({percent:g}) REPEATABLE ({seed:d})"
+    return _FROM_LIVE.sub(repl, sql)
+
+
+class SampledBackend(PostgresBackend):
+    """Answers additive queries from a block sample, scaled up to full-table estimates."""
+
+    name = "sample"
+
+    def __init__(self, percent: float, seed: int):
+        self.percent = percent
+        self.seed = seed
+
+    def fetch_additive(self, conn, sql: str, params: dict, keys: tuple = ()) -> list[dict]:
+        return self.fetch_additive_many(conn, [(sql, params, keys)])[0]
+
+    def fetch_additive_many(self, conn, queries: list) -> list[list[dict]]:
+        rows = self.rows_many(conn, [(sample_sql(sql, self.percent, self.seed), params)
+                                     for sql, params, _ in queries])
+        scale = 100.0 / self.percent
+        results = []
+        for r, (_, _, keys) in zip(rows, queries):
+            merged = merge_additive([r], keys)
+            for row in merged:
+                for c in row:
+                    if c not in keys:
+                        row[c] *= scale
+            results.append(merged)
+        return results
+
+
+# ─── Cost-based switch ───────────────────────────────────────────
+def estimated_cost(conn, start, end) -> float:
+    """Planner total cost of one additive pass over `[start, end]`."""
+    plan = conn.execute(text("""
+        EXPLAIN (FORMAT JSON)
+        SELECT COUNT(*), SUM(usd_value)
+          FROM live_transactions
+         WHERE created_at::date BETWEEN :s AND :e
+    """), {"s": start, "e": end}).scalar()
+    return float(plan[0]["Plan"]["Total Cost"])
+
+
+@lru_cache(maxsize=256)
+def _window_cost(start, end, day: date) -> float:
+    # `day` only keys the cache: relative windows (and the planner's row estimates) move daily
+    with routed_engine().connect() as conn:
+        return estimated_cost(conn, start, end)
+
+
+def resolve_accuracy(accuracy: str, filter_type: str, custom: Optional[Tuple[date, date]] = None) -> str:
+    """Turns `auto` into `exact` or `approx` for this request."""
+    if accuracy not in ACCURACY_MODES:
+        raise ValueError(f"Unsupported accuracy: {accuracy}")
+    if accuracy != "auto":
+        return accuracy
+
+    start, end, comp_start, comp_end = get_date_ranges(filter_type, custom)
+    cube = get_cube()
+    if cube and cube.covers(comp_start, end):
+        return "exact"  # answered from memory either way
+    if getattr(get_backend(), "covers", lambda _: False)(comp_start):
+        return "exact"  # closed days come from the prefix-sum index
+    # planned once per window and day, on the server this request reads from
+    today = date.today()
+    cost = _window_cost(start, end, today) + _window_cost(comp_start, comp_end, today)
+    return "approx" if cost > APPROX_COST_BUDGET else "exact"
+
+
+# ─── Combining replicates ────────────────────────────────────────
+def _is_number(v) -> bool:
+    return isinstance(v, (int, float)) and not isinstance(v, bool)
+
+
+def _estimate(values: list) -> Tuple[Optional[float], Optional[float]]:
+    """Mean of the replicate values and the half-width of its confidence interval."""
+    vals = np.array([v for v in values if _is_number(v)], dtype=np.float64)
+    if vals.size == 0:
+        return None, None
+    if vals.size == 1:
+        return float(vals[0]), None
+    from scipy.stats import t as student_t  # ~1 s to import, so only when approx mode is used
+
+    se = vals.std(ddof=1) / np.sqrt(vals.size)
+    return float(vals.mean()), float(student_t.ppf((1 + CONFIDENCE) / 2, vals.size - 1) * se)
+
+
+def _round_like(sample, value: Optional[float]):
+    if value is None:
+        return None
+    return int(round(value)) if isinstance(sample, int) else round(value, 2)
+
+
+def _labelled(chart: dict) -> Optional[str]:
+    """The x / y key holding category labels, if this chart has one."""
+    for axis in ("x", "y"):
+        labels = chart.get(axis)
+        if isinstance(labels, list) and labels and all(isinstance(v, str) for v in labels):
+            return axis
+    return None
+
+
+def _combine_chart(charts: list[dict]) -> dict:
+    chart = copy.deepcopy(charts[0])
+
+    if isinstance(chart.get("data"), list) and all(isinstance(d, dict) and "name" in d for d in chart["data"]):
+        names = list(dict.fromkeys(d["name"] for c in charts for d in c["data"]))
+        by_name = [{d["name"]: d["value"] for d in c["data"]} for c in charts]
+        chart["data"] = []
+        for name in names:
+            mean, err = _estimate([m.get(name) for m in by_name])
+            chart["data"].append({"name": name, "value": _round_like(0.0, mean), "error": _round_like(0.0, err)})
+        return chart
+
+    axis = _labelled(chart)
+    if axis is None:
+        return chart
+    labels = list(dict.fromkeys(v for c in charts for v in c[axis]))
+    index = [{v: i for i, v in enumerate(c[axis])} for c in charts]
+
+    def combine(series_of: Callable[[dict], list]) -> Tuple[list, list]:
+        means, errs = [], []
+        for label in labels:
+            vals = [series_of(c)[idx[label]] if label in idx else None for c, idx in zip(charts, index)]
+            mean, err = _estimate(vals)
+            means.append(_round_like(0.0, mean))
+            errs.append(_round_like(0.0, err))
+        return means, errs
+
+    chart[axis] = labels
+    other = "y" if axis == "x" else "x"
+    if isinstance(chart.get(other), list):
+        chart[other], chart[f"{other}_error"] = combine(lambda c: c[other])
+    for i, series in enumerate(chart.get("series", [])):
+        series["data"], series["error"] = combine(lambda c, i=i: c["series"][i]["data"])
+    return chart
+
+
+def combine_replicates(runs: list[dict]) -> dict:
+    """
+    Collapses replicate payloads into one: every numeric metric value and
+    chart point becomes the replicate mean, with the CI half-width added
+    next to it (`error`, `y_error` / `x_error`, `series[].error`).
+    """
+    result = copy.deepcopy(runs[0])
+    for i, metric in enumerate(result["metrics"]):
+        for field in ("value", "diff"):
+            if _is_number(metric.get(field)):
+                mean, err = _estimate([r["metrics"][i].get(field) for r in runs])
+                metric[field] = _round_like(metric[field], mean)
+                if field == "value":
+                    metric["error"] = _round_like(0.0, err)
+    result["charts"] = [_combine_chart([r["charts"][i] for r in runs]) for i in range(len(result["charts"]))]
+    return result
+
+
+# ─── Follow-up exact results ─────────────────────────────────────
+# results live in a table, so any app worker can answer the poll, not only the one that ran it
+SCHEMA_SQL = [
+    """
+    CREATE TABLE IF NOT EXISTS exact_results (
+        token       TEXT        PRIMARY KEY,
+        status      TEXT        NOT NULL DEFAULT 'pending',   -- pending | done | failed
+        result      JSONB,
+        error       TEXT,
+        created_at  TIMESTAMPTZ NOT NULL DEFAULT now()
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS exact_results_created_idx ON exact_results (created_at)",
+]
+
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="exact-followup")
+_schema_ready = False
+
+
+def _ensure_schema(conn):
+    global _schema_ready
+    if not _schema_ready:
+        conn.execute(text("SELECT pg_advisory_xact_lock(hashtext('exact_results_schema'))"))
+        for sql in SCHEMA_SQL:
+            conn.execute(text(sql))
+        _schema_ready = True
+
+
+def _run_exact(token: str, page_fn: Callable, filter_type: str, custom):
+    try:
+        result, error = json.dumps(page_fn(filter_type, custom), default=str), None
+    except Exception as e:
+        result, error = None, str(e)[:2000]
+    with shared_engine().begin() as conn:
+        conn.execute(text("""
+            UPDATE exact_results
+               SET status = :status, result = CAST(:result AS JSONB), error = :error
+             WHERE token = :token
+        """), {"token": token, "status": "failed" if error else "done", "result": result, "error": error})
+
+
+def submit_exact(page_fn: Callable, filter_type: str, custom) -> str:
+    """Starts the exact computation in the background; returns a token to poll with."""
+    token = uuid.uuid4().hex
+    with shared_engine().begin() as conn:
+        _ensure_schema(conn)
+        conn.execute(text("DELETE FROM exact_results WHERE created_at < now() - make_interval(secs => :ttl)"),
+                     {"ttl": APPROX_RESULT_TTL_SECONDS})
+        conn.execute(text("INSERT INTO exact_results (token) VALUES (:token)"), {"token": token})
+    _executor.submit(_run_exact, token, page_fn, filter_type, custom)
+    return token
+
+
+def exact_result(token: str) -> Optional[dict]:
+    """Status of a follow-up exact computation, or None for an unknown / expired token."""
+    with shared_engine().begin() as conn:
+        _ensure_schema(conn)
+        row = conn.execute(text("""
+            SELECT status, result, error FROM exact_results
+             WHERE token = :token AND created_at >= now() - make_interval(secs => :ttl)
+        """), {"token": token, "ttl": APPROX_RESULT_TTL_SECONDS}).mappings().first()
+    if row is None:
+        return None
+    if row["status"] == "pending":
+        return {"status": "pending"}
+    if row["status"] == "failed":
+        return {"status": "failed", "error": row["error"]}
+    return {"status": "done", "result": row["result"]}
+
+
+# ─── Entry point ─────────────────────────────────────────────────
+def run_page(page_fn: Callable, filter_type: str, custom: Optional[Tuple[date, date]] = None,
+             accuracy: str = "exact", follow_up: bool = False) -> dict:
+    """
+    Runs a KPI page function in the requested accuracy mode. Exact results
+    are returned unchanged; approximate ones carry an `accuracy` block with
+    the sampling parameters and, if `follow_up`, the token of the exact run.
+    """
+    if resolve_accuracy(accuracy, filter_type, custom) == "exact":
+        return page_fn(filter_type, custom)
+
+    percent = APPROX_SAMPLE_PERCENT / APPROX_REPLICATES
+    runs = []
+    # only fetch_additive is sampled; the page's other reads are exact, so they run once, not per replicate
+    with memoizing():
+        for seed in range(1, APPROX_REPLICATES + 1):
+            with use_backend(SampledBackend(percent, seed)):
+                runs.append(page_fn(filter_type, custom))
+
+    result = combine_replicates(runs)
+    result["accuracy"] = {
+        "mode": "approx",
+        "requested": accuracy,
+        "sample_percent": APPROX_SAMPLE_PERCENT,
+        "replicates": APPROX_REPLICATES,
+        "confidence": CONFIDENCE,
+    }
+    if follow_up:
+        token = submit_exact(page_fn, filter_type, custom)
+        result["accuracy"]["exact_result"] = {"token": token, "url": f"/api/exact-results/{token}"}
+    return result
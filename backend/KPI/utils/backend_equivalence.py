@@ -0,0 +1,119 @@
+# backend/KPI/utils/backend_equivalence.py
+"""
+Result-equivalence check between the Postgres and hybrid (DuckDB over Parquet)
+KPI backends. Runs every page that goes through KPI.utils.query_backend for
+each filter preset on both backends and reports any payload difference.
+
+    cd backend
+    python -m DB.parquet_export
+    python -m KPI.utils.backend_equivalence --custom 2024-01-01:2025-06-30
+"""
+
+import argparse
+import math
+import sys
+from datetime import date
+
+from KPI.financial_analysis import get_financial_performance_data
+from KPI.operational_efficiency import get_operational_efficiency_data
+from KPI.risk_and_fraud_management import get_risk_and_fraud_data
+from KPI.report import get_gateway_fee_analysis
+from KPI.utils.query_backend import set_backend
+
+PAGES = {
+    "financial":   get_financial_performance_data,
+    "operational": get_operational_efficiency_data,
+    "risk":        get_risk_and_fraud_data,
+    "report":      get_gateway_fee_analysis,
+}
+FILTERS = ["Today", "Yesterday", "Daily", "Weekly", "MTD", "Monthly", "YTD"]
+
+
+def diff_payloads(a, b, path: str = "", rel_tol: float = 1e-6, abs_tol: float = 0.011) -> list[str]:
+    """
+    Recursively compares two KPI payloads. Floats may differ by one unit in
+    the last rounded digit (Numeric vs. double summation order).
+    """
+    if isinstance(a, dict) and isinstance(b, dict):
+        out = []
+        for k in sorted(set(a) | set(b), key=str):
+            if k not in a or k not in b:
+                out.append(f"{path}.{k}: missing on one side")
+            else:
+                out += diff_payloads(a[k], b[k], f"{path}.{k}", rel_tol, abs_tol)
+        return out
+    if isinstance(a, list) and isinstance(b, list):
+        if len(a) != len(b):
+            return [f"{path}: length {len(a)} != {len(b)}"]
+        out = []
+        for i, (x, y) in enumerate(zip(a, b)):
+            out += diff_payloads(x, y, f"{path}[{i}]", rel_tol, abs_tol)
+        return out
+    if isinstance(a, (int, float)) and isinstance(b, (int, float)) and not isinstance(a, bool):
+        if math.isclose(float(a), float(b), rel_tol=rel_tol, abs_tol=abs_tol):
+            return []
+    elif a == b:
+        return []
+    return [f"{path}: {a!r} != {b!r}"]
+
+
+def canonical_chart(chart: dict) -> dict:
+    """
+    Sorts category-keyed charts by label. Several chart queries have no
+    ORDER BY, so category order is arbitrary even within one backend.
+    """
+    chart = dict(chart)
+    data = chart.get("data")
+    if isinstance(data, list) and data and isinstance(data[0], dict) and "name" in data[0]:
+        chart["data"] = sorted(data, key=lambda d: str(d["name"]))
+
+    labels = chart.get("x")
+    if isinstance(labels, list) and labels and all(isinstance(v, str) for v in labels):
+        order = sorted(range(len(labels)), key=lambda i: labels[i])
+        for key in ("x", "y"):
+            if isinstance(chart.get(key), list) and len(chart[key]) == len(labels):
+                chart[key] = [chart[key][i] for i in order]
+        chart["series"] = [
+            {**s, "data": [s["data"][i] for i in order]} if len(s.get("data", [])) == len(labels) else s
+            for s in chart.get("series", [])
+        ]
+    return chart
+
+
+def run(custom: list[tuple[date, date]]) -> int:
+    cases = [(f, None) for f in FILTERS] + [("custom", c) for c in custom]
+    failures = 0
+
+    for page, fn in PAGES.items():
+        for filter_type, window in cases:
+            if page == "report" and filter_type not in ("Daily", "Weekly", "MTD", "YTD"):
+                continue
+            set_backend("postgres")
+            expected = fn(filter_type, window)
+            set_backend("hybrid")
+            actual = fn(filter_type, window)
+
+            expected["charts"] = [canonical_chart(c) for c in expected["charts"]]
+            actual["charts"] = [canonical_chart(c) for c in actual["charts"]]
+            problems = diff_payloads(expected, actual)
+            label = f"{page:<12} {filter_type:<10} {window or ''}"
+            if problems:
+                failures += 1
+                print(f"FAIL {label}")
+                for p in problems[:10]:
+                    print(f"     {p}")
+            else:
+                print(f"ok   {label}")
+
+    print(f"\n{failures} mismatching case(s)")
+    return failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare KPI payloads between query backends.")
+    parser.add_argument("--custom", action="append", default=[],
+                        help="extra custom window START:END (YYYY-MM-DD), may repeat")
+    args = parser.parse_args()
+
+    windows = [tuple(date.fromisoformat(p) for p in c.split(":")) for c in args.custom]
+    sys.exit(1 if run(windows) else 0)
@@ -0,0 +1,420 @@
+# backend/KPI/utils/columnar_cube.py
+
+import copy
+import fcntl
+import json
+import os
+import shutil
+import threading
+import time
+from datetime import date, datetime, timedelta
+from typing import Optional
+
+import numpy as np
+from sqlalchemy import text
+
+from config import (
+    CUBE_DAYS,
+    CUBE_DIR,
+    CUBE_ENABLED,
+    CUBE_LATE_SECONDS,
+    CUBE_MAX_STALENESS_SECONDS,
+    CUBE_REFRESH_SECONDS,
+)
+
+# ─── Column Layout ───────────────────────────────────────────────
+NUMERIC = {
+    "id":          np.int64,
+    "day":         np.int32,   # days since 1970-01-01 of created_at
+    "merchant_id": np.int32,
+    "usd_value":   np.float64,
+    "gateway_fee": np.float64,
+    "fee":         np.float64,  # (pricing_ic / 100) * usd_value + gateway_fee
+}
+FLAGS = ["payment_successful", "fraud", "pred_fraud", "three_ds"]
+# Dictionary-encoded as int32 codes; code 0 is always NULL.
+CATEGORICAL = [
+    "acquirer", "transaction_currency", "credit_card_type", "funding_source",
+    "transaction_type", "creation_type", "country_code", "state_or_province",
+    "issuer_country_code", "region",
+]
+
+LOAD_SELECT = """
+    SELECT t.id,
+           t.created_at::date                                             AS day,
+           t.merchant_id,
+           a.name                                                         AS acquirer,
+           t.usd_value::float8                                            AS usd_value,
+           t.gateway_fee::float8                                          AS gateway_fee,
+           ((t.pricing_ic / 100.0) * t.usd_value + t.gateway_fee)::float8 AS fee,
+           t.payment_successful,
+           t.fraud,
+           t.pred_fraud,
+           t.sca_type = 'THREEDS_2_0'                                     AS three_ds,
+           t.transaction_currency, t.credit_card_type, t.funding_source,
+           t.transaction_type, t.creation_type, t.country_code,
+           t.state_or_province, t.issuer_country_code, t.region::text     AS region
+      FROM live_transactions t
+      LEFT JOIN acquirer a ON t.acquirer_id = a.id
+"""
+LOAD_SQL = LOAD_SELECT + """
+     WHERE t.id > :wm
+       AND t.created_at >= :since
+     ORDER BY t.id
+     LIMIT :batch
+"""
+# ids are assigned at insert but become visible at commit, so a lower id can
+# appear after the watermark has passed it; recent rows are checked again
+LATE_IDS_SQL = """
+    SELECT id FROM live_transactions
+     WHERE id <= :wm AND created_at >= LOCALTIMESTAMP - make_interval(secs => :late)
+       AND created_at >= :since
+"""
+LATE_SQL = LOAD_SELECT + """
+     WHERE t.id = ANY(:ids)
+     ORDER BY t.id
+"""
+
+META = "meta.json"
+LOCK = "refresh.lock"
+BATCH = 200_000
+
+
+def day_number(d) -> int:
+    if isinstance(d, datetime):
+        d = d.date()
+    return int(np.datetime64(d, "D").astype(np.int64))
+
+
+class CubeSnapshot:
+    """Columns and dictionaries frozen at one published row count."""
+
+    def __init__(self, meta: dict, arrays: dict):
+        self.meta = meta
+        self.rows = meta["rows"]
+        self._arrays = arrays
+
+    def col(self, name: str) -> np.ndarray:
+        return self._arrays[name][: self.rows]
+
+    def labels(self, name: str) -> list:
+        return self.meta["dictionaries"][name]
+
+
+class ColumnarCube:
+    """
+    Structure-of-arrays copy of the last CUBE_DAYS days of live_transactions.
+
+    Columns live in .npy files under `<path>/gen-<n>/` and are opened with
+    mmap, so every uvicorn worker maps the same pages from the OS page cache.
+    One worker at a time (guarded by a file lock) appends rows past the id
+    watermark; `meta.json` is replaced atomically after the data is flushed,
+    so readers only ever see fully written rows.
+    """
+
+    def __init__(self, path: str = CUBE_DIR, days: int = CUBE_DAYS):
+        self.path = path
+        self.days = days
+        self.meta: dict = {}
+        self._arrays: dict[str, np.ndarray] = {}
+        self._meta_mtime = None
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+
+    # ─── Reader Side ─────────────────────────────────────────────
+    def _sync(self):
+        """Re-maps the column files if another worker published new rows."""
+        meta_path = os.path.join(self.path, META)
+        try:
+            mtime = os.stat(meta_path).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime == self._meta_mtime:
+            return
+        with self._lock:
+            for _ in range(3):
+                with open(meta_path) as f:
+                    meta = json.load(f)
+                if meta.get("generation") != self.meta.get("generation"):
+                    gen_dir = os.path.join(self.path, f"gen-{meta['generation']}")
+                    try:
+                        self._arrays = {
+                            name: np.load(os.path.join(gen_dir, f"{name}.npy"), mmap_mode="r")
+                            for name in list(NUMERIC) + FLAGS + CATEGORICAL
+                        }
+                    except FileNotFoundError:
+                        # a refresh published a newer generation and removed this one meanwhile
+                        mtime = os.stat(meta_path).st_mtime_ns
+                        continue
+                self.meta = meta
+                self._meta_mtime = mtime
+                return
+
+    @property
+    def size(self) -> int:
+        self._sync()
+        return self.meta.get("rows", 0)
+
+    def snapshot(self) -> "CubeSnapshot":
+        """Consistent view of the rows published so far (safe across refreshes)."""
+        self._sync()
+        with self._lock:
+            return CubeSnapshot(self.meta, self._arrays)
+
+    def covers(self, start, end, history_from=None) -> bool:
+        """
+        True when every day of [start, end] (and back to `history_from`, for
+        pages that also read a trailing history) is inside the cube's range
+        and the cube has been refreshed recently enough to answer open days.
+        """
+        self._sync()
+        if not self.meta:
+            return False
+        if time.time() - self.meta["refreshed_at"] > CUBE_MAX_STALENESS_SECONDS:
+            return False
+        first = day_number(start)
+        if history_from is not None:
+            first = min(first, day_number(history_from))
+        return self.meta["min_day"] <= first and day_number(end) <= day_number(date.today())
+
+    # ─── Writer Side ─────────────────────────────────────────────
+    def refresh(self, engine) -> int:
+        """
+        Appends rows with id > watermark. Starts a new, compacted generation
+        on first load, when the oldest day falls out of range, or when the
+        preallocated capacity is exhausted. Returns the number of rows added;
+        -1 if another worker holds the refresh lock.
+        """
+        lock_file = open(os.path.join(self.path, LOCK), "w")
+        try:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return -1
+
+            self._meta_mtime = None
+            self._sync()
+            min_day = day_number(date.today() - timedelta(days=self.days - 1))
+            meta = copy.deepcopy(self.meta) if self.meta else None
+            arrays = None
+
+            if meta is None or meta["min_day"] < min_day:
+                meta, arrays = self._compact(meta, self._arrays, min_day, extra=0)
+
+            added = 0
+            with engine.connect() as conn:
+                enum_labels = conn.execute(text("SELECT unnest(enum_range(NULL::region_enum))::text")).scalars().all()
+                while True:
+                    rows = conn.execute(text(LOAD_SQL), {
+                        "wm": meta["watermark"],
+                        "since": date(1970, 1, 1) + timedelta(days=min_day),
+                        "batch": BATCH,
+                    }).mappings().all()
+                    if not rows:
+                        break
+                    if arrays is None:
+                        arrays = self._open_writable(meta)
+                    if meta["rows"] + len(rows) > meta["capacity"]:
+                        meta, arrays = self._compact(meta, arrays, min_day, extra=len(rows))
+                    self._append(meta, arrays, rows)
+                    added += len(rows)
+                    if len(rows) < BATCH:
+                        break
+
+                late = self._late_rows(conn, meta, arrays if arrays is not None else self._arrays, min_day)
+                if late:
+                    if arrays is None:
+                        arrays = self._open_writable(meta)
+                    if meta["rows"] + len(late) > meta["capacity"]:
+                        meta, arrays = self._compact(meta, arrays, min_day, extra=len(late))
+                    self._append(meta, arrays, late)
+                    added += len(late)
+
+            meta["region_enum"] = enum_labels
+            meta["refreshed_at"] = time.time()
+            self._publish(meta)
+            return added
+        finally:
+            lock_file.close()
+
+    def _late_rows(self, conn, meta: dict, arrays: dict, min_day: int) -> list:
+        """Rows at or below the watermark, created in the last CUBE_LATE_SECONDS, that the cube lacks."""
+        ids = conn.execute(text(LATE_IDS_SQL), {
+            "wm": meta["watermark"],
+            "late": CUBE_LATE_SECONDS,
+            "since": date(1970, 1, 1) + timedelta(days=min_day),
+        }).scalars().all()
+        if not ids:
+            return []
+        ids = np.array(ids, dtype=np.int64)
+        loaded = arrays["id"][: meta["rows"]] if arrays else np.zeros(0, dtype=np.int64)
+        missing = ids[~np.isin(ids, loaded[loaded >= ids.min()])]
+        if not missing.size:
+            return []
+        return conn.execute(text(LATE_SQL), {"ids": missing.tolist()}).mappings().all()
+
+    def _open_writable(self, meta: dict) -> dict:
+        gen_dir = os.path.join(self.path, f"gen-{meta['generation']}")
+        return {
+            name: np.load(os.path.join(gen_dir, f"{name}.npy"), mmap_mode="r+")
+            for name in list(NUMERIC) + FLAGS + CATEGORICAL
+        }
+
+    def _compact(self, meta: Optional[dict], source: dict, min_day: int, extra: int) -> tuple[dict, dict]:
+        """Copies the still-in-range rows of `source` into a fresh generation with headroom."""
+        keep = None
+        if meta:
+            keep = np.flatnonzero(source["day"][: meta["rows"]] >= min_day)
+
+        kept = 0 if keep is None else len(keep)
+        capacity = max(2 * (kept + extra), 1_000_000)
+        generation = (meta["generation"] + 1) if meta else 1
+        gen_dir = os.path.join(self.path, f"gen-{generation}")
+        os.makedirs(gen_dir, exist_ok=True)
+
+        arrays = {}
+        dtypes = {**NUMERIC, **{f: np.bool_ for f in FLAGS}, **{c: np.int32 for c in CATEGORICAL}}
+        for name, dtype in dtypes.items():
+            arr = np.lib.format.open_memmap(os.path.join(gen_dir, f"{name}.npy"), mode="w+",
+                                            dtype=dtype, shape=(capacity,))
+            if kept:
+                arr[:kept] = source[name][keep]
+            arrays[name] = arr
+
+        new_meta = {
+            "generation":   generation,
+            "rows":         kept,
+            "capacity":     capacity,
+            "min_day":      min_day,
+            "watermark":    meta["watermark"] if meta else 0,
+            "dictionaries": meta["dictionaries"] if meta else {c: [None] for c in CATEGORICAL},
+            "region_enum":  meta.get("region_enum", []) if meta else [],
+            "refreshed_at": meta["refreshed_at"] if meta else 0,
+        }
+        for arr in arrays.values():
+            arr.flush()
+        return new_meta, arrays
+
+    def _append(self, meta: dict, arrays: dict, rows: list):
+        lo, hi = meta["rows"], meta["rows"] + len(rows)
+        for name in NUMERIC:
+            if name == "day":
+                values = np.array([r["day"] for r in rows], dtype="datetime64[D]").astype(np.int32)
+            else:
+                values = np.array([r[name] or 0 for r in rows], dtype=NUMERIC[name])
+            arrays[name][lo:hi] = values
+        for name in FLAGS:
+            arrays[name][lo:hi] = np.array([bool(r[name]) for r in rows], dtype=np.bool_)
+        for name in CATEGORICAL:
+            labels = meta["dictionaries"][name]
+            index = {label: code for code, label in enumerate(labels)}
+            codes = np.empty(len(rows), dtype=np.int32)
+            for i, r in enumerate(rows):
+                code = index.get(r[name])
+                if code is None:
+                    code = index[r[name]] = len(labels)
+                    labels.append(r[name])
+                codes[i] = code
+            arrays[name][lo:hi] = codes
+        for arr in arrays.values():
+            arr.flush()
+        meta["rows"] = hi
+        meta["watermark"] = max(meta["watermark"], int(rows[-1]["id"]))
+
+    def _publish(self, meta: dict):
+        tmp = os.path.join(self.path, META + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp, os.path.join(self.path, META))
+
+        # Older generations can go once the new meta is visible; workers that
+        # still map them keep their pages until they re-sync.
+        for entry in os.listdir(self.path):
+            if entry.startswith("gen-") and entry != f"gen-{meta['generation']}":
+                shutil.rmtree(os.path.join(self.path, entry), ignore_errors=True)
+
+
+# ─── Group-By Kernels ────────────────────────────────────────────
+def window_mask(cube: CubeSnapshot, start, end, merchant_id: Optional[int] = None) -> np.ndarray:
+    day = cube.col("day")
+    mask = (day >= day_number(start)) & (day <= day_number(end))
+    if merchant_id is not None:
+        mask &= cube.col("merchant_id") == merchant_id
+    return mask
+
+
+def group_count(codes: np.ndarray, mask: np.ndarray, n_groups: int) -> np.ndarray:
+    return np.bincount(codes[mask], minlength=n_groups)
+
+
+def group_sum(codes: np.ndarray, values: np.ndarray, mask: np.ndarray, n_groups: int) -> np.ndarray:
+    return np.bincount(codes[mask], weights=values[mask], minlength=n_groups)
+
+
+def distinct_count(codes: np.ndarray, mask: np.ndarray, skip_null: bool = True) -> int:
+    present = np.bincount(codes[mask]) > 0
+    if skip_null and present.size:
+        present[0] = False
+    return int(present.sum())
+
+
+def grouped(cube: CubeSnapshot, column: str, mask: np.ndarray, values: Optional[np.ndarray] = None,
+            include_null: bool = True) -> list[tuple]:
+    """
+    (label, count[, sum]) for every category with at least one row in `mask`,
+    the NumPy equivalent of `SELECT col, COUNT(*)[, SUM(v)] ... GROUP BY col`.
+    """
+    labels = cube.labels(column)
+    codes = cube.col(column)
+    counts = group_count(codes, mask, len(labels))
+    sums = group_sum(codes, values, mask, len(labels)) if values is not None else None
+    out = []
+    for code in np.flatnonzero(counts):
+        if code == 0 and not include_null:
+            continue
+        row = (labels[code], int(counts[code]))
+        out.append(row + (float(sums[code]),) if sums is not None else row)
+    return out
+
+
+# ─── Process-wide Instance ───────────────────────────────────────
+_cube: Optional[ColumnarCube] = None
+
+
+def get_cube() -> Optional[ColumnarCube]:
+    """The shared cube, or None when CUBE_ENABLED is off."""
+    global _cube
+    if CUBE_ENABLED and _cube is None:
+        _cube = ColumnarCube()
+    return _cube
+
+
+def start_refresher(engine) -> Optional[threading.Thread]:
+    """
+    Background thread that keeps the cube current. Every worker runs one;
+    the file lock makes sure only one of them loads rows at a time.
+    """
+    cube = get_cube()
+    if cube is None:
+        return None
+
+    def loop():
+        while True:
+            try:
+                cube.refresh(engine)
+            except Exception as e:
+                print("🔴 Cube refresh failed:", e)
+            time.sleep(CUBE_REFRESH_SECONDS)
+
+    thread = threading.Thread(target=loop, name="cube-refresher", daemon=True)
+    thread.start()
+    return thread
+
+
+if __name__ == "__main__":
+    from DB.connector import get_engine
+
+    t0 = time.perf_counter()
+    cube = ColumnarCube()
+    added = cube.refresh(get_engine())
+    print(f"Loaded {added} new rows ({cube.size} total) in {time.perf_counter() - t0:.2f}s → {cube.path}")
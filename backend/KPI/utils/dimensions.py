@@ -0,0 +1,109 @@
+# backend/KPI/utils/dimensions.py
+"""
+In-process dictionary of the small dimension tables.
+
+Acquirer and merchant names and the labels of every Postgres enum are read
+once per process and kept as plain dicts, so KPI queries can group by the
+integer ids on live_transactions and resolve names in Python instead of
+joining `acquirer` on every request. A one-row version query (row count and
+newest xmin per table, enum count and newest enum oid) is run at most every
+DIMENSION_CHECK_SECONDS; the dictionaries are reloaded only when it changes.
+"""
+
+import threading
+import time
+from typing import Optional
+
+from sqlalchemy import text
+
+from config import DIMENSION_CHECK_SECONDS
+
+SQL_VERSION = """
+    SELECT (SELECT count(*) || ':' || COALESCE(max(xmin::text::bigint), 0) FROM acquirer),
+           (SELECT count(*) || ':' || COALESCE(max(xmin::text::bigint), 0) FROM merchant),
+           (SELECT count(*) || ':' || COALESCE(max(oid::bigint), 0) FROM pg_enum)
+"""
+
+SQL_ENUMS = """
+    SELECT t.typname, e.enumlabel
+      FROM pg_enum e
+      JOIN pg_type t ON t.oid = e.enumtypid
+     ORDER BY t.typname, e.enumsortorder
+"""
+
+
+class DimensionCache:
+    """Acquirers, merchants and enum labels; state is replaced whole, so readers never see a half reload."""
+
+    def __init__(self, check_seconds: float = DIMENSION_CHECK_SECONDS):
+        self.check_seconds = check_seconds
+        self._lock = threading.Lock()
+        # (version, {acquirer id: name}, {merchant id: (name, country)}, {enum type: [labels]})
+        self._state: Optional[tuple] = None
+        self._checked = 0.0
+
+    def _current(self, conn) -> tuple:
+        if self._state is not None and time.monotonic() - self._checked < self.check_seconds:
+            return self._state
+        with self._lock:
+            if self._state is None or time.monotonic() - self._checked >= self.check_seconds:
+                version = tuple(conn.execute(text(SQL_VERSION)).one())
+                if self._state is None or self._state[0] != version:
+                    self._state = (version, *self._load(conn))
+                self._checked = time.monotonic()
+            return self._state
+
+    @staticmethod
+    def _load(conn) -> tuple:
+        acquirers = dict(conn.execute(text("SELECT id, name FROM acquirer")).all())
+        merchants = {m_id: (name, country) for m_id, name, country
+                     in conn.execute(text("SELECT id, name, country FROM merchant")).all()}
+        enums: dict = {}
+        for typname, label in conn.execute(text(SQL_ENUMS)).all():
+            enums.setdefault(typname, []).append(label)
+        return acquirers, merchants, enums
+
+    def acquirer_names(self, conn) -> dict:
+        return self._current(conn)[1]
+
+    def merchant_names(self, conn) -> dict:
+        return {m_id: name for m_id, (name, _) in self._current(conn)[2].items()}
+
+    def merchant_countries(self, conn) -> set:
+        return {country for _, country in self._current(conn)[2].values() if country is not None}
+
+    def enum_labels(self, conn, enum: str) -> list:
+        """The enum's labels in declaration order (what enum_range returns)."""
+        return list(self._current(conn)[3].get(enum, []))
+
+    def invalidate(self):
+        """Forces a version check on the next access."""
+        self._checked = 0.0
+
+
+_dimensions = DimensionCache()
+
+
+def get_dimensions() -> DimensionCache:
+    return _dimensions
+
+
+def label_rows(rows: list, id_key: str, labels: dict, label_key: str) -> list[dict]:
+    """
+    Replaces `id_key` with its label under `label_key`, with the semantics of
+    the inner join it stands in for: rows whose id has no label are dropped,
+    and rows sharing a label are summed column-wise. First-seen order is kept.
+    """
+    merged: dict = {}
+    for row in rows:
+        label = labels.get(row[id_key])
+        if label is None:
+            continue
+        values = {c: v for c, v in row.items() if c != id_key}
+        acc = merged.get(label)
+        if acc is None:
+            merged[label] = {label_key: label, **values}
+        else:
+            for c, v in values.items():
+                acc[c] = (acc[c] or 0) + (v or 0)
+    return list(merged.values())
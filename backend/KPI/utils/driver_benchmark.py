@@ -0,0 +1,85 @@
+# backend/KPI/utils/driver_benchmark.py
+"""
+Page latency on psycopg2 against psycopg 3.
+
+On psycopg 3 the independent additive queries of a page (fetch_additive_many)
+go to the server in one pipeline as prepared statements; on psycopg2 they
+run one round trip each. Each page is timed on both drivers with the same
+backend and windows, and the payloads must match.
+
+    cd backend
+    python -m KPI.utils.driver_benchmark --filter Daily --filter MTD --filter YTD
+"""
+
+import argparse
+import time
+from contextlib import contextmanager
+from datetime import date
+
+from DB.connector import get_engine
+
+DRIVERS = ("psycopg2", "psycopg")
+
+
+@contextmanager
+def page_engine(engine):
+    """Points the page modules' shared engine at `engine` for the duration."""
+    from KPI import financial_analysis, operational_efficiency, report, risk_and_fraud_management
+
+    modules = (financial_analysis, operational_efficiency, report, risk_and_fraud_management)
+    saved = [m.engine for m in modules]
+    for m in modules:
+        m.engine = engine
+    try:
+        yield engine
+    finally:
+        for m, e in zip(modules, saved):
+            m.engine = e
+
+
+def benchmark(cases: list, repeat: int = 5) -> int:
+    from KPI.utils.backend_equivalence import PAGES, canonical_chart, diff_payloads
+
+    engines = {driver: get_engine(driver=driver) for driver in DRIVERS}
+
+    def timed(driver, fn, filter_type, window):
+        with page_engine(engines[driver]):
+            result = fn(filter_type, window)  # warm the pool and the prepared statements
+            best = None
+            for _ in range(repeat):
+                t0 = time.perf_counter()
+                fn(filter_type, window)
+                elapsed = time.perf_counter() - t0
+                best = elapsed if best is None else min(best, elapsed)
+        result["charts"] = [canonical_chart(c) for c in result["charts"]]
+        return best, result
+
+    failures = 0
+    print(f"{'page':<12} {'window':<26}" + "".join(f"{d:>10}" for d in DRIVERS) + f"{'speedup':>9}")
+    for page, fn in PAGES.items():
+        for filter_type, window in cases:
+            base_time, expected = timed(DRIVERS[0], fn, filter_type, window)
+            new_time, actual = timed(DRIVERS[1], fn, filter_type, window)
+            ok = not diff_payloads(expected, actual)
+            failures += not ok
+            label = f"{filter_type} {window[0]}:{window[1]}" if window else filter_type
+            print(f"{page:<12} {label:<26} {base_time:>10.4f} {new_time:>9.4f}{'' if ok else '!'}"
+                  f"{base_time / new_time:>8.2f}x")
+
+    for engine in engines.values():
+        engine.dispose()
+    print(f"\nbest of {repeat}, seconds; '!' marks a payload that differs between drivers ({failures})")
+    return failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark KPI page latency on psycopg2 vs psycopg 3.")
+    parser.add_argument("--filter", action="append", default=[], help="filter preset (default: Daily, MTD, YTD)")
+    parser.add_argument("--custom", action="append", default=[],
+                        help="custom window START:END (YYYY-MM-DD), may repeat")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    cases = [(f, None) for f in (args.filter or ([] if args.custom else ["Daily", "MTD", "YTD"]))]
+    cases += [("custom", tuple(date.fromisoformat(p) for p in c.split(":"))) for c in args.custom]
+    raise SystemExit(1 if benchmark(cases, args.repeat) else 0)
@@ -0,0 +1,353 @@
+# backend/KPI/utils/instrumentation.py
+"""
+Per-query SQL instrumentation and per-request timing.
+
+SQLAlchemy engine events time every statement and count the rows it
+returns. Each statement is labelled with the KPI page function that issued
+it and the metric it belongs to, which is the nearest `# ─── Title ───`
+banner above the call inside that function ("line N" where there is none).
+Durations go into a histogram per (function, metric). Statements slower
+than SLOW_QUERY_SECONDS are also offered to plan_capture.
+
+RequestTimingMiddleware adds DB, LLM and JSON render time to each /api
+request and returns them in a `Server-Timing` header. GET /api/metrics
+renders all aggregates in the Prometheus text format. The aggregates cover
+the query histograms, request histograms, query-deadline cancellations and
+admission-control queues.
+"""
+
+import bisect
+import linecache
+import re
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+from fastapi.responses import JSONResponse
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from config import SLOW_QUERY_SECONDS
+from KPI.utils import plan_capture
+
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BANNER = re.compile(r"#\s*─+\s*(.+?)\s*─+\s*$")
+
+_lock = threading.Lock()
+_labels: dict = {}
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus sense."""
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class _QueryStats:
+    def __init__(self):
+        self.seconds = Histogram()
+        self.rows = 0
+        self.errors = 0
+
+
+class RequestTiming:
+    """Time a request spent in the database, the LLM and JSON rendering (seconds)."""
+
+    def __init__(self):
+        self.db = 0.0
+        self.queries = 0
+        self.llm = 0.0
+        self.render = 0.0
+
+
+_queries: dict = defaultdict(_QueryStats)      # (function, metric) → stats
+_requests: dict = defaultdict(Histogram)       # (route, status) → seconds
+_request_parts: dict = defaultdict(float)      # (route, part) → seconds
+_timing: ContextVar = ContextVar("request_timing", default=None)
+
+
+# ─── Query Labels ────────────────────────────────────────────────
+def _statement_frame():
+    """The KPI page frame issuing the statement; else the innermost KPI helper (e.g. the
+    freshness checks run_page does for an API route); else the API route itself."""
+    frame, helper, route = sys._getframe(2), None, None
+    while frame is not None:
+        module = frame.f_globals.get("__name__", "")
+        if module.startswith("KPI.utils") or module.startswith(("DB.", "LLM.")):
+            if helper is None and module != __name__:
+                helper = frame
+        elif module.startswith("KPI."):
+            return frame
+        elif module.startswith("API.") and route is None:
+            route = frame
+        frame = frame.f_back
+    return helper or route
+
+
+def _banner(filename: str, lineno: int, first_line: int) -> Optional[str]:
+    for n in range(lineno - 1, first_line - 1, -1):
+        match = BANNER.search(linecache.getline(filename, n))
+        if match:
+            return match.group(1)
+    return None
+
+
+def query_label() -> tuple[str, str]:
+    """(function, metric) of the statement being executed, from the calling frames."""
+    frame = _statement_frame()
+    if frame is None:
+        return "other", ""
+
+    code, lineno = frame.f_code, frame.f_lineno
+    label = _labels.get((code, lineno))
+    if label is None:
+        function = f"{frame.f_globals['__name__'].rsplit('.', 1)[-1]}.{code.co_name}"
+        metric = _banner(code.co_filename, lineno, code.co_firstlineno) or f"line {lineno}"
+        label = _labels[(code, lineno)] = (function, metric)
+    return label
+
+
+def record_query(label: tuple, seconds: float, rows: int = 0, failed: bool = False):
+    with _lock:
+        stats = _queries[label]
+        stats.seconds.observe(seconds)
+        stats.rows += max(rows, 0)
+        stats.errors += failed
+    timing = _timing.get()
+    if timing is not None:
+        timing.db += seconds
+        timing.queries += 1
+
+
+@contextmanager
+def timed_statements(rows: list, engine=None, statements: list = ()):
+    """Times statements sent outside the engine events (e.g. a psycopg pipeline) as one observation;
+    append each statement's rows to `rows` so they are counted. If the round trip was slow, each
+    (driver-level sql, params) of `statements` is offered to plan_capture under its own label."""
+    label = query_label()
+    t0 = time.perf_counter()
+    failed = True
+    try:
+        yield
+        failed = False
+    finally:
+        seconds = time.perf_counter() - t0
+        record_query(label, seconds, sum(len(r) for r in rows), failed)
+        if not failed and seconds >= SLOW_QUERY_SECONDS and engine is not None:
+            # only the round trip is timed, so every statement is offered with its latency
+            for i, (statement, parameters) in enumerate(statements, 1):
+                plan_capture.offer(engine, (label[0], f"{label[1]} [{i}/{len(statements)}]"),
+                                   statement, parameters, seconds)
+
+
+@contextmanager
+def timed_llm():
+    """Adds the enclosed LLM call to the request's Server-Timing."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        timing = _timing.get()
+        if timing is not None:
+            timing.llm += time.perf_counter() - t0
+
+
+# ─── Engine Events ───────────────────────────────────────────────
+@event.listens_for(Engine, "before_cursor_execute")
+def _start_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info["query_started"] = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _stop_timer(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.pop("query_started", None)
+    if started is None:
+        return
+    seconds, label = time.perf_counter() - started, query_label()
+    record_query(label, seconds, cursor.rowcount)
+    if seconds >= SLOW_QUERY_SECONDS and not executemany:
+        plan_capture.offer(conn.engine, label, statement, parameters, seconds)
+
+
+@event.listens_for(Engine, "handle_error")
+def _count_error(context):
+    conn = context.connection
+    started = conn.info.pop("query_started", None) if conn is not None else None
+    if started is not None:
+        record_query(query_label(), time.perf_counter() - started, failed=True)
+
+
+# ─── Request Timing ──────────────────────────────────────────────
+class TimedJSONResponse(JSONResponse):
+    """JSONResponse that books its render time on the request's timing."""
+
+    def render(self, content) -> bytes:
+        t0 = time.perf_counter()
+        body = super().render(content)
+        timing = _timing.get()
+        if timing is not None:
+            timing.render += time.perf_counter() - t0
+        return body
+
+
+def server_timing(timing: RequestTiming, total: float) -> str:
+    app = max(total - timing.db - timing.llm - timing.render, 0.0)
+    return ", ".join([
+        f'db;dur={timing.db * 1000:.1f};desc="{timing.queries} queries"',
+        f"llm;dur={timing.llm * 1000:.1f}",
+        f"render;dur={timing.render * 1000:.1f}",
+        f"app;dur={app * 1000:.1f}",
+        f"total;dur={total * 1000:.1f}",
+    ])
+
+
+class RequestTimingMiddleware:
+    """Times each /api request and reports the breakdown in a Server-Timing header."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope.get("path", "").startswith("/api"):
+            await self.app(scope, receive, send)
+            return
+
+        timing = RequestTiming()
+        token = _timing.set(timing)
+        t0 = time.perf_counter()
+        status = 500
+
+        async def timed_send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", server_timing(timing, time.perf_counter() - t0).encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, timed_send)
+        finally:
+            _timing.reset(token)
+            route = getattr(scope.get("route"), "path", None) or scope["path"]
+            with _lock:
+                _requests[(route, status)].observe(time.perf_counter() - t0)
+                for part in ("db", "llm", "render"):
+                    _request_parts[(route, part)] += getattr(timing, part)
+
+
+# ─── Prometheus Exposition ───────────────────────────────────────
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels_text(**labels) -> str:
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+def _histogram_lines(name: str, hist: Histogram, **labels) -> list[str]:
+    lines, cumulative = [], 0
+    for bound, n in zip(BUCKETS + (float("inf"),), hist.counts):
+        cumulative += n
+        le = "+Inf" if bound == float("inf") else repr(bound)
+        lines.append(f"{name}_bucket{_labels_text(**labels, le=le)} {cumulative}")
+    lines.append(f"{name}_sum{_labels_text(**labels)} {hist.sum}")
+    lines.append(f"{name}_count{_labels_text(**labels)} {hist.count}")
+    return lines
+
+
+def render_metrics() -> str:
+    from KPI.utils import admission, query_guard, replicas
+
+    out = [
+        "# HELP kpi_query_seconds SQL statement duration by KPI function and metric.",
+        "# TYPE kpi_query_seconds histogram",
+    ]
+    with _lock:
+        queries = {k: (v.seconds, v.rows, v.errors) for k, v in _queries.items()}
+        requests = dict(_requests)
+        parts = dict(_request_parts)
+    for (function, metric), (hist, _, _) in sorted(queries.items()):
+        out += _histogram_lines("kpi_query_seconds", hist, function=function, metric=metric)
+    out += ["# HELP kpi_query_rows_total Rows returned by SQL statements.", "# TYPE kpi_query_rows_total counter"]
+    out += [f"kpi_query_rows_total{_labels_text(function=f, metric=m)} {rows}"
+            for (f, m), (_, rows, _) in sorted(queries.items())]
+    out += ["# HELP kpi_query_errors_total Failed SQL statements.", "# TYPE kpi_query_errors_total counter"]
+    out += [f"kpi_query_errors_total{_labels_text(function=f, metric=m)} {errors}"
+            for (f, m), (_, _, errors) in sorted(queries.items())]
+
+    out += ["# HELP api_request_seconds Request duration by route and status.", "# TYPE api_request_seconds histogram"]
+    for (route, status), hist in sorted(requests.items()):
+        out += _histogram_lines("api_request_seconds", hist, route=route, status=status)
+    out += ["# HELP api_request_part_seconds_total Request time spent in db, llm and render.",
+            "# TYPE api_request_part_seconds_total counter"]
+    out += [f"api_request_part_seconds_total{_labels_text(route=r, part=p)} {v}" for (r, p), v in sorted(parts.items())]
+
+    out += ["# HELP query_guard_total Query deadline and cancellation counters by endpoint.",
+            "# TYPE query_guard_total counter"]
+    for endpoint, counters in sorted(query_guard.stats().items()):
+        out += [f"query_guard_total{_labels_text(endpoint=endpoint, counter=c)} {v}" for c, v in sorted(counters.items())]
+
+    gauges = ("limit", "queue_limit", "active", "queue_depth", "avg_seconds")
+    out += ["# HELP admission_state Admission control limits, active requests and queue depth by cost class.",
+            "# TYPE admission_state gauge"]
+    classes = admission.stats()
+    for cost, values in sorted(classes.items()):
+        out += [f"admission_state{_labels_text(cost_class=cost, field=g)} {values[g]}" for g in gauges]
+    out += ["# HELP admission_total Admitted, queued and rejected requests by cost class.", "# TYPE admission_total counter"]
+    for cost, values in sorted(classes.items()):
+        out += [f"admission_total{_labels_text(cost_class=cost, counter=c)} {v}"
+                for c, v in sorted(values.items()) if c not in gauges]
+
+    routing = replicas.stats()
+    out += ["# HELP db_replica_up Whether the replica answered its last lag check.", "# TYPE db_replica_up gauge"]
+    out += [f"db_replica_up{_labels_text(replica=name)} {int(r['up'])}" for name, r in sorted(routing["replicas"].items())]
+    out += ["# HELP db_replica_lag_seconds Age of the replica's newest transaction against the primary's.",
+            "# TYPE db_replica_lag_seconds gauge"]
+    out += [f"db_replica_lag_seconds{_labels_text(replica=name)} {r['lag_seconds']}"
+            for name, r in sorted(routing["replicas"].items()) if r["lag_seconds"] is not None]
+    out += ["# HELP db_read_route_total Requests by the engine they read from and why.", "# TYPE db_read_route_total counter"]
+    out += [f"db_read_route_total{_labels_text(target=r['target'], reason=r['reason'])} {r['requests']}"
+            for r in routing["routed"]]
+
+    from LLM import prompt_compaction
+
+    prompts = prompt_compaction.stats()
+    out += ["# HELP llm_prompt_tokens_total Insight prompt tokens before and after compaction, by template.",
+            "# TYPE llm_prompt_tokens_total counter"]
+    for template, totals in sorted(prompts.items()):
+        out += [f"llm_prompt_tokens_total{_labels_text(template=template, stage=stage)} {totals[f'tokens_{stage}']}"
+                for stage in ("before", "after")]
+    out += ["# HELP llm_prompts_total Insight prompts built, and those left over their token budget.",
+            "# TYPE llm_prompts_total counter"]
+    for template, totals in sorted(prompts.items()):
+        out += [f"llm_prompts_total{_labels_text(template=template, outcome=o)} {totals[k]}"
+                for o, k in (("built", "prompts"), ("over_budget", "over_budget"))]
+
+    from LLM import insight_cache
+
+    out += ["# HELP llm_insight_cache_total Insight cache hits (memory / db), misses, stores and uncached failures.",
+            "# TYPE llm_insight_cache_total counter"]
+    out += [f"llm_insight_cache_total{_labels_text(outcome=k)} {v}"
+            for k, v in sorted(insight_cache.stats().items()) if k not in ("enabled", "memory_entries")]
+
+    from LLM import insight_jobs
+
+    out += ["# HELP insight_jobs_total Background insight jobs enqueued (by source), done, retried and failed.",
+            "# TYPE insight_jobs_total counter"]
+    out += [f"insight_jobs_total{_labels_text(outcome=k)} {v}"
+            for k, v in sorted(insight_jobs.stats().items()) if k != "workers"]
+    return "\n".join(out) + "\n"
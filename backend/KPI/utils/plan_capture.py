@@ -0,0 +1,324 @@
+# backend/KPI/utils/plan_capture.py
+"""
+Slow-query plan capture and plan regression detection.
+
+The instrumentation hooks offer every statement slower than
+SLOW_QUERY_SECONDS here. The offer is sampled (PLAN_CAPTURE_SAMPLE, at most
+once per PLAN_CAPTURE_INTERVAL per query label), and the statement is then
+re-run with its parameters under EXPLAIN (ANALYZE, BUFFERS) on a background
+thread, off the request path. That thread uses a raw connection, so the
+EXPLAIN itself is never timed or captured.
+
+Each label (function, metric) keeps a known-good baseline plan and its
+latest plan, both stored in kpi_query_plans so they survive restarts. A new
+plan that shows no regression against the baseline becomes the baseline.
+One that does is kept as `latest` with its regressions until an admin
+accepts it.
+"""
+
+import json
+import queue
+import random
+import re
+import threading
+import time
+from collections import defaultdict
+from typing import Optional
+
+from sqlalchemy import text
+
+from config import (PLAN_CAPTURE_ENABLED, PLAN_CAPTURE_INTERVAL, PLAN_CAPTURE_SAMPLE,
+                    PLAN_CAPTURE_TIMEOUT, PLAN_MISESTIMATE_FACTOR, PLAN_SLOWDOWN_FACTOR)
+from DB.connector import is_replica, shared_engine
+
+SCHEMA_SQL = """
+    CREATE TABLE IF NOT EXISTS kpi_query_plans (
+        function    TEXT             NOT NULL,
+        metric      TEXT             NOT NULL,
+        kind        TEXT             NOT NULL,   -- 'baseline' | 'latest'
+        statement   TEXT             NOT NULL,
+        plan        JSONB            NOT NULL,   -- EXPLAIN (FORMAT JSON) output
+        seconds     DOUBLE PRECISION NOT NULL,   -- latency of the request's execution
+        regressions JSONB            NOT NULL DEFAULT '[]',
+        captured_at TIMESTAMPTZ      NOT NULL DEFAULT now(),
+        PRIMARY KEY (function, metric, kind)
+    )
+"""
+
+SELECT_ONLY = re.compile(r"^\s*(SELECT|WITH)\b", re.IGNORECASE)
+WRITES = re.compile(r"\b(INSERT|UPDATE|DELETE|MERGE|TRUNCATE|CREATE|ALTER|DROP)\b|\bFOR\s+UPDATE\b", re.IGNORECASE)
+INDEX_ACCESS = ("Index Scan", "Index Only Scan", "Bitmap Heap Scan", "Bitmap Index Scan")
+QUEUE_SIZE = 16
+MIN_SLOWDOWN_MS = 50  # ignore "slowdowns" of a few milliseconds
+
+_lock = threading.Lock()
+_queue: queue.Queue = queue.Queue(maxsize=QUEUE_SIZE)
+_worker: Optional[threading.Thread] = None
+_last_offer: dict = {}
+_plans: dict = {}          # (function, metric) → {"baseline": record, "latest": record}
+_loaded_from = set()       # engines whose stored plans were read in
+_counters: dict = defaultdict(int)
+
+
+# ─── Plan Summaries ──────────────────────────────────────────────
+def _walk(node: dict, depth: int = 0):
+    yield node, depth
+    for child in node.get("Plans", []):
+        yield from _walk(child, depth + 1)
+
+
+def summarize(plan: list) -> dict:
+    """Execution time, buffers and the node list of an EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) plan."""
+    root = plan[0]
+    nodes = []
+    for node, depth in _walk(root["Plan"]):
+        loops = node.get("Actual Loops", 1) or 1
+        nodes.append({
+            "depth": depth,
+            "node": node["Node Type"],
+            "relation": node.get("Relation Name"),
+            "index": node.get("Index Name"),
+            "estimated_rows": node.get("Plan Rows", 0) * loops,  # Plan Rows is per loop
+            "actual_rows": node.get("Actual Rows", 0) * loops,
+        })
+    return {
+        "execution_ms": root.get("Execution Time"),
+        "planning_ms": root.get("Planning Time"),
+        "shared_hit_blocks": root["Plan"].get("Shared Hit Blocks"),
+        "shared_read_blocks": root["Plan"].get("Shared Read Blocks"),
+        "nodes": nodes,
+    }
+
+
+def _misestimate(node: dict) -> float:
+    estimated, actual = max(node["estimated_rows"], 1), max(node["actual_rows"], 1)
+    return max(estimated / actual, actual / estimated)
+
+
+def _access(nodes: list) -> dict:
+    """relation → set of access node types (with the index name for index access)."""
+    methods: dict = defaultdict(set)
+    for n in nodes:
+        if n["relation"]:
+            methods[n["relation"]].add(f"{n['node']} using {n['index']}" if n["index"] else n["node"])
+    return methods
+
+
+def compare(baseline: dict, latest: dict) -> list[str]:
+    """Regressions of `latest` against `baseline` (both summaries)."""
+    found = []
+
+    before, after = _access(baseline["nodes"]), _access(latest["nodes"])
+    for relation, methods in after.items():
+        had_index = any(m.startswith(INDEX_ACCESS) for m in before.get(relation, ()))
+        has_index = any(m.startswith(INDEX_ACCESS) for m in methods)
+        if had_index and not has_index and "Seq Scan" in methods:
+            found.append(f"{relation}: {', '.join(sorted(before[relation]))} became Seq Scan")
+
+    worst_before = max((_misestimate(n) for n in baseline["nodes"]), default=1.0)
+    worst = max(latest["nodes"], key=_misestimate, default=None)
+    if worst is not None and _misestimate(worst) >= PLAN_MISESTIMATE_FACTOR and _misestimate(worst) > 2 * worst_before:
+        where = f" on {worst['relation']}" if worst["relation"] else ""
+        found.append(f"row estimate off {_misestimate(worst):.0f}x at {worst['node']}{where} "
+                     f"(estimated {worst['estimated_rows']:.0f}, actual {worst['actual_rows']:.0f})")
+
+    was, now = baseline.get("execution_ms") or 0, latest.get("execution_ms") or 0
+    if now >= PLAN_SLOWDOWN_FACTOR * was and now - was >= MIN_SLOWDOWN_MS:
+        found.append(f"execution {now / max(was, 0.001):.1f}x slower ({was:.0f} ms → {now:.0f} ms)")
+    return found
+
+
+def _shape(summary: dict) -> list:
+    return [(n["depth"], n["node"], n["relation"], n["index"]) for n in summary["nodes"]]
+
+
+# ─── Store ───────────────────────────────────────────────────────
+def _record(statement: str, plan: list, seconds: float, regressions: list, captured_at: float) -> dict:
+    return {"statement": statement, "plan": plan, "summary": summarize(plan), "seconds": seconds,
+            "regressions": regressions, "captured_at": captured_at}
+
+
+def _load(engine):
+    """Reads the stored plans into memory once per engine."""
+    if engine in _loaded_from:
+        return
+    with engine.begin() as conn:
+        conn.execute(text(SCHEMA_SQL))
+        rows = conn.execute(text("""
+            SELECT function, metric, kind, statement, plan, seconds, regressions,
+                   EXTRACT(EPOCH FROM captured_at) AS captured_at
+              FROM kpi_query_plans
+        """)).mappings().all()
+    with _lock:
+        for r in rows:
+            plan = json.loads(r["plan"]) if isinstance(r["plan"], str) else r["plan"]
+            regressions = json.loads(r["regressions"]) if isinstance(r["regressions"], str) else r["regressions"]
+            _plans.setdefault((r["function"], r["metric"]), {}).setdefault(
+                r["kind"], _record(r["statement"], plan, r["seconds"], regressions, float(r["captured_at"])))
+        _loaded_from.add(engine)
+
+
+def _save(engine, label: tuple, kind: str, record: dict):
+    with engine.begin() as conn:
+        conn.execute(text("""
+            INSERT INTO kpi_query_plans (function, metric, kind, statement, plan, seconds, regressions, captured_at)
+            VALUES (:f, :m, :kind, :statement, CAST(:plan AS JSONB), :seconds, CAST(:regressions AS JSONB),
+                    to_timestamp(:captured_at))
+            ON CONFLICT (function, metric, kind) DO UPDATE
+               SET statement = EXCLUDED.statement, plan = EXCLUDED.plan, seconds = EXCLUDED.seconds,
+                   regressions = EXCLUDED.regressions, captured_at = EXCLUDED.captured_at
+        """), {"f": label[0], "m": label[1], "kind": kind, "statement": record["statement"],
+               "plan": json.dumps(record["plan"]), "seconds": record["seconds"],
+               "regressions": json.dumps(record["regressions"]), "captured_at": record["captured_at"]})
+
+
+# ─── Capture ─────────────────────────────────────────────────────
+def explain(engine, statement: str, parameters) -> list:
+    """EXPLAIN (ANALYZE, BUFFERS) of a driver-level statement, on a raw connection that is rolled back."""
+    raw = engine.raw_connection()
+    try:
+        cur = raw.cursor()
+        try:
+            cur.execute(f"SET LOCAL statement_timeout = {int(PLAN_CAPTURE_TIMEOUT * 1000)}")
+            cur.execute("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + statement, parameters)
+            plan = cur.fetchone()[0]
+        finally:
+            cur.close()
+        return json.loads(plan) if isinstance(plan, str) else plan
+    finally:
+        raw.rollback()
+        raw.close()
+
+
+def capture(engine, label: tuple, statement: str, parameters, seconds: float) -> dict:
+    """
+    Captures the statement's plan on the engine it ran on, compares it with
+    the label's baseline and stores it (on the primary when that was a replica).
+    """
+    store = shared_engine() if is_replica(engine) else engine
+    _load(store)
+    record = _record(statement, explain(engine, statement, parameters), seconds, [], time.time())
+    with _lock:
+        entry = _plans.setdefault(label, {})
+        baseline = entry.get("baseline")
+        if baseline is not None:
+            record["regressions"] = compare(baseline["summary"], record["summary"])
+        entry["latest"] = record
+        promote = not record["regressions"]
+        if promote:
+            entry["baseline"] = record
+        _counters["captured"] += 1
+        _counters["regressions"] += bool(record["regressions"])
+    _save(store, label, "latest", record)
+    if promote:
+        _save(store, label, "baseline", record)
+    return record
+
+
+def _run():
+    while True:
+        engine, label, statement, parameters, seconds = _queue.get()
+        try:
+            capture(engine, label, statement, parameters, seconds)
+        except Exception as e:
+            with _lock:
+                _counters["failed"] += 1
+            print(f"🔴 Plan capture failed for {label}: {e}")
+
+
+def offer(engine, label: tuple, statement: str, parameters, seconds: float):
+    """Called for each slow statement; queues a sampled, rate-limited plan capture."""
+    global _worker
+    if not PLAN_CAPTURE_ENABLED or not SELECT_ONLY.match(statement) or WRITES.search(statement):
+        return
+    if label[0].startswith(f"{__name__.rsplit('.', 1)[-1]}."):
+        return  # the plan store's own reads
+    now = time.monotonic()
+    with _lock:
+        _counters["slow"] += 1
+        last = _last_offer.get(label)
+        if (last is not None and now - last < PLAN_CAPTURE_INTERVAL) or random.random() >= PLAN_CAPTURE_SAMPLE:
+            return
+        _last_offer[label] = now
+        if _worker is None:
+            _worker = threading.Thread(target=_run, name="plan-capture", daemon=True)
+            _worker.start()
+    try:
+        _queue.put_nowait((engine, label, statement, parameters, seconds))
+    except queue.Full:
+        _counters["dropped"] += 1
+
+
+# ─── Reports ─────────────────────────────────────────────────────
+def _brief(record: Optional[dict]) -> Optional[dict]:
+    if record is None:
+        return None
+    summary = record["summary"]
+    return {
+        "captured_at": record["captured_at"],
+        "request_seconds": round(record["seconds"], 4),
+        "execution_ms": summary["execution_ms"],
+        "shared_hit_blocks": summary["shared_hit_blocks"],
+        "shared_read_blocks": summary["shared_read_blocks"],
+        "nodes": [f"{'  ' * n['depth']}{n['node']}"
+                  + (f" using {n['index']}" if n["index"] else "")
+                  + (f" on {n['relation']}" if n["relation"] else "")
+                  + f" (rows {n['estimated_rows']:.0f} est / {n['actual_rows']:.0f} actual)"
+                  for n in summary["nodes"]],
+        "regressions": record["regressions"],
+    }
+
+
+def report(engine=None, regressed_only: bool = False) -> list[dict]:
+    """Per label: baseline and latest plan briefs and the latest plan's regressions."""
+    if engine is not None:
+        _load(engine)
+    with _lock:
+        entries = sorted(_plans.items())
+    out = []
+    for (function, metric), entry in entries:
+        latest, baseline = entry.get("latest"), entry.get("baseline")
+        regressions = latest["regressions"] if latest else []
+        if regressed_only and not regressions:
+            continue
+        out.append({
+            "function": function,
+            "metric": metric,
+            "regressed": bool(regressions),
+            "plan_changed": bool(latest and baseline and _shape(latest["summary"]) != _shape(baseline["summary"])),
+            "baseline": _brief(baseline),
+            "latest": _brief(latest),
+        })
+    return out
+
+
+def plan_detail(label: tuple, engine=None) -> Optional[dict]:
+    """The full stored EXPLAIN output and statement of a label's baseline and latest plans."""
+    if engine is not None:
+        _load(engine)
+    with _lock:
+        entry = _plans.get(label)
+    if entry is None:
+        return None
+    return {kind: {"statement": r["statement"], "plan": r["plan"], "regressions": r["regressions"]}
+            for kind, r in entry.items()}
+
+
+def accept(label: tuple, engine) -> bool:
+    """Makes the label's latest plan its known-good baseline; False if there is none."""
+    _load(engine)
+    with _lock:
+        entry = _plans.get(label)
+        if not entry or "latest" not in entry:
+            return False
+        latest = dict(entry["latest"], regressions=[])
+        entry["latest"] = entry["baseline"] = latest
+    _save(engine, label, "latest", latest)
+    _save(engine, label, "baseline", latest)
+    return True
+
+
+def stats() -> dict:
+    """slow (offered) statements, captured plans, regressions found, failed and dropped captures."""
+    with _lock:
+        return {"labels": len(_plans), "queued": _queue.qsize(), **_counters}
@@ -0,0 +1,176 @@
+# backend/KPI/utils/prefix_index.py
+"""
+Prefix-sum index over daily aggregates of the additive KPI queries.
+
+The first time a query (SQL text + non-window params such as the merchant)
+is asked for, it is run once grouped by day over the last PREFIX_INDEX_DAYS
+closed days, and each SUM/COUNT component is kept per key as a cumulative
+array over those days. Any `[start, end]` inside the indexed history is then
+two lookups — cum[end + 1] - cum[start] — instead of a scan, whatever the
+filter or custom range. Days that close later are appended on the next
+access; the still-open days (today) are always read live.
+
+Entries are built and extended in the background, on their own connection
+and outside the request's deadline; until an entry covers a day, requests
+read that day through the wrapped backend instead of waiting for the build.
+"""
+
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from typing import Optional
+
+import numpy as np
+
+from config import PREFIX_INDEX_DAYS, PREFIX_INDEX_MAX_ENTRIES
+from DB.connector import reading_from, routed_engine
+from KPI.utils.query_backend import _as_date, merge_additive
+from KPI.utils.window_batch import add_group_column, day_column
+
+DAY = "index_day"
+ROWS = "index_rows"
+
+
+def daily_sql(sql: str) -> Optional[str]:
+    """The additive query grouped additionally by day, with a row count per group."""
+    column = day_column(sql)
+    if column is None:
+        return None
+    grouped = add_group_column(sql, column, DAY)
+    return grouped and grouped.replace(f"AS {DAY},", f"AS {DAY}, COUNT(*) AS {ROWS},", 1)
+
+
+class _Entry:
+    """Cumulative sums of one query: state is replaced whole, so readers never see a half-extended index."""
+
+    def __init__(self, first_day: date, keys: tuple):
+        self.keys = keys
+        self.building = False
+        # (closed_through, key tuples, {key tuple: column}, components, cum[n_days + 1, n_keys, n_components])
+        self.state = (first_day - timedelta(days=1), [], {}, None, np.zeros((1, 0, 0)))
+        self.first_day = first_day
+
+    @property
+    def closed_through(self) -> date:
+        return self.state[0]
+
+    @property
+    def ready(self) -> bool:
+        """False until a row has revealed the query's component columns."""
+        return self.state[3] is not None
+
+    def extend(self, rows: list, through: date):
+        closed, key_list, key_index, components, cum = self.state
+        key_list, key_index = list(key_list), dict(key_index)
+        n_new = (through - closed).days
+
+        if components is None and rows:
+            components = [c for c in rows[0] if c not in self.keys and c != DAY]
+        for r in rows:
+            k = tuple(r[c] for c in self.keys)
+            if k not in key_index:
+                key_index[k] = len(key_list)
+                key_list.append(k)
+
+        daily = np.zeros((n_new, len(key_list), len(components or ())))
+        for r in rows:
+            offset = (_as_date(r[DAY]) - closed).days - 1
+            daily[offset, key_index[tuple(r[c] for c in self.keys)]] = [float(r[c] or 0) for c in components]
+
+        if cum.shape[1] < len(key_list) or cum.shape[2] < daily.shape[2]:
+            cum = np.pad(cum, ((0, 0), (0, len(key_list) - cum.shape[1]), (0, daily.shape[2] - cum.shape[2])))
+        cum = np.concatenate([cum, cum[-1] + np.cumsum(daily, axis=0)])
+        self.state = (through, key_list, key_index, components, cum)
+
+    def range_rows(self, start: date, end: date) -> list[dict]:
+        _, key_list, _, components, cum = self.state
+        i = (start - self.first_day).days
+        j = (end - self.first_day).days + 1
+        sums = cum[j] - cum[i]
+        if not self.keys:
+            # an ungrouped aggregate always yields one row, even over no data
+            row = dict(zip(components, (sums[0] if key_list else np.zeros(len(components))).tolist()))
+            row.pop(ROWS)
+            return [row]
+        out = []
+        for k, values in zip(key_list, sums):
+            row = dict(zip(components, values.tolist()))
+            if row.pop(ROWS):
+                out.append({**dict(zip(self.keys, k)), **row})
+        return out
+
+
+class PrefixSumBackend:
+    """
+    Wraps another backend: closed days inside the indexed history come from
+    the prefix sums, everything else (open days, older windows, queries with
+    date-valued params or an unsupported shape) from `inner`.
+    """
+
+    name = "prefix"
+
+    def __init__(self, inner, days: int = PREFIX_INDEX_DAYS, max_entries: int = PREFIX_INDEX_MAX_ENTRIES):
+        self.inner = inner
+        self.days = days
+        self.max_entries = max_entries
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self._builder = ThreadPoolExecutor(max_workers=2, thread_name_prefix="prefix-index")
+
+    def first_day(self, today: Optional[date] = None) -> date:
+        return (today or date.today()) - timedelta(days=self.days)
+
+    def covers(self, start) -> bool:
+        return _as_date(start) >= self.first_day()
+
+    def _entry(self, sql: str, daily: str, params: dict, keys: tuple) -> _Entry:
+        """The query's entry; queues a background extension if days closed since its last one."""
+        cache_key = (sql, keys, tuple(sorted((k, v) for k, v in params.items() if k not in ("s", "e"))))
+        through = date.today() - timedelta(days=1)
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is None:
+                entry = self._entries[cache_key] = _Entry(self.first_day(), keys)
+            self._entries.move_to_end(cache_key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            extend = entry.closed_through < through and not entry.building
+            if extend:
+                entry.building = True
+        if extend:
+            # a plain thread context: no request deadline, but the request's server (primary or replica)
+            self._builder.submit(self._extend, routed_engine(), entry, daily, params, keys, through)
+        return entry
+
+    def _extend(self, engine, entry: _Entry, daily: str, params: dict, keys: tuple, through: date):
+        try:
+            closed = entry.closed_through
+            with reading_from(engine), engine.connect() as conn:
+                rows = self.inner.fetch_additive(conn, daily, {**params, "s": closed + timedelta(days=1),
+                                                               "e": through}, keys + (DAY,))
+            entry.extend(rows, through)
+        except Exception as e:
+            print(f"🔴 Prefix index build failed: {e}")
+        finally:
+            with self._lock:
+                entry.building = False
+
+    def fetch_additive(self, conn, sql: str, params: dict, keys: tuple = ()) -> list[dict]:
+        start, end = _as_date(params["s"]), _as_date(params["e"])
+        daily = daily_sql(sql)
+        # date-valued params make the query window-relative (e.g. a CASE on window bounds)
+        relative = any(isinstance(v, date) for k, v in params.items() if k not in ("s", "e"))
+        if daily is None or relative or start < self.first_day():
+            return self.inner.fetch_additive(conn, sql, params, keys)
+
+        entry = self._entry(sql, daily, params, keys)
+        if not entry.ready:  # not built yet (or no rows), so the result's columns are unknown
+            return self.inner.fetch_additive(conn, sql, params, keys)
+        closed = entry.closed_through
+        parts = []
+        if start <= closed:
+            parts.append(entry.range_rows(start, min(end, closed)))
+        if end > closed:
+            parts.append(self.inner.fetch_additive(conn, sql, {**params, "s": max(start, closed + timedelta(days=1))}, keys))
+        return merge_additive(parts, keys)
@@ -0,0 +1,314 @@
+# backend/KPI/utils/profiler.py
+"""
+Sampling profiler for live requests.
+
+A Sampler thread reads every thread's stack (sys._current_frames) at a
+fixed interval and adds the time since its previous tick to each stack. This
+costs one stack walk per thread per tick and nothing between ticks.
+
+Per request: an admin request carrying `X-Profile: 1` (or ?profile=1) is
+sampled while its route's handler runs. Only the thread running that
+request's handler is sampled, from the handler's frame down, so concurrent
+requests to the same route stay out of it and the profile shows the Python
+work beneath the handler:
+row-to-dict conversion, Decimal rounding, prompt building, tiktoken. The
+result is stored as a speedscope profile, and the response's X-Profile
+header gives its URL under /api/admin/profiles.
+
+Continuous: a long-running Sampler at PROFILE_CONTINUOUS_INTERVAL
+aggregates the stacks of every thread that is inside app code (API, KPI,
+DB, LLM) into hot-frame totals across requests.
+"""
+
+import functools
+import hmac
+import inspect
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from contextvars import ContextVar
+from typing import Optional
+from urllib.parse import parse_qs
+
+from config import (ADMIN_TOKEN, PROFILE_CONTINUOUS, PROFILE_CONTINUOUS_INTERVAL,
+                    PROFILE_INTERVAL, PROFILE_KEEP)
+
+APP_MODULES = ("API.", "KPI.", "DB.", "LLM.")
+
+_samplers: set = set()      # thread idents of running samplers, never sampled themselves
+_profiles: OrderedDict = OrderedDict()
+_profiles_lock = threading.Lock()
+_continuous: Optional["Sampler"] = None
+# idents of the threads running a profiled request's handler; set per request
+# by ProfilingMiddleware and filled in by the handler wrappers
+_handler_threads: ContextVar[Optional[set]] = ContextVar("profiled_handler_threads", default=None)
+
+
+# ─── Sampling ────────────────────────────────────────────────────
+def _frame_key(frame) -> tuple:
+    code = frame.f_code
+    return getattr(code, "co_qualname", code.co_name), code.co_filename, code.co_firstlineno
+
+
+def _stack(frame, root_code=None) -> Optional[tuple]:
+    """
+    Root-to-leaf frame keys of a thread's stack, starting at the frame running
+    `root_code` or, without one, at the outermost app frame. Returns None if
+    there is no such frame (idle pool threads, the event loop waiting).
+    """
+    frames, root = [], None
+    while frame is not None:
+        frames.append(frame)
+        if root_code is not None:
+            if frame.f_code is root_code:
+                root = len(frames)
+                break
+        elif frame.f_globals.get("__name__", "").startswith(APP_MODULES):
+            root = len(frames)
+        frame = frame.f_back
+    if root is None:
+        return None
+    return tuple(_frame_key(f) for f in reversed(frames[:root]))
+
+
+class Sampler(threading.Thread):
+    """
+    Samples all threads every `interval` seconds into {stack: seconds}. With
+    `root`, a callable returning a code object (or None while it is not yet
+    known), only stacks running that code are kept. With `threads`, a set of
+    thread idents filled in while sampling, only those threads are sampled.
+    """
+
+    def __init__(self, interval: float, root=None, threads: Optional[set] = None, name: str = "profiler"):
+        super().__init__(name=name, daemon=True)
+        self.interval = interval
+        self.root = root
+        self.threads = threads
+        self.samples: Counter = Counter()
+        self.ticks = 0
+        self.started_at = time.time()
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        _samplers.add(threading.get_ident())
+        try:
+            last = time.perf_counter()
+            while not self._stop_event.wait(self.interval):
+                now = time.perf_counter()
+                elapsed, last = now - last, now
+                root_code = self.root() if self.root is not None else None
+                if self.root is not None and root_code is None:
+                    continue
+                threads = set(self.threads) if self.threads is not None else None
+                stacks = [_stack(frame, root_code) for ident, frame in sys._current_frames().items()
+                          if ident not in _samplers and (threads is None or ident in threads)]
+                with self._lock:
+                    self.ticks += 1
+                    for stack in stacks:
+                        if stack:
+                            self.samples[stack] += elapsed
+        finally:
+            _samplers.discard(threading.get_ident())
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+    def snapshot(self) -> Counter:
+        with self._lock:
+            return Counter(self.samples)
+
+    def reset(self):
+        with self._lock:
+            self.samples.clear()
+            self.ticks = 0
+            self.started_at = time.time()
+
+
+# ─── Output Formats ──────────────────────────────────────────────
+def speedscope(samples: Counter, name: str) -> dict:
+    """A speedscope "sampled" profile (https://www.speedscope.app) of {stack: seconds}."""
+    frames, index, stacks, weights = [], {}, [], []
+    for stack, seconds in samples.items():
+        ids = []
+        for key in stack:
+            if key not in index:
+                index[key] = len(frames)
+                frames.append({"name": key[0], "file": key[1], "line": key[2]})
+            ids.append(index[key])
+        stacks.append(ids)
+        weights.append(seconds)
+    return {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "name": name,
+        "exporter": "kpi-profiler",
+        "shared": {"frames": frames},
+        "profiles": [{"type": "sampled", "name": name, "unit": "seconds", "startValue": 0,
+                      "endValue": sum(weights), "samples": stacks, "weights": weights}],
+    }
+
+
+def hot_frames(samples: Counter, limit: int = 30) -> list[dict]:
+    """Frames by self time (leaf of the stack) with their inclusive time, as seconds and % of samples."""
+    own, inclusive = Counter(), Counter()
+    for stack, seconds in samples.items():
+        own[stack[-1]] += seconds
+        for key in set(stack):
+            inclusive[key] += seconds
+    total = sum(samples.values()) or 1.0
+    return [{"function": key[0], "file": key[1], "line": key[2],
+             "self_seconds": round(seconds, 4), "self_pct": round(100 * seconds / total, 2),
+             "total_seconds": round(inclusive[key], 4), "total_pct": round(100 * inclusive[key] / total, 2)}
+            for key, seconds in own.most_common(limit)]
+
+
+# ─── Per-Request Profiles ────────────────────────────────────────
+def _profile_requested(scope) -> bool:
+    headers = dict(scope.get("headers", []))
+    params = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+    wanted = headers.get(b"x-profile", b"").decode("latin-1") or params.get("profile", [""])[0]
+    if wanted.lower() not in ("1", "true", "yes"):
+        return False
+    token = headers.get(b"x-admin-token", b"").decode("latin-1") or params.get("admin_token", [""])[0]
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(token, ADMIN_TOKEN)
+
+
+def _endpoint_code(scope):
+    """Code object of the request's handler, once the router has put it in the scope."""
+    endpoint = scope.get("endpoint")
+    return getattr(inspect.unwrap(endpoint), "__code__", None) if endpoint is not None else None
+
+
+def _pinned(endpoint):
+    """Wraps a handler so it records its thread for a profiled request's sampler."""
+    if inspect.iscoroutinefunction(endpoint):
+        @functools.wraps(endpoint)
+        async def pinned(*args, **kwargs):
+            threads = _handler_threads.get()
+            if threads is not None:
+                threads.add(threading.get_ident())
+            return await endpoint(*args, **kwargs)
+    else:
+        @functools.wraps(endpoint)
+        def pinned(*args, **kwargs):
+            threads = _handler_threads.get()
+            if threads is not None:
+                threads.add(threading.get_ident())
+            return endpoint(*args, **kwargs)
+    return pinned
+
+
+def pin_handler_threads(app):
+    """
+    Wraps every API route's handler with `_pinned`. Sync handlers run on a
+    threadpool thread with a copy of the request's context, so the wrapper
+    sees the set ProfilingMiddleware put there and adds that thread to it.
+    """
+    for route in app.routes:
+        dependant = getattr(route, "dependant", None)
+        if dependant is not None and dependant.call is not None:
+            dependant.call = _pinned(dependant.call)
+
+
+def _store(profile_id: str, scope, sampler: Sampler, seconds: float):
+    path = scope["path"] + ("?" + scope["query_string"].decode("latin-1") if scope.get("query_string") else "")
+    samples = sampler.snapshot()
+    with _profiles_lock:
+        _profiles[profile_id] = {
+            "id": profile_id, "path": path, "started_at": sampler.started_at, "seconds": round(seconds, 4),
+            "samples": sampler.ticks, "profile": speedscope(samples, path), "hot_frames": hot_frames(samples, 15),
+        }
+        while len(_profiles) > PROFILE_KEEP:
+            _profiles.popitem(last=False)
+
+
+def profiles() -> list[dict]:
+    """The stored per-request profiles, newest first, without their speedscope payloads."""
+    with _profiles_lock:
+        return [{k: v for k, v in p.items() if k != "profile"} for p in reversed(_profiles.values())]
+
+
+def get_profile(profile_id: str) -> Optional[dict]:
+    with _profiles_lock:
+        return _profiles.get(profile_id)
+
+
+class ProfilingMiddleware:
+    """Samples the handler of admin requests that ask for a profile."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope.get("path", "").startswith("/api") or not _profile_requested(scope):
+            await self.app(scope, receive, send)
+            return
+        profile_id = uuid.uuid4().hex[:12]
+        # the router adds the handler to this same scope dict when it dispatches;
+        # the handler's wrapper adds its thread to `threads` (see pin_handler_threads)
+        threads = set()
+        token = _handler_threads.set(threads)
+        sampler = Sampler(PROFILE_INTERVAL, lambda: _endpoint_code(scope), threads,
+                          name=f"profiler-{profile_id}")
+        t0 = time.perf_counter()
+        sampler.start()
+
+        def finish():
+            if sampler.is_alive():
+                sampler.stop()
+                _store(profile_id, scope, sampler, time.perf_counter() - t0)
+
+        async def profiled_send(message):
+            if message["type"] == "http.response.start":
+                finish()  # the handler has returned; serialization is not part of the profile
+                message = {**message, "headers": [*message.get("headers", []),
+                                                  (b"x-profile", f"/api/admin/profiles/{profile_id}".encode())]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, profiled_send)
+        finally:
+            finish()
+            _handler_threads.reset(token)
+
+
+# ─── Continuous Mode ─────────────────────────────────────────────
+def set_continuous(enabled: bool, interval: float = PROFILE_CONTINUOUS_INTERVAL) -> Optional[Sampler]:
+    """Starts (or stops) the continuous sampler; starting keeps an already running one."""
+    global _continuous
+    if not enabled:
+        if _continuous is not None:
+            _continuous.stop()
+            _continuous = None
+        return None
+    if _continuous is None:
+        _continuous = Sampler(interval, name="profiler-continuous")
+        _continuous.start()
+    return _continuous
+
+
+def start_continuous_profiler() -> Optional[Sampler]:
+    """Background sampler for the hot-frame report; no-op unless PROFILE_CONTINUOUS."""
+    return set_continuous(True) if PROFILE_CONTINUOUS else None
+
+
+def continuous_report(limit: int = 30) -> dict:
+    sampler = _continuous
+    if sampler is None:
+        return {"running": False, "hot_frames": []}
+    samples = sampler.snapshot()
+    return {"running": True, "interval": sampler.interval, "since": sampler.started_at, "ticks": sampler.ticks,
+            "sampled_seconds": round(sum(samples.values()), 3), "hot_frames": hot_frames(samples, limit)}
+
+
+def continuous_speedscope() -> Optional[dict]:
+    sampler = _continuous
+    return speedscope(sampler.snapshot(), "continuous") if sampler is not None else None
+
+
+def reset_continuous():
+    if _continuous is not None:
+        _continuous.reset()
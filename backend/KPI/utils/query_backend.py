@@ -0,0 +1,317 @@
+# backend/KPI/utils/query_backend.py
+
+import copy
+import functools
+import os
+import re
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import date, datetime, timedelta
+from typing import Iterable, Optional
+
+from sqlalchemy import text
+
+from config import KPI_QUERY_BACKEND, PARQUET_DIR, PREFIX_INDEX_ENABLED, SHARD_ENABLED
+
+
+def _as_date(value) -> date:
+    return value.date() if isinstance(value, datetime) else value
+
+
+def _sql_literal(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+def to_pyformat_sql(sql: str) -> str:
+    """:name → %(name)s (but not ::casts), with literal % escaped, for raw DB-API cursors."""
+    return re.sub(r"(?<![:\w]):(\w+)", r"%(\1)s", sql.replace("%", "%%"))
+
+
+def merge_additive(parts: Iterable[list], keys: tuple = ()) -> list[dict]:
+    """
+    Merges result sets whose non-key columns are all additive (SUM / COUNT).
+    Rows with the same key tuple are summed column-wise; NULL counts as 0.
+    First-seen key order is kept so callers can still rely on ORDER BY.
+    """
+    merged: dict[tuple, dict] = {}
+    for rows in parts:
+        for row in rows:
+            row = dict(row)
+            k = tuple(row[c] for c in keys)
+            acc = merged.get(k)
+            if acc is None:
+                merged[k] = {c: (v if c in keys else float(v or 0)) for c, v in row.items()}
+                continue
+            for c, v in row.items():
+                if c not in keys:
+                    acc[c] += float(v or 0)
+    return list(merged.values())
+
+
+class PostgresBackend:
+    """Answers additive KPI queries straight from live_transactions."""
+
+    name = "postgres"
+
+    def fetch_additive(self, conn, sql: str, params: dict, keys: tuple = ()) -> list[dict]:
+        rows = conn.execute(text(sql), params).mappings().all()
+        return merge_additive([rows], keys)
+
+    def fetch_additive_many(self, conn, queries: list) -> list[list[dict]]:
+        rows = self.rows_many(conn, [(sql, params) for sql, params, _ in queries])
+        return [merge_additive([r], keys) for r, (_, _, keys) in zip(rows, queries)]
+
+    @staticmethod
+    def rows_many(conn, statements: list) -> list[list]:
+        """
+        Raw rows of several independent `(sql, params)` statements. On psycopg 3
+        they are sent in one pipeline as server-side prepared statements: one
+        round trip, and a statement repeated in the same transaction (a page's
+        current and comparison totals) is parsed and planned once per pooled
+        connection: read-only transactions end with COMMIT on psycopg 3
+        engines (DB.connector), so its prepared statements survive checkouts.
+        Other drivers run the statements one after another.
+        """
+        raw = conn.connection.driver_connection
+        if not hasattr(raw, "pipeline") or len(statements) < 2:
+            return [conn.execute(text(sql), params).mappings().all() for sql, params in statements]
+
+        from psycopg.rows import dict_row
+        from KPI.utils.instrumentation import timed_statements
+        from KPI.utils.query_guard import guarded
+
+        if not conn.in_transaction():
+            conn.begin()  # so the engine's begin hooks (statement_timeout) still run
+        cursors, results = [], []
+        statements = [(to_pyformat_sql(sql), params) for sql, params in statements]
+        try:
+            # the pipeline bypasses the engine events, so it is timed (and offered for plan capture) as one round trip
+            with timed_statements(results, conn.engine, statements):
+                with guarded(raw), raw.pipeline():
+                    for sql, params in statements:
+                        cur = raw.cursor(row_factory=dict_row)
+                        cur.execute(sql, params, prepare=True)
+                        cursors.append(cur)
+                results += [cur.fetchall() for cur in cursors]
+            return results
+        finally:
+            for cur in cursors:
+                cur.close()
+
+
+class HybridBackend(PostgresBackend):
+    """
+    Splits the `[:s, :e]` window of an additive query at the export watermark:
+    closed days are scanned by an in-process DuckDB over the Parquet export,
+    the remaining (open) days by Postgres, and both partial results merged.
+    """
+
+    name = "hybrid"
+
+    def __init__(self, parquet_dir: str = PARQUET_DIR):
+        import duckdb
+
+        self.parquet_dir = parquet_dir
+        self._duck = duckdb.connect(database=":memory:")
+        self._lock = threading.Lock()
+        self._manifest_mtime = None
+        self._closed_through: Optional[date] = None
+
+    def closed_through(self) -> Optional[date]:
+        from DB.parquet_export import MANIFEST, read_manifest
+
+        path = os.path.join(self.parquet_dir, MANIFEST)
+        mtime = os.path.getmtime(path) if os.path.exists(path) else None
+        if mtime != self._manifest_mtime:
+            value = read_manifest(self.parquet_dir).get("closed_through")
+            self._closed_through = date.fromisoformat(value) if value else None
+            self._manifest_mtime = mtime
+        return self._closed_through
+
+    @staticmethod
+    def to_duckdb_sql(sql: str) -> str:
+        # :name → $name (but not ::casts), and Postgres' 8-byte float spelling
+        sql = re.sub(r"(?<![:\w]):(\w+)", r"$\1", sql)
+        return re.sub(r"::float\b", "::DOUBLE", sql, flags=re.IGNORECASE)
+
+    def _scan_parquet(self, sql: str, params: dict, start: date, end: date) -> list[dict]:
+        from DB.parquet_export import day_path
+
+        files = []
+        day = start
+        while day <= end:
+            path = day_path(self.parquet_dir, day)
+            if os.path.exists(path):
+                files.append(path)
+            day += timedelta(days=1)
+        if not files:
+            return []
+
+        with self._lock:
+            cur = self._duck.cursor()
+        try:
+            # DDL cannot take bound parameters, so file paths are inlined as literals
+            cur.execute("CREATE OR REPLACE TEMP VIEW live_transactions AS "
+                        f"SELECT * FROM read_parquet([{', '.join(map(_sql_literal, files))}])")
+            for dim in ("acquirer", "merchant"):
+                dim_path = os.path.join(self.parquet_dir, f"{dim}.parquet")
+                if os.path.exists(dim_path):
+                    cur.execute(f"CREATE OR REPLACE TEMP VIEW {dim} AS SELECT * FROM read_parquet({_sql_literal(dim_path)})")
+
+            used = set(re.findall(r"(?<![:\w]):(\w+)", sql))
+            cur.execute(self.to_duckdb_sql(sql), {k: v for k, v in params.items() if k in used})
+            columns = [d[0] for d in cur.description]
+            return [dict(zip(columns, row)) for row in cur.fetchall()]
+        finally:
+            cur.close()
+
+    def fetch_additive(self, conn, sql: str, params: dict, keys: tuple = ()) -> list[dict]:
+        start, end = _as_date(params["s"]), _as_date(params["e"])
+        closed = self.closed_through()
+        if closed is None or start > closed:
+            return super().fetch_additive(conn, sql, params, keys)
+
+        hist_end = min(end, closed)
+        parts = [self._scan_parquet(sql, {**params, "s": start, "e": hist_end}, start, hist_end)]
+        if end > closed:
+            live = {**params, "s": closed + timedelta(days=1), "e": end}
+            parts.append(conn.execute(text(sql), live).mappings().all())
+        return merge_additive(parts, keys)
+
+    def fetch_additive_many(self, conn, queries: list) -> list[list[dict]]:
+        closed = self.closed_through()
+        parts, live = [], []
+        for i, (sql, params, _) in enumerate(queries):
+            start, end = _as_date(params["s"]), _as_date(params["e"])
+            if closed is None or start > closed:
+                parts.append([])
+                live.append((i, sql, params))
+                continue
+            hist_end = min(end, closed)
+            parts.append([self._scan_parquet(sql, {**params, "s": start, "e": hist_end}, start, hist_end)])
+            if end > closed:
+                live.append((i, sql, {**params, "s": closed + timedelta(days=1), "e": end}))
+
+        # the open-day remainders of all queries share one pipelined round trip
+        for (i, _, _), rows in zip(live, self.rows_many(conn, [(sql, p) for _, sql, p in live])):
+            parts[i].append(rows)
+        return [merge_additive(p, keys) for p, (_, _, keys) in zip(parts, queries)]
+
+
+_BACKENDS = {"postgres": PostgresBackend, "hybrid": HybridBackend}
+_backend = None
+_override: ContextVar = ContextVar("kpi_query_backend", default=None)
+_memo: ContextVar = ContextVar("kpi_request_memo", default=None)
+
+
+def get_backend():
+    """
+    Returns the backend for the current request: a `use_backend` override
+    if one is active, else the process-wide one selected by KPI_QUERY_BACKEND
+    (sharded when SHARD_ENABLED, behind the prefix-sum index when PREFIX_INDEX_ENABLED).
+    """
+    global _backend
+    override = _override.get()
+    if override is not None:
+        return override
+    if _backend is None:
+        set_backend(KPI_QUERY_BACKEND)
+    return _backend
+
+
+@contextmanager
+def use_backend(backend):
+    """Routes fetch_additive calls in this context (thread / task) to `backend`."""
+    token = _override.set(backend)
+    try:
+        yield backend
+    finally:
+        _override.reset(token)
+
+
+def direct_backend():
+    """
+    The current backend without its sharding / prefix-index wrappers, so every
+    read runs on the caller's connection (and inside its snapshot).
+    """
+    backend = get_backend()
+    while hasattr(backend, "inner"):
+        backend = backend.inner
+    return backend
+
+
+@contextmanager
+def memoizing():
+    """Within this context, each distinct once_per_request call runs once and is then reused."""
+    token = _memo.set({})
+    try:
+        yield
+    finally:
+        _memo.reset(token)
+
+
+def once_per_request(fn):
+    """
+    For the reads that do not go through fetch_additive (exact quantiles,
+    distinct counts, stat-test history): under memoizing(), e.g. across the
+    replicates of an approximate page, a call with the same arguments
+    (the connection aside) runs one query and later calls get a copy.
+    """
+    @functools.wraps(fn)
+    def wrapper(conn, *args, **kwargs):
+        memo = _memo.get()
+        if memo is None:
+            return fn(conn, *args, **kwargs)
+        key = (fn.__module__, fn.__qualname__, args, tuple(sorted(kwargs.items())))
+        if key not in memo:
+            memo[key] = fn(conn, *args, **kwargs)
+        return copy.deepcopy(memo[key])
+    return wrapper
+
+
+def set_backend(name: str):
+    """Switches the process-wide backend (used by the equivalence check)."""
+    global _backend
+    backend = _BACKENDS[name]()
+    if SHARD_ENABLED:
+        from KPI.utils.sharded_scan import ShardedBackend
+        backend = ShardedBackend(backend)
+    if PREFIX_INDEX_ENABLED:
+        from KPI.utils.prefix_index import PrefixSumBackend
+        backend = PrefixSumBackend(backend)
+    _backend = backend
+    return _backend
+
+
+def fetch_additive(conn, sql: str, params: dict, keys: tuple = ()) -> list[dict]:
+    """
+    Executes a grouped query whose non-key columns are SUM/COUNT aggregates
+    over `created_at::date BETWEEN :s AND :e`, through the configured backend.
+    Derived values (averages, rates, shares) must be computed by the caller
+    from the returned components.
+    """
+    return get_backend().fetch_additive(conn, sql, params, keys)
+
+
+def fetch_additive_many(conn, queries: list) -> list[list[dict]]:
+    """
+    fetch_additive for several independent `(sql, params, keys)` queries of one
+    page. Backends that can batch them (pipelining on psycopg 3) do so; the
+    rest answer them one by one. Results come back in query order.
+    """
+    backend = get_backend()
+    if hasattr(backend, "fetch_additive_many"):
+        return backend.fetch_additive_many(conn, queries)
+    return [backend.fetch_additive(conn, sql, params, keys) for sql, params, keys in queries]
+
+
+def first_row(rows: list) -> dict:
+    """The totals row of an ungrouped additive result."""
+    return rows[0] if rows else defaultdict(float)
+
+
+def fetch_additive_row(conn, sql: str, params: dict) -> dict:
+    """Ungrouped variant of fetch_additive; returns the single totals row."""
+    return first_row(fetch_additive(conn, sql, params))
@@ -0,0 +1,246 @@
+# backend/KPI/utils/query_guard.py
+"""
+Request deadlines and cancellation for KPI queries.
+
+QueryDeadlineMiddleware opens a QueryScope for every /api request: the
+endpoint's deadline (QUERY_DEADLINES) becomes the transaction's
+statement_timeout, a timer cancels the scope when it expires, and a
+watcher on the ASGI receive channel cancels it when the client goes away.
+Cancelling sends a driver-level cancel to every connection that is running
+one of the request's statements; SQLAlchemy engine events then refuse any
+further statement in that scope, so the KPI function stops at its next
+query instead of running its remaining ones for nobody. QueryCancelled is
+answered with 504 (deadline) or 499 (client closed the request).
+"""
+
+import asyncio
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+from fastapi.responses import JSONResponse
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from config import QUERY_DEADLINE_EXEMPT, QUERY_DEADLINE_SECONDS, QUERY_DEADLINES
+
+QUERY_CANCELED = "57014"  # SQLSTATE for both a cancel request and statement_timeout
+
+_scope: ContextVar = ContextVar("query_scope", default=None)
+_stats_lock = threading.Lock()
+_stats: dict = defaultdict(lambda: defaultdict(int))
+
+
+class QueryCancelled(Exception):
+    """A request's queries were stopped: reason is "deadline", "disconnect" or "statement_timeout"."""
+
+    def __init__(self, reason: str):
+        super().__init__(f"query cancelled ({reason})")
+        self.reason = reason
+
+
+def _count(endpoint: str, counter: str, n: int = 1):
+    with _stats_lock:
+        _stats[endpoint][counter] += n
+
+
+def stats() -> dict:
+    """Per-endpoint counters: requests, cancelled_<reason>, statements_cancelled, statements_skipped."""
+    with _stats_lock:
+        return {endpoint: dict(counters) for endpoint, counters in _stats.items()}
+
+
+def deadline_for(path: str) -> float:
+    matches = [p for p in QUERY_DEADLINES if path.startswith(p)]
+    return QUERY_DEADLINES[max(matches, key=len)] if matches else QUERY_DEADLINE_SECONDS
+
+
+def _cancel_connection(raw):
+    # psycopg 3 prefers cancel_safe (non-blocking-safe protocol); psycopg2 only has cancel
+    cancel = getattr(raw, "cancel_safe", None) or raw.cancel
+    try:
+        cancel()
+    except Exception as e:
+        print(f"🔴 Query cancel failed: {e}")
+
+
+class QueryScope:
+    """The deadline, cancellation state and in-flight connections of one request."""
+
+    def __init__(self, endpoint: str, seconds: float):
+        self.endpoint = endpoint
+        self.statement_timeout_ms = max(int(seconds * 1000), 1)
+        self.deadline = time.monotonic() + seconds
+        self.reason: Optional[str] = None
+        self.done = False
+        self._running: set = set()
+        self._lock = threading.Lock()
+
+    def cancel(self, reason: str):
+        """Marks the scope cancelled and cancels every statement it has in flight."""
+        with self._lock:
+            if self.reason is not None or self.done:
+                return
+            self.reason = reason
+            running = list(self._running)
+        _count(self.endpoint, f"cancelled_{reason}")
+        if running:
+            _count(self.endpoint, "statements_cancelled", len(running))
+        for raw in running:
+            _cancel_connection(raw)
+
+    def check(self):
+        """Raises QueryCancelled instead of starting another statement in a cancelled or expired scope."""
+        if self.reason is None and time.monotonic() >= self.deadline:
+            self.cancel("deadline")
+        if self.reason is not None:
+            _count(self.endpoint, "statements_skipped")
+            raise QueryCancelled(self.reason)
+
+    def enter(self, raw):
+        """Registers `raw` (a DB-API connection) as executing one of this scope's statements."""
+        self.check()
+        with self._lock:
+            # re-checked under the lock, so a concurrent cancel either sees `raw` or refuses it
+            if self.reason is None:
+                self._running.add(raw)
+                return
+        self.check()
+
+    def leave(self, raw):
+        with self._lock:
+            self._running.discard(raw)
+
+    def translate(self, error: Exception) -> Optional[QueryCancelled]:
+        """The QueryCancelled a driver's query_canceled error stands for, if any."""
+        sqlstate = getattr(error, "sqlstate", None) or getattr(error, "pgcode", None)
+        if sqlstate != QUERY_CANCELED:
+            return None
+        if self.reason is None:
+            with self._lock:
+                self.reason = "statement_timeout"
+            _count(self.endpoint, "cancelled_statement_timeout")
+        return QueryCancelled(self.reason)
+
+
+@contextmanager
+def guarded(raw):
+    """For statements sent on a raw DB-API connection (bypassing the engine events)."""
+    scope = _scope.get()
+    if scope is None:
+        yield
+        return
+    scope.enter(raw)
+    try:
+        yield
+    except Exception as e:
+        cancelled = scope.translate(e)
+        if cancelled is None:
+            raise
+        raise cancelled from e
+    finally:
+        scope.leave(raw)
+
+
+# ─── Engine Events ───────────────────────────────────────────────
+# Registered on the Engine class, so every engine (including the shard
+# pool's) is covered without touching the KPI modules.
+@event.listens_for(Engine, "begin")
+def _set_statement_timeout(conn):
+    scope = _scope.get()
+    if scope is None:
+        return
+    cur = conn.connection.dbapi_connection.cursor()
+    try:
+        # LOCAL: reverts with the transaction, so pooled connections never keep a request's timeout
+        cur.execute(f"SET LOCAL statement_timeout = {scope.statement_timeout_ms}")
+    finally:
+        cur.close()
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_execute(conn, cursor, statement, parameters, context, executemany):
+    scope = _scope.get()
+    if scope is None:
+        return
+    raw = conn.connection.dbapi_connection
+    scope.enter(raw)
+    conn.info["query_scope_raw"] = raw
+
+
+def _release(conn):
+    scope = _scope.get()
+    raw = conn.info.pop("query_scope_raw", None)
+    if scope is not None and raw is not None:
+        scope.leave(raw)
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_execute(conn, cursor, statement, parameters, context, executemany):
+    _release(conn)
+
+
+@event.listens_for(Engine, "handle_error")
+def _on_error(context):
+    conn = context.connection
+    if conn is not None:
+        _release(conn)
+    scope = _scope.get()
+    if scope is not None and context.original_exception is not None:
+        cancelled = scope.translate(context.original_exception)
+        if cancelled is not None:
+            raise cancelled from context.original_exception
+
+
+# ─── ASGI Middleware ─────────────────────────────────────────────
+class QueryDeadlineMiddleware:
+    """Runs each /api request inside a QueryScope with its endpoint's deadline."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        path = scope.get("path", "")
+        if scope["type"] != "http" or not path.startswith("/api") or path.startswith(QUERY_DEADLINE_EXEMPT):
+            await self.app(scope, receive, send)
+            return
+
+        seconds = deadline_for(path)
+        query_scope = QueryScope(path, seconds)
+        _count(path, "requests")
+        loop = asyncio.get_running_loop()
+        # driver cancels are small blocking network calls, so they run off the event loop
+        timer = loop.call_later(seconds, lambda: loop.run_in_executor(None, query_scope.cancel, "deadline"))
+
+        messages: asyncio.Queue = asyncio.Queue()
+
+        async def watch_disconnect():
+            while True:
+                message = await receive()
+                await messages.put(message)
+                if message["type"] == "http.disconnect":
+                    await loop.run_in_executor(None, query_scope.cancel, "disconnect")
+                    return
+
+        async def tracked_send(message):
+            if message["type"] == "http.response.body" and not message.get("more_body"):
+                query_scope.done = True
+            await send(message)
+
+        watcher = asyncio.create_task(watch_disconnect())
+        token = _scope.set(query_scope)
+        try:
+            await self.app(scope, messages.get, tracked_send)
+        finally:
+            query_scope.done = True
+            _scope.reset(token)
+            timer.cancel()
+            watcher.cancel()
+
+
+async def query_cancelled_handler(request, exc: QueryCancelled) -> JSONResponse:
+    status = 499 if exc.reason == "disconnect" else 504
+    return JSONResponse(status_code=status, content={"detail": str(exc)})
@@ -0,0 +1,221 @@
+# backend/KPI/utils/replicas.py
+"""
+Read-replica routing for request reads.
+
+ReplicaRoutingMiddleware picks the engine for each /api and /graphql
+request before it runs, and the KPI modules' LazyEngine resolves to it
+(DB.connector.reading_from). All queries of one request go to the same
+engine, so a page never mixes two replication positions.
+
+Lag is measured as the age of a replica's newest transaction against the
+primary's (max(created_at) of live_transactions, an index lookup on both).
+This works for streaming, logical or copied replicas alike, and unlike
+pg_last_xact_replay_timestamp() it does not grow while the primary is idle.
+Routing then depends on the window the request reads:
+  open        (includes today, all-time pages, GraphQL, unknown): a replica
+              no more than REPLICA_MAX_LAG_SECONDS behind, else the primary.
+  closed      (ends before today): any replica that has replayed past the
+              window's end, whatever its lag.
+Among eligible replicas the one with the fewest checked-out connections
+wins, ties rotating. Live feed and admin routes always use the primary.
+
+Two local instances are enough to try it: copy the database into a second
+server, set DB_REPLICA_HOSTS to it, then insert rows on the primary only.
+
+    python -m KPI.utils.replicas --filter Today --filter Yesterday
+"""
+
+import itertools
+import threading
+import time
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from typing import Optional
+from urllib.parse import parse_qs
+
+from sqlalchemy import text
+
+from config import REPLICA_LAG_CHECK_SECONDS, REPLICA_MAX_LAG_SECONDS
+from DB.connector import reading_from, replica_engines, shared_engine
+from KPI.utils.admission import WINDOWED, _param_date
+from KPI.utils.time_utils import get_date_ranges
+
+PRIMARY_ONLY = ("/api/live", "/api/admin", "/api/query-stats", "/api/admission-stats", "/api/replica-stats", "/api/metrics")
+WATERMARK_SQL = "SELECT max(created_at) FROM live_transactions"
+
+_lock = threading.Lock()
+_counters: dict = defaultdict(int)
+_rotation = itertools.count()
+_primary_watermark: Optional[datetime] = None
+_monitor: Optional[threading.Thread] = None
+
+
+class Replica:
+    """One replica's engine and its last lag check."""
+
+    def __init__(self, name: str, engine):
+        self.name = name
+        self.engine = engine
+        self.up = False
+        self.lag: Optional[float] = None
+        self.watermark: Optional[datetime] = None
+        self.checked_at: Optional[float] = None
+        self.error: Optional[str] = None
+
+    def caught_up_through(self) -> Optional[datetime]:
+        """Everything up to this instant is on the replica (None: unknown)."""
+        if not self.up:
+            return None
+        return datetime.max if self.lag == 0 else self.watermark
+
+    def stats(self) -> dict:
+        return {"up": self.up, "lag_seconds": self.lag, "checked_out": self.engine.pool.checkedout(),
+                "watermark": self.watermark.isoformat() if self.watermark else None,
+                "checked_at": self.checked_at, "error": self.error}
+
+
+@lru_cache(maxsize=None)
+def replicas() -> list:
+    return [Replica(name, engine) for name, engine in replica_engines().items()]
+
+
+# ─── Lag Monitor ─────────────────────────────────────────────────
+def _watermark(engine) -> Optional[datetime]:
+    with engine.connect() as conn:
+        return conn.execute(text(WATERMARK_SQL)).scalar()
+
+
+def check_lag() -> list:
+    """Measures every replica's lag behind the primary once."""
+    global _primary_watermark
+    _primary_watermark = primary = _watermark(shared_engine())
+    for replica in replicas():
+        try:
+            watermark = _watermark(replica.engine)
+        except Exception as e:
+            replica.up, replica.lag, replica.error = False, None, str(e).splitlines()[0]
+        else:
+            behind = (primary - watermark).total_seconds() if primary and watermark else 0.0
+            replica.up, replica.lag, replica.watermark, replica.error = True, max(behind, 0.0), watermark, None
+        replica.checked_at = time.time()
+    return replicas()
+
+
+def start_lag_monitor() -> Optional[threading.Thread]:
+    """
+    Checks lag once, then every REPLICA_LAG_CHECK_SECONDS in the background;
+    no-op without DB_REPLICA_HOSTS. Until it runs, reads stay on the primary.
+    """
+    global _monitor
+    with _lock:
+        if _monitor is not None or not replicas():
+            return _monitor
+        try:
+            check_lag()
+        except Exception as e:
+            print(f"🔴 Replica lag check failed: {e}")
+
+        def loop():
+            while True:
+                try:
+                    check_lag()
+                except Exception as e:
+                    print(f"🔴 Replica lag check failed: {e}")
+                time.sleep(REPLICA_LAG_CHECK_SECONDS)
+
+        _monitor = threading.Thread(target=loop, name="replica-lag", daemon=True)
+        _monitor.start()
+    return _monitor
+
+
+# ─── Routing ─────────────────────────────────────────────────────
+def read_window(path: str, query_string: bytes) -> Optional[tuple[date, date]]:
+    """First and last day a windowed page reads (comparison windows included); None if not known."""
+    if not path.startswith(WINDOWED):
+        return None
+    params = parse_qs(query_string.decode("latin-1"))
+    start = _param_date(params, "start", "start_date")
+    end = _param_date(params, "end", "end_date")
+    custom = (start, end) if start and end else None
+    days = []
+    for filter_type in params.get("filter_types", params.get("filter_type", ["YTD"])):
+        filter_type = "custom" if custom and filter_type.lower() == "custom" else filter_type
+        try:
+            days += [d.date() if hasattr(d, "date") else d for d in get_date_ranges(filter_type, custom)]
+        except (ValueError, TypeError):
+            return None
+    return (min(days), max(days)) if days else None
+
+
+def choose(path: str, query_string: bytes = b"") -> tuple:
+    """(Replica, or None for the primary; reason) for a request."""
+    if not replicas() or path.startswith(PRIMARY_ONLY):
+        return None, "primary"
+    window = read_window(path, query_string)
+    if window is not None and window[1] < date.today():
+        needed = datetime.combine(window[1] + timedelta(days=1), datetime.min.time())
+        eligible = [r for r in replicas() if r.caught_up_through() is not None and r.caught_up_through() >= needed]
+        reason = "closed"
+    else:
+        eligible = [r for r in replicas() if r.up and r.lag is not None and r.lag <= REPLICA_MAX_LAG_SECONDS]
+        reason = "open"
+    if not eligible:
+        return None, "fallback_down" if not any(r.up for r in replicas()) else "fallback_lag"
+    turn = next(_rotation) % len(eligible)
+    replica = min(eligible[turn:] + eligible[:turn], key=lambda r: r.engine.pool.checkedout())
+    return replica, reason
+
+
+def _count(target: str, reason: str):
+    with _lock:
+        _counters[(target, reason)] += 1
+
+
+def stats() -> dict:
+    """Replica health and lag, and how many requests went where, and why."""
+    with _lock:
+        routed = [{"target": t, "reason": r, "requests": n} for (t, r), n in sorted(_counters.items())]
+    return {"max_lag_seconds": REPLICA_MAX_LAG_SECONDS,
+            "primary_watermark": _primary_watermark.isoformat() if _primary_watermark else None,
+            "replicas": {r.name: r.stats() for r in replicas()}, "routed": routed}
+
+
+class ReplicaRoutingMiddleware:
+    """Runs each request's reads against the engine choose() picks for it."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        path = scope.get("path", "")
+        if scope["type"] not in ("http", "websocket") or not path.startswith(("/api", "/graphql")):
+            await self.app(scope, receive, send)
+            return
+        replica, reason = choose(path, scope.get("query_string", b""))
+        _count(replica.name if replica else "primary", reason)
+        if replica is None:
+            await self.app(scope, receive, send)
+            return
+        with reading_from(replica.engine):
+            await self.app(scope, receive, send)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Show replica lag and where each filter's reads would go.")
+    parser.add_argument("--path", default="/api/financial-performance")
+    parser.add_argument("--filter", action="append", default=[], help="filter_type to route (repeatable)")
+    args = parser.parse_args()
+
+    if not replicas():
+        raise SystemExit("DB_REPLICA_HOSTS is not set")
+    check_lag()
+    print(f"primary newest transaction: {_primary_watermark}")
+    for r in replicas():
+        state = f"lag {r.lag:.1f}s, newest {r.watermark}" if r.up else f"down ({r.error})"
+        print(f"  {r.name:<28}{state}")
+    for filter_type in args.filter or ["Today", "Yesterday", "MTD", "Monthly"]:
+        replica, reason = choose(args.path, f"filter_type={filter_type}".encode())
+        print(f"{filter_type:<12}-> {replica.name if replica else 'primary'} ({reason})")
@@ -0,0 +1,174 @@
+# backend/KPI/utils/sharded_scan.py
+"""
+Time-sharded parallel execution of additive KPI queries.
+
+A long `[:s, :e]` window (YTD, multi-year custom ranges) is split into
+month-aligned shards, each shard's partial aggregate runs on its own pooled
+connection, and the partials are merged with merge_additive. Every query
+that goes through fetch_additive returns SUM/COUNT components only, so the
+merge is exact and the pages keep deriving averages and rates from the
+merged components. Shards read separate snapshots, which is fine for these
+reporting windows but means a shard may see rows committed after another
+one started. They read from the server the request was routed to (primary
+or replica, KPI/utils/replicas.py), each through a small pool of its own.
+
+Benchmark against the single-query path:
+
+    cd backend
+    python -m KPI.utils.sharded_scan --custom 2024-01-01:2026-06-30 --shard-days 0 --shard-days 91
+"""
+
+import argparse
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from datetime import date, timedelta
+from typing import Optional
+
+from config import SHARD_DAYS, SHARD_MIN_DAYS, SHARD_WORKERS
+from DB.connector import get_engine, replica_engine, replica_engines, routed_engine, shared_engine
+from KPI.utils.query_backend import _as_date, merge_additive
+from KPI.utils.window_batch import DAY_FILTER
+
+
+def shard_windows(start, end, days: int = SHARD_DAYS) -> list[tuple[date, date]]:
+    """Consecutive sub-windows of `[start, end]`: calendar months, or `days`-day chunks if days > 0."""
+    start, end = _as_date(start), _as_date(end)
+    shards = []
+    while start <= end:
+        if days > 0:
+            stop = start + timedelta(days=days - 1)
+        else:
+            stop = (start.replace(day=1) + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+        shards.append((start, min(stop, end)))
+        start = stop + timedelta(days=1)
+    return shards
+
+
+def sargable_sql(sql: str) -> str:
+    """
+    Adds a plain range on the timestamp column next to `col::date BETWEEN :s AND :e`,
+    so each shard reads only its slice of the created_at index instead of
+    filtering every row through the cast.
+    """
+    day = DAY_FILTER.search(sql)
+    if not day:
+        return sql
+    column = day.group(1)
+    return f"{sql[:day.end()]} AND {column} >= :s AND {column} < :shard_next{sql[day.end():]}"
+
+
+class ShardedBackend:
+    """
+    Wraps another backend: windows of at least `min_days` are fanned out
+    over shards in parallel, shorter ones go straight to `inner`.
+    """
+
+    name = "sharded"
+
+    def __init__(self, inner, days: int = SHARD_DAYS, min_days: int = SHARD_MIN_DAYS,
+                 workers: int = SHARD_WORKERS):
+        self.inner = inner
+        self.days = days
+        self.min_days = min_days
+        self.workers = workers
+        self._engines: dict = {}     # routed engine → shard engine on the same server
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="kpi-shard")
+            return self._pool
+
+    def _shard_engine(self, routed):
+        """
+        A pool of `workers` connections to the server `routed` reads from, so
+        shard connections never starve the request pools and a request routed
+        to a replica never reads part of its window from the primary.
+        """
+        with self._lock:
+            if routed not in self._engines:
+                replica = next((name for name, e in replica_engines().items() if e is routed), None)
+                if replica is not None:
+                    self._engines[routed] = replica_engine(replica, pool_size=self.workers, max_overflow=0)[1]
+                elif routed is shared_engine():
+                    self._engines[routed] = get_engine(pool_size=self.workers, max_overflow=0)
+                else:  # an engine picked by the caller (benchmarks): share its pool
+                    self._engines[routed] = routed
+            return self._engines[routed]
+
+    def _run_shard(self, engine, sql: str, params: dict, keys: tuple) -> list[dict]:
+        with engine.connect() as conn:
+            return self.inner.fetch_additive(conn, sql, params, keys)
+
+    def fetch_additive(self, conn, sql: str, params: dict, keys: tuple = ()) -> list[dict]:
+        start, end = _as_date(params["s"]), _as_date(params["e"])
+        shards = shard_windows(start, end, self.days)
+        if (end - start).days + 1 < self.min_days or len(shards) < 2:
+            return self.inner.fetch_additive(conn, sql, params, keys)
+
+        pool = self._executor()
+        engine = self._shard_engine(routed_engine())
+        sql = sargable_sql(sql)
+        shard_params = [{**params, "s": s, "e": e, "shard_next": e + timedelta(days=1)} for s, e in shards]
+        # each shard runs in a copy of the caller's context, so the request's query deadline covers it too
+        futures = [pool.submit(copy_context().run, self._run_shard, engine, sql, p, keys) for p in shard_params[1:]]
+        # the caller's connection takes the first shard instead of idling
+        parts = [self.inner.fetch_additive(conn, sql, shard_params[0], keys)]
+        parts += [f.result() for f in futures]
+        return merge_additive(parts, keys)
+
+
+# ─── Benchmark ───────────────────────────────────────────────────
+def benchmark(cases: list, shard_days: list[int], repeat: int = 3) -> int:
+    from KPI.utils.backend_equivalence import PAGES, canonical_chart, diff_payloads
+    from KPI.utils.query_backend import PostgresBackend, use_backend
+
+    def timed(backend, fn, filter_type, window):
+        best, result = None, None
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            with use_backend(backend):
+                result = fn(filter_type, window)
+            elapsed = time.perf_counter() - t0
+            best = elapsed if best is None else min(best, elapsed)
+        result["charts"] = [canonical_chart(c) for c in result["charts"]]
+        return best, result
+
+    failures = 0
+    single = PostgresBackend()
+    variants = {days: ShardedBackend(single, days=days, min_days=0) for days in shard_days}
+    header = "".join(f"{('month' if d <= 0 else f'{d}d'):>10}" for d in shard_days)
+    print(f"{'page':<12} {'window':<26} {'single':>8}{header}")
+    for page, fn in PAGES.items():
+        for filter_type, window in cases:
+            base_time, expected = timed(single, fn, filter_type, window)
+            cells = []
+            for days, backend in variants.items():
+                elapsed, actual = timed(backend, fn, filter_type, window)
+                ok = not diff_payloads(expected, actual)
+                failures += not ok
+                cells.append(f"{elapsed:>9.3f}{'' if ok else '!'}")
+            label = f"{filter_type} {window[0]}:{window[1]}" if window else filter_type
+            print(f"{page:<12} {label:<26} {base_time:>8.3f}" + "".join(f"{c:>10}" for c in cells))
+
+    print(f"\nbest of {repeat}, seconds; '!' marks a payload that differs from the single query ({failures})")
+    return failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark sharded against single-query KPI scans.")
+    parser.add_argument("--filter", action="append", default=[], help="filter preset (default: YTD)")
+    parser.add_argument("--custom", action="append", default=[],
+                        help="custom window START:END (YYYY-MM-DD), may repeat")
+    parser.add_argument("--shard-days", action="append", type=int, default=[],
+                        help="shard size in days, 0 = calendar months (default: SHARD_DAYS); may repeat")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    cases = [(f, None) for f in (args.filter or ([] if args.custom else ["YTD"]))]
+    cases += [("custom", tuple(date.fromisoformat(p) for p in c.split(":"))) for c in args.custom]
+    raise SystemExit(1 if benchmark(cases, args.shard_days or [SHARD_DAYS], args.repeat) else 0)
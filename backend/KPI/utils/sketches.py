@@ -0,0 +1,203 @@
+# backend/KPI/utils/sketches.py
+
+import hashlib
+import struct
+from typing import Iterable, Optional
+
+import numpy as np
+
+
+def hash64(value) -> int:
+    """Stable 64-bit hash of a value's string form (same across processes)."""
+    return int.from_bytes(hashlib.blake2b(str(value).encode(), digest_size=8).digest(), "big")
+
+
+# ─── HyperLogLog ─────────────────────────────────────────────────
+class HyperLogLog:
+    """
+    Mergeable distinct-count sketch.
+
+    Starts in sparse mode holding the exact set of 64-bit hashes, so the
+    low-cardinality dimensions of this dataset (countries, states, card
+    types) stay exact; once more than `sparse_limit` distinct hashes are
+    seen it switches to 2**p dense registers (~1.04 / sqrt(2**p) error).
+    """
+
+    def __init__(self, p: int = 14, sparse_limit: int = 2048):
+        self.p = p
+        self.m = 1 << p
+        self.sparse_limit = sparse_limit
+        self.hashes: Optional[set] = set()
+        self.registers: Optional[np.ndarray] = None
+
+    def add(self, value):
+        self.add_hash(hash64(value))
+
+    def add_hash(self, h: int):
+        if self.hashes is not None:
+            self.hashes.add(h)
+            if len(self.hashes) > self.sparse_limit:
+                self._densify()
+            return
+        self._add_dense(np.array([h], dtype=np.uint64))
+
+    def update(self, values: Iterable):
+        for v in values:
+            self.add(v)
+
+    def _densify(self):
+        self.registers = np.zeros(self.m, dtype=np.uint8)
+        self._add_dense(np.fromiter(self.hashes, dtype=np.uint64, count=len(self.hashes)))
+        self.hashes = None
+
+    def _add_dense(self, hashes: np.ndarray):
+        idx = (hashes >> np.uint64(64 - self.p)).astype(np.int64)
+        rest = (hashes << np.uint64(self.p)) | np.uint64((1 << self.p) - 1)  # sentinel bits bound rho
+        # rho = position of the first 1-bit in the remaining 64 - p bits
+        rho = np.zeros(len(rest), dtype=np.uint8)
+        for i, r in enumerate(rest.tolist()):
+            rho[i] = 65 - r.bit_length()
+        np.maximum.at(self.registers, idx, rho)
+
+    def merge(self, other: "HyperLogLog") -> "HyperLogLog":
+        if other.p != self.p:
+            raise ValueError("Cannot merge HyperLogLog sketches of different precision")
+        if self.hashes is not None and other.hashes is not None:
+            self.hashes |= other.hashes
+            if len(self.hashes) > self.sparse_limit:
+                self._densify()
+            return self
+        if self.hashes is not None:
+            self._densify()
+        if other.hashes is not None:
+            self._add_dense(np.fromiter(other.hashes, dtype=np.uint64, count=len(other.hashes)))
+        else:
+            np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def count(self) -> int:
+        if self.hashes is not None:
+            return len(self.hashes)
+        m = self.m
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(np.power(2.0, -self.registers.astype(np.float64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * np.log(m / zeros)  # linear counting for the small range
+        return int(round(estimate))
+
+    def to_bytes(self) -> bytes:
+        if self.hashes is not None:
+            body = np.fromiter(self.hashes, dtype=np.uint64, count=len(self.hashes)).tobytes()
+            return b"S" + struct.pack("<B", self.p) + body
+        return b"D" + struct.pack("<B", self.p) + self.registers.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "HyperLogLog":
+        data = bytes(data)  # psycopg2 hands bytea back as a memoryview
+        kind, p = data[:1], data[1]
+        sketch = cls(p=p)
+        if kind == b"S":
+            sketch.hashes = set(np.frombuffer(data[2:], dtype=np.uint64).tolist())
+        else:
+            sketch.hashes = None
+            sketch.registers = np.frombuffer(data[2:], dtype=np.uint8).copy()
+        return sketch
+
+
+# ─── t-digest ────────────────────────────────────────────────────
+class TDigest:
+    """
+    Merging t-digest (Dunning) for quantiles of usd_value. Centroids are
+    kept sorted by mean; `compression` bounds their number (~2 × δ).
+    Merging two digests is concatenating their centroids and compressing.
+    """
+
+    def __init__(self, compression: float = 200.0):
+        self.compression = compression
+        self.means = np.empty(0, dtype=np.float64)
+        self.weights = np.empty(0, dtype=np.float64)
+        self.min = np.inf
+        self.max = -np.inf
+
+    @property
+    def total(self) -> float:
+        return float(self.weights.sum())
+
+    def update(self, values: Iterable[float], weights: Optional[Iterable[float]] = None):
+        values = np.asarray(list(values), dtype=np.float64)
+        if values.size == 0:
+            return self
+        weights = np.ones_like(values) if weights is None else np.asarray(list(weights), dtype=np.float64)
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        self.means = np.concatenate([self.means, values])
+        self.weights = np.concatenate([self.weights, weights])
+        self._compress()
+        return self
+
+    def merge(self, other: "TDigest") -> "TDigest":
+        if other.weights.size:
+            self.min = min(self.min, other.min)
+            self.max = max(self.max, other.max)
+            self.means = np.concatenate([self.means, other.means])
+            self.weights = np.concatenate([self.weights, other.weights])
+            self._compress()
+        return self
+
+    def _compress(self):
+        order = np.argsort(self.means, kind="mergesort")
+        means, weights = self.means[order], self.weights[order]
+        total = weights.sum()
+        if total == 0:
+            return
+
+        # k1 scale function: centroids near the tails stay small
+        def k(q):
+            return self.compression / (2 * np.pi) * np.arcsin(2 * np.clip(q, 0, 1) - 1)
+
+        out_m, out_w = [], []
+        cur_m, cur_w = means[0], weights[0]
+        q0 = 0.0
+        k_limit = k(q0) + 1
+        for m, w in zip(means[1:], weights[1:]):
+            q = q0 + (cur_w + w) / total
+            if k(q) <= k_limit:
+                cur_m += (m - cur_m) * w / (cur_w + w)
+                cur_w += w
+            else:
+                out_m.append(cur_m)
+                out_w.append(cur_w)
+                q0 += cur_w / total
+                k_limit = k(q0) + 1
+                cur_m, cur_w = m, w
+        out_m.append(cur_m)
+        out_w.append(cur_w)
+        self.means = np.array(out_m, dtype=np.float64)
+        self.weights = np.array(out_w, dtype=np.float64)
+
+    def quantile(self, q: float) -> float:
+        if self.weights.size == 0:
+            return 0.0
+        if self.weights.size == 1:
+            return float(self.means[0])
+        total = self.weights.sum()
+        # cumulative weight at each centroid's midpoint, with the extremes pinned to min/max
+        mids = np.cumsum(self.weights) - self.weights / 2
+        xs = np.concatenate([[0.0], mids, [total]])
+        ys = np.concatenate([[self.min], self.means, [self.max]])
+        return float(np.interp(q * total, xs, ys))
+
+    def to_bytes(self) -> bytes:
+        header = struct.pack("<dddI", self.compression, self.min, self.max, self.means.size)
+        return header + self.means.tobytes() + self.weights.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "TDigest":
+        data = bytes(data)
+        compression, lo, hi, n = struct.unpack("<dddI", data[:28])
+        digest = cls(compression)
+        digest.min, digest.max = lo, hi
+        digest.means = np.frombuffer(data[28:28 + 8 * n], dtype=np.float64).copy()
+        digest.weights = np.frombuffer(data[28 + 8 * n:28 + 16 * n], dtype=np.float64).copy()
+        return digest
@@ -1,4 +1,5 @@
-from scipy.stats import norm
+import math
+
 import numpy as np
 
 def compare_to_historical_single_point(yesterday_val: float, historical_values: list[float], alpha=0.05) -> dict:
@@ -6,6 +7,16 @@ def compare_to_historical_single_point(yesterday_val: float, historical_values:
     Perform z-test and prediction interval check to compare yesterday's value to historical distribution.
     """
     n = len(historical_values)
+    if n < 2:
+        # a merchant without (enough) history has no distribution to compare against
+        return {
+        "z_score": None,
+        "p_value": None,
+        "mean": round(float(historical_values[0]), 2) if n else None,
+        "std": None,
+        "is_significant": False,
+        "insight": "Not enough historical data."
+        }
     mean = np.mean(historical_values)
     std = np.std(historical_values, ddof=1) 
     if std == 0:
@@ -21,7 +32,7 @@ def compare_to_historical_single_point(yesterday_val: float, historical_values:
 
     # Z-test
     z = (yesterday_val - mean) / std
-    p = 2 * norm.sf(abs(z)) 
+    p = math.erfc(abs(z) / math.sqrt(2))  # two-sided, = 2 * norm.sf(|z|) without importing scipy
 
     t_multiplier = 1.96 
     pred_margin = t_multiplier * std * np.sqrt(1 + 1/n)
@@ -39,6 +50,6 @@ def compare_to_historical_single_point(yesterday_val: float, historical_values:
         "p_value": round(p, 4),
         "mean": round(mean, 2),
         "std": round(std, 2),
-        "is_significant": is_outlier,
+        "is_significant": bool(is_outlier),
         "insight": summary,
     }
@@ -0,0 +1,55 @@
+# backend/KPI/utils/warmup.py
+"""
+Worker warm-up, run from the app's startup hook before uvicorn accepts
+traffic. It opens pool connections, so the first requests do not pay for
+TCP connects and authentication. It also loads the per-process caches that
+the first request would otherwise build: the dimension dictionary, the
+tiktoken encoder and the xai client.
+"""
+
+import time
+
+from config import WARMUP_CONNECTIONS
+from DB.connector import shared_engine
+from sqlalchemy import text
+
+
+def _open_connections(n: int):
+    # checked out together, so the pool really holds n connections afterwards
+    conns = [shared_engine().connect() for _ in range(n)]
+    try:
+        for conn in conns:
+            conn.execute(text("SELECT 1"))
+    finally:
+        for conn in conns:
+            conn.close()
+
+
+def _load_dimensions():
+    from KPI.utils.dimensions import get_dimensions
+
+    with shared_engine().connect() as conn:
+        get_dimensions().acquirer_names(conn)
+
+
+def _load_llm():
+    from LLM.grok_client import XAI_API_KEY, get_client, get_encoding
+
+    get_encoding()
+    if XAI_API_KEY:
+        get_client()
+
+
+def warm_up(connections: int = WARMUP_CONNECTIONS) -> dict:
+    """Runs each warm-up step; returns seconds per step. A failed step is reported and skipped."""
+    timings = {}
+    for name, step in (("pool", lambda: _open_connections(connections)),
+                       ("dimensions", _load_dimensions),
+                       ("llm", _load_llm)):
+        t0 = time.perf_counter()
+        try:
+            step()
+        except Exception as e:
+            print(f"🔴 Warm-up step '{name}' failed: {e}")
+        timings[name] = round(time.perf_counter() - t0, 4)
+    return timings
@@ -0,0 +1,153 @@
+# backend/KPI/utils/window_batch.py
+"""
+Multi-window batch evaluation for the KPI pages.
+
+Prefetching every filter preset of a page would normally cost one full scan
+per window per query. Instead, the current and comparison windows of all
+requested presets are cut into disjoint segments at their boundaries, and
+each additive query is run once over the union of those windows (the days
+between them, e.g. between YTD and its prior-year comparison, are not read)
+with an extra `CASE` column labelling the segment a row falls in. Because every
+component is a SUM/COUNT, any requested window is then the sum of the
+segments it spans, so each page function runs unchanged against a
+WindowBatchBackend and its per-window fetch_additive calls are answered
+from the single labelled pass.
+"""
+
+import re
+from datetime import date, timedelta
+from typing import Callable, Iterable, Optional, Sequence, Tuple
+
+from KPI.utils.query_backend import _as_date, get_backend, merge_additive, use_backend
+from KPI.utils.time_utils import get_date_ranges
+
+LABEL = "window_segment"
+
+DAY_FILTER = re.compile(r"([\w.]+)::date\s+BETWEEN\s+:s\s+AND\s+:e", re.IGNORECASE)
+_SELECT = re.compile(r"\bSELECT\b", re.IGNORECASE)
+_GROUP_BY = re.compile(r"\bGROUP\s+BY\b", re.IGNORECASE)
+_ORDER_BY = re.compile(r"\bORDER\s+BY\b", re.IGNORECASE)
+
+
+def segment_bounds(windows: Iterable[Tuple[date, date]]) -> list[date]:
+    """Sorted cut points: every window start and every day after a window end."""
+    cuts = set()
+    for start, end in windows:
+        cuts.add(_as_date(start))
+        cuts.add(_as_date(end) + timedelta(days=1))
+    return sorted(cuts)
+
+
+def window_union(windows: Iterable[Tuple[date, date]]) -> list[Tuple[date, date]]:
+    """The days of `windows` as sorted, disjoint, non-adjacent ranges."""
+    union = []
+    for start, end in sorted((_as_date(s), _as_date(e)) for s, e in windows):
+        if union and start <= union[-1][1] + timedelta(days=1):
+            union[-1] = (union[-1][0], max(union[-1][1], end))
+        else:
+            union.append((start, end))
+    return union
+
+
+def within_ranges(sql: str, n_ranges: int) -> str:
+    """Restricts the `:s`–`:e` filter of an additive query to the ranges [:wr_s{k}, :wr_n{k})."""
+    day = DAY_FILTER.search(sql)
+    column = day.group(1)
+    ranges = " OR ".join(f"({column} >= :wr_s{k} AND {column} < :wr_n{k})" for k in range(n_ranges))
+    return f"{sql[:day.end()]} AND ({ranges}){sql[day.end():]}"
+
+
+def day_column(sql: str) -> Optional[str]:
+    """The `<col>::date` expression an additive query filters on with BETWEEN :s AND :e."""
+    day = DAY_FILTER.search(sql)
+    return f"{day.group(1)}::date" if day else None
+
+
+def add_group_column(sql: str, expr: str, name: str) -> Optional[str]:
+    """
+    Adds `expr AS name` to the select list of a single-SELECT additive query
+    and groups by it; None if the query does not have that simple shape.
+    """
+    if len(_SELECT.findall(sql)) != 1 or _ORDER_BY.search(sql):
+        return None
+    sql = _SELECT.sub(f"SELECT {expr} AS {name},", sql, count=1)
+    if _GROUP_BY.search(sql):
+        return _GROUP_BY.sub(f"GROUP BY {name},", sql, count=1)
+    return sql + f"\n GROUP BY {name}"
+
+
+def labelled_sql(sql: str, n_bounds: int) -> Optional[str]:
+    """Adds the segment-label column (cut points :wb_1 … :wb_{n-2}) to an additive query."""
+    column = day_column(sql)
+    if column is None:
+        return None
+    whens = " ".join(f"WHEN {column} < :wb_{i} THEN {i - 1}" for i in range(1, n_bounds - 1))
+    case = f"CASE {whens} ELSE {n_bounds - 2} END" if whens else "0"
+    return add_group_column(sql, case, LABEL)
+
+
+class WindowBatchBackend:
+    """
+    Answers fetch_additive for any window made of whole segments from one
+    labelled pass per distinct query; anything else goes to `inner`.
+    """
+
+    name = "batch"
+
+    def __init__(self, windows: Iterable[Tuple[date, date]], inner=None):
+        self.inner = inner or get_backend()
+        windows = list(windows)
+        self.bounds = segment_bounds(windows)
+        self.ranges = window_union(windows)
+        self._index = {d: i for i, d in enumerate(self.bounds)}
+        self._passes: dict = {}
+
+    @property
+    def passes(self) -> int:
+        """Labelled queries actually executed."""
+        return len(self._passes)
+
+    def _segments(self, start, end) -> Optional[Tuple[int, int]]:
+        i = self._index.get(_as_date(start))
+        j = self._index.get(_as_date(end) + timedelta(days=1))
+        return (i, j) if i is not None and j is not None and i < j else None
+
+    def fetch_additive(self, conn, sql: str, params: dict, keys: tuple = ()) -> list[dict]:
+        span = self._segments(params["s"], params["e"])
+        labelled = labelled_sql(sql, len(self.bounds)) if span else None
+        if labelled is None:
+            return self.inner.fetch_additive(conn, sql, params, keys)
+
+        cache_key = (sql, keys, tuple(sorted((k, v) for k, v in params.items() if k not in ("s", "e"))))
+        rows = self._passes.get(cache_key)
+        if rows is None:
+            hull = {"s": self.bounds[0], "e": self.bounds[-1] - timedelta(days=1)}
+            cuts = {f"wb_{i}": d for i, d in enumerate(self.bounds)}
+            union = {}
+            if len(self.ranges) > 1:  # skip the days no window uses
+                labelled = within_ranges(labelled, len(self.ranges))
+                for k, (start, end) in enumerate(self.ranges):
+                    union.update({f"wr_s{k}": start, f"wr_n{k}": end + timedelta(days=1)})
+            rows = self.inner.fetch_additive(conn, labelled, {**params, **hull, **cuts, **union}, keys + (LABEL,))
+            self._passes[cache_key] = rows
+
+        i, j = span
+        return merge_additive([[{c: v for c, v in r.items() if c != LABEL}
+                                for r in rows if i <= r[LABEL] < j]], keys)
+
+
+def run_batch(page_fn: Callable, filter_types: Sequence[str],
+              custom: Optional[Tuple[date, date]] = None) -> dict:
+    """
+    Evaluates `page_fn(filter_type, custom)` for every preset in
+    `filter_types`, sharing one labelled scan per additive query across all
+    of their windows. Returns {filter_type: payload}.
+    """
+    filter_types = list(dict.fromkeys(filter_types))
+    windows = []
+    for filter_type in filter_types:
+        start, end, comp_start, comp_end = get_date_ranges(filter_type, custom)
+        windows += [(start, end), (comp_start, comp_end)]
+
+    with use_backend(WindowBatchBackend(windows)):
+        return {filter_type: page_fn(filter_type, custom) for filter_type in filter_types}
@@ -1,32 +1,56 @@
 # backend/LLM/grok_client.py
 
 import os
+from functools import lru_cache
 from dotenv import load_dotenv
-from xai_sdk import Client
-from xai_sdk.chat import user, system
-import tiktoken
+
+from KPI.utils.instrumentation import timed_llm
 
 # Load API key from .env
 load_dotenv()
 XAI_API_KEY = os.getenv("XAI_API_KEY")
+FAILED_PREFIX = "Insight generation failed"
+
+# The xai SDK (gRPC) and tiktoken are slow to import, and the client needs the
+# key, so both are set up on first use rather than when the app is imported.
+@lru_cache(maxsize=None)
+def get_client():
+    if not XAI_API_KEY:
+        raise ValueError("XAI_API_KEY is not set in the .env file")
+    from xai_sdk import Client
+
+    return Client(api_key=XAI_API_KEY)
 
-if not XAI_API_KEY:
-    raise ValueError("XAI_API_KEY is not set in the .env file")
+# tiktoken downloads an encoding on first use. A failed load is cached too
+# (None), so a worker without access estimates tokens instead of retrying
+# the download on every prompt.
+@lru_cache(maxsize=None)
+def get_encoding(model: str = "gpt-3.5-turbo"):
+    import tiktoken
 
-client = Client(api_key=XAI_API_KEY)
+    try:
+        return tiktoken.encoding_for_model(model)
+    except Exception as e:
+        print(f"🔴 tiktoken encoding for {model} unavailable, estimating token counts: {e}")
+        return None
 
 # Token counter
 def count_tokens(text: str, model: str = "gpt-3.5-turbo") -> int:
-    enc = tiktoken.encoding_for_model(model)
-    return len(enc.encode(text))
+    encoding = get_encoding(model)
+    if encoding is None:
+        return -(-len(text) // 4)  # ~4 characters per token for English text
+    return len(encoding.encode(text))
 
 def generate_grok_insight(prompt: str, return_usage: bool = False) -> dict | str:
     try:
-        chat = client.chat.create(model="grok-4")
+        from xai_sdk.chat import user, system
+
+        chat = get_client().chat.create(model="grok-4")
         chat.append(system("You are a financial analyst. Be concise, helpful, and insightful."))
         chat.append(user(prompt))
 
-        response = chat.sample()
+        with timed_llm():
+            response = chat.sample()
         insight = response.content.strip()
 
         if return_usage:
@@ -49,11 +73,11 @@ def generate_grok_insight(prompt: str, return_usage: bool = False) -> dict | str
         print("🔴 Grok LLM Error:", e)
         if return_usage:
             return {
-                "text": f"Insight generation failed: {str(e)}",
+                "text": f"{FAILED_PREFIX}: {str(e)}",
                 "usage": {
                     "prompt_tokens": 0,
                     "completion_tokens": 0,
                     "total_tokens": 0
                 }
             }
-        return f"Insight generation failed: {str(e)}"
+        return f"{FAILED_PREFIX}: {str(e)}"
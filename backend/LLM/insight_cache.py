@@ -0,0 +1,226 @@
+# backend/LLM/insight_cache.py
+"""
+Insight cache keyed by what the data says, not by the exact prompt.
+
+A page whose US sales move from $1,203,441 to $1,203,467 should not pay for
+a new Grok narrative. The cache key is a fingerprint of the page's charts
+and metrics, with each part quantized:
+  values      relative buckets INSIGHT_CACHE_TOLERANCE wide (log scale), so
+              a change smaller than that rarely changes the key
+  diffs       % changes vs the previous period, in steps of
+              100 × INSIGHT_CACHE_TOLERANCE percentage points
+  categories  the order of each chart's top INSIGHT_CACHE_RANKS labels by
+              bucketed value (near-ties keep a fixed order), their bucketed
+              values and the chart's total or mean
+  stat tests  is_significant and the sign of the z-score from
+              compare_to_historical_single_point
+The template name and its prompt text are part of the key, so changing a
+prompt invalidates its insights. A value close to a bucket edge can still
+flip the key; the cost is one extra LLM call, never a wrong number.
+
+Insights live in insight_cache (shared by every worker, on the primary) for
+INSIGHT_CACHE_TTL seconds. The last INSIGHT_CACHE_SIZE are also kept in
+memory. Concurrent misses on one key wait for a single generation. Failed
+generations are not cached.
+"""
+
+import hashlib
+import json
+import math
+import numbers
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+from sqlalchemy import text
+
+from config import (INSIGHT_CACHE_ENABLED, INSIGHT_CACHE_RANKS, INSIGHT_CACHE_SIZE, INSIGHT_CACHE_TOLERANCE,
+                    INSIGHT_CACHE_TTL)
+from DB.connector import shared_engine
+from LLM.grok_client import FAILED_PREFIX
+from LLM.prompt_compaction import NOT_ADDITIVE, chart_series
+
+SCHEMA_SQL = """
+    CREATE TABLE IF NOT EXISTS insight_cache (
+        key         TEXT        PRIMARY KEY,   -- sha256 of the fingerprint
+        template    TEXT        NOT NULL,
+        fingerprint JSONB       NOT NULL,
+        insight     TEXT        NOT NULL,
+        created_at  TIMESTAMPTZ NOT NULL DEFAULT now()
+    )
+"""
+
+_lock = threading.Lock()
+_memory: OrderedDict = OrderedDict()   # key → (insight, created_at epoch)
+_inflight: dict = {}                   # key → [lock held while one request generates it, users]
+_schema_ready = False
+_counters: dict = defaultdict(int)
+
+
+# ─── Fingerprint ─────────────────────────────────────────────────
+def bucket(value, tolerance: float = INSIGHT_CACHE_TOLERANCE):
+    """[sign, log bucket] of a number; other values are kept as they are."""
+    if isinstance(value, bool) or not isinstance(value, numbers.Real):
+        return value
+    value = float(value)
+    if value == 0 or not math.isfinite(value):
+        return 0
+    return [1 if value > 0 else -1, math.floor(math.log(abs(value)) / math.log1p(tolerance))]
+
+
+def _bucket_value(value: float) -> float:
+    """The lower edge of a number's bucket, for ordering."""
+    b = bucket(value)
+    return b[0] * (1 + INSIGHT_CACHE_TOLERANCE) ** b[1] if b else 0.0
+
+
+def _chart_print(chart: dict) -> dict:
+    series = []
+    for name, labels, values in chart_series(chart):
+        # ranked by bucketed value, so categories within the tolerance of each other keep a fixed order
+        pairs = sorted(((str(label), float(v or 0)) for label, v in zip(labels, values)),
+                       key=lambda p: (-_bucket_value(p[1]), p[0]))
+        top = pairs[:INSIGHT_CACHE_RANKS]
+        values_only = [v for _, v in pairs]
+        if NOT_ADDITIVE.search(f"{chart.get('title', '')} {name or ''}"):
+            aggregate = {"mean": bucket(sum(values_only) / len(values_only)) if values_only else 0}
+        else:
+            aggregate = {"total": bucket(sum(values_only))}
+        series.append({"name": name, "n": len(pairs), **aggregate,
+                       "ranks": [label for label, _ in top], "values": [bucket(v) for _, v in top]})
+    return {"title": chart.get("title"), "region": chart.get("region"), "series": series}
+
+
+def _metric_print(metric: dict) -> dict:
+    out = {"title": metric.get("title"), "value": bucket(metric.get("value"))}
+    if metric.get("diff") is not None:
+        out["diff"] = round(metric["diff"] / (100 * INSIGHT_CACHE_TOLERANCE))
+    if metric.get("historical_avg") is not None:
+        out["historical_avg"] = bucket(metric["historical_avg"])
+    if metric.get("z_score") is not None:
+        out["significant"] = bool(metric.get("is_significant"))
+        z = float(metric["z_score"])
+        out["direction"] = (z > 0) - (z < 0)
+    return out
+
+
+def fingerprint(template: str, charts: list = (), metrics: list = (), prompt: str = "") -> tuple[str, dict]:
+    """(key, fingerprint) for a template's prompt text and its page data."""
+    printed = {"template": template, "prompt": hashlib.sha256(prompt.encode()).hexdigest()[:16],
+               "tolerance": INSIGHT_CACHE_TOLERANCE,
+               "metrics": [_metric_print(m) for m in metrics], "charts": [_chart_print(c) for c in charts]}
+    key = hashlib.sha256(json.dumps(printed, sort_keys=True, default=str).encode()).hexdigest()
+    return key, printed
+
+
+# ─── Store ───────────────────────────────────────────────────────
+def _ensure_schema(conn):
+    global _schema_ready
+    if not _schema_ready:
+        conn.execute(text(SCHEMA_SQL))
+        _schema_ready = True
+
+
+def _remember(key: str, insight: str, created_at: float):
+    with _lock:
+        _memory[key] = (insight, created_at)
+        _memory.move_to_end(key)
+        while len(_memory) > INSIGHT_CACHE_SIZE:
+            _memory.popitem(last=False)
+
+
+def lookup(key: str) -> Optional[tuple[str, float, str]]:
+    """(insight, created_at, "memory" | "db") of a fresh cached insight, or None."""
+    now = time.time()
+    with _lock:
+        entry = _memory.get(key)
+        if entry is not None and now - entry[1] < INSIGHT_CACHE_TTL:
+            _memory.move_to_end(key)
+            return entry[0], entry[1], "memory"
+    with shared_engine().begin() as conn:
+        _ensure_schema(conn)
+        row = conn.execute(text("""
+            SELECT insight, EXTRACT(EPOCH FROM created_at) AS created_at
+              FROM insight_cache
+             WHERE key = :key AND created_at > now() - make_interval(secs => :ttl)
+        """), {"key": key, "ttl": INSIGHT_CACHE_TTL}).first()
+    if row is None:
+        return None
+    _remember(key, row.insight, float(row.created_at))
+    return row.insight, float(row.created_at), "db"
+
+
+def store(key: str, template: str, printed: dict, insight: str):
+    with shared_engine().begin() as conn:
+        _ensure_schema(conn)
+        conn.execute(text("""
+            INSERT INTO insight_cache (key, template, fingerprint, insight, created_at)
+            VALUES (:key, :template, CAST(:fingerprint AS JSONB), :insight, now())
+            ON CONFLICT (key) DO UPDATE
+               SET insight = EXCLUDED.insight, fingerprint = EXCLUDED.fingerprint, created_at = EXCLUDED.created_at
+        """), {"key": key, "template": template, "fingerprint": json.dumps(printed, default=str), "insight": insight})
+    _remember(key, insight, time.time())
+
+
+def _count(counter: str):
+    with _lock:
+        _counters[counter] += 1
+
+
+@contextmanager
+def _key_lock(key: str):
+    """Holds the key's lock; the entry is dropped only once no request holds or waits on it."""
+    with _lock:
+        entry = _inflight.setdefault(key, [threading.Lock(), 0])
+        entry[1] += 1
+    try:
+        with entry[0]:
+            yield
+    finally:
+        with _lock:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del _inflight[key]
+
+
+def get_or_generate(template: str, charts: list, metrics: list, generate: Callable[[], str],
+                    prompt: str = "") -> tuple[str, dict]:
+    """
+    The cached insight for this data, or generate()'s, which is then cached
+    unless it failed. Returns (insight, {"hit", "source", "key", "age_seconds"}).
+    Cache errors are reported and fall through to generate().
+    """
+    if not INSIGHT_CACHE_ENABLED:
+        return generate(), {"hit": False, "source": None, "key": None, "age_seconds": None}
+    key, printed = fingerprint(template, charts, metrics, prompt)
+    with _key_lock(key):
+        try:
+            hit = lookup(key)
+        except Exception as e:
+            print(f"🔴 Insight cache lookup failed: {e}")
+            hit = None
+        if hit is not None:
+            insight, created_at, source = hit
+            _count(f"hits_{source}")
+            return insight, {"hit": True, "source": source, "key": key,
+                             "age_seconds": round(time.time() - created_at, 1)}
+
+        _count("misses")
+        insight = generate()
+        if insight.startswith(FAILED_PREFIX):
+            _count("failures_not_cached")
+        else:
+            try:
+                store(key, template, printed, insight)
+                _count("stored")
+            except Exception as e:
+                print(f"🔴 Insight cache store failed: {e}")
+        return insight, {"hit": False, "source": None, "key": key, "age_seconds": None}
+
+
+def stats() -> dict:
+    """hits_memory, hits_db, misses, stored and failures_not_cached since start, and the in-memory size."""
+    with _lock:
+        return {"enabled": INSIGHT_CACHE_ENABLED, "memory_entries": len(_memory), **_counters}
@@ -0,0 +1,386 @@
+# backend/LLM/insight_jobs.py
+"""
+Background insight jobs.
+
+enqueue() stores a job in insight_jobs and returns its id. An identical job
+that is still queued or running is reused, so a double click does not pay
+twice. Worker threads (INSIGHT_JOB_WORKERS per app process, or a
+standalone `--work` process) claim queued jobs with FOR UPDATE SKIP LOCKED.
+Each job runs the page's insight endpoint function: the same prompt,
+compaction and insight cache as a synchronous click, so a finished job also
+serves later clicks on the same data. A failed generation is re-queued
+with exponential backoff until INSIGHT_JOB_ATTEMPTS. A job whose worker
+died is claimed again after INSIGHT_JOB_TIMEOUT.
+
+With INSIGHT_PRECOMPUTE_ENABLED, the scheduler queues every page for
+INSIGHT_PRECOMPUTE_FILTERS once a day, after INSIGHT_PRECOMPUTE_AT. The day
+is claimed in insight_precompute_runs in the transaction that queues its
+jobs, so only one worker queues it and a failed run can be retried.
+`--precompute` does the same from cron, e.g. after `python -m DB.geo_daily`
+and `python -m DB.daily_sketches` have added the closed day.
+
+    python -m LLM.insight_jobs --precompute
+    python -m LLM.insight_jobs --work --workers 4
+"""
+
+import argparse
+import json
+import threading
+import time
+from collections import defaultdict
+from datetime import date, datetime
+from typing import Optional
+
+from sqlalchemy import text
+
+from config import (INSIGHT_JOB_ATTEMPTS, INSIGHT_JOB_BACKOFF, INSIGHT_JOB_POLL_SECONDS, INSIGHT_JOB_TIMEOUT,
+                    INSIGHT_JOB_WORKERS, INSIGHT_JOBS_ENABLED, INSIGHT_PRECOMPUTE_AT, INSIGHT_PRECOMPUTE_ENABLED,
+                    INSIGHT_PRECOMPUTE_FILTERS, INSIGHT_PRECOMPUTE_MERCHANTS)
+from DB.connector import shared_engine
+from LLM.grok_client import FAILED_PREFIX
+
+SCHEMA_SQL = [
+    """
+    CREATE TABLE IF NOT EXISTS insight_jobs (
+        id          BIGSERIAL   PRIMARY KEY,
+        page        TEXT        NOT NULL,
+        params      JSONB       NOT NULL,
+        source      TEXT        NOT NULL DEFAULT 'api',      -- 'api' | 'precompute'
+        status      TEXT        NOT NULL DEFAULT 'queued',   -- queued | running | done | failed
+        attempts    INTEGER     NOT NULL DEFAULT 0,
+        run_after   TIMESTAMPTZ NOT NULL DEFAULT now(),
+        result      JSONB,
+        error       TEXT,
+        created_at  TIMESTAMPTZ NOT NULL DEFAULT now(),
+        started_at  TIMESTAMPTZ,
+        finished_at TIMESTAMPTZ
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS insight_jobs_pending_idx ON insight_jobs (run_after) WHERE status IN ('queued', 'running')",
+    """
+    CREATE TABLE IF NOT EXISTS insight_precompute_runs (
+        day         DATE        PRIMARY KEY,
+        jobs        INTEGER     NOT NULL DEFAULT 0,
+        queued_at   TIMESTAMPTZ NOT NULL DEFAULT now()
+    )
+    """,
+]
+
+# filters each insight endpoint accepts (None: every get_date_ranges preset)
+PAGE_FILTERS = {
+    "customer": ("Today", "Yesterday", "Daily", "Weekly", "MTD", "Monthly", "YTD", "custom"),
+    "demographic": None,
+    "gateway_fee": ("Daily", "Weekly", "MTD", "YTD", "Custom"),
+}
+
+_lock = threading.Lock()
+_wake = threading.Event()
+_workers: list = []
+_scheduler: Optional[threading.Thread] = None
+_schema_ready = False
+_counters: dict = defaultdict(int)
+
+
+def _ensure_schema(conn):
+    global _schema_ready
+    if not _schema_ready:
+        # workers of several processes start together; concurrent CREATE ... IF NOT EXISTS can still collide
+        conn.execute(text("SELECT pg_advisory_xact_lock(hashtext('insight_jobs_schema'))"))
+        for sql in SCHEMA_SQL:
+            conn.execute(text(sql))
+        _schema_ready = True
+
+
+def _count(counter: str, n: int = 1):
+    with _lock:
+        _counters[counter] += n
+
+
+def _as_date(value) -> Optional[date]:
+    return date.fromisoformat(value) if isinstance(value, str) else value
+
+
+# ─── Pages ───────────────────────────────────────────────────────
+def _run_page(page: str, params: dict) -> dict:
+    """Runs the page's insight endpoint function with the job's parameters."""
+    if page == "customer":
+        from API.customer_insight import customer_insights_ai_insight
+        from KPI.customer_insight import MERCHANT_ID
+
+        return customer_insights_ai_insight(
+            chart_id=params.get("chart_id"), filter_type=params["filter_type"], start=_as_date(params.get("start")),
+            end=_as_date(params.get("end")), merchant_id=params.get("merchant_id") or MERCHANT_ID)
+    if page == "demographic":
+        from API.DemoGraphic import demographic_insight
+        from KPI.DemoGraphic import MERCHANT_ID
+
+        return demographic_insight(
+            filter_type=params["filter_type"], start=_as_date(params.get("start")), end=_as_date(params.get("end")),
+            merchant_id=params.get("merchant_id") or MERCHANT_ID)
+    if page == "gateway_fee":
+        from API.report import gateway_fee_insight
+
+        return gateway_fee_insight(
+            filter_type=params["filter_type"], start_date=_as_date(params.get("start")),
+            end_date=_as_date(params.get("end")), merchant_id=params.get("merchant_id"))
+    raise ValueError(f"Unknown insight page: {page}")
+
+
+def validate(page: str, params: dict) -> dict:
+    """The job's normalized parameters; raises ValueError for a page or filter the endpoint would reject."""
+    if page not in PAGE_FILTERS:
+        raise ValueError(f"Unknown insight page: {page} (expected one of {', '.join(PAGE_FILTERS)})")
+    allowed = PAGE_FILTERS[page]
+    filter_type = params.get("filter_type") or "YTD"
+    if allowed is not None and filter_type not in allowed:
+        raise ValueError(f"Unsupported filter for {page}: {filter_type}")
+    if page == "customer" and not params.get("chart_id"):
+        raise ValueError("chart_id is required for customer insights")
+    normalized = {"filter_type": filter_type}
+    for name in ("start", "end"):
+        if params.get(name):
+            normalized[name] = _as_date(params[name]).isoformat()
+    for name in ("merchant_id", "chart_id"):
+        if params.get(name) is not None:
+            normalized[name] = params[name]
+    return normalized
+
+
+# ─── Queue ───────────────────────────────────────────────────────
+def enqueue(page: str, params: dict, source: str = "api") -> tuple[int, bool]:
+    """(job id, created); an identical queued or running job is returned instead of a new one."""
+    with shared_engine().begin() as conn:
+        _ensure_schema(conn)
+        job_id, created = _enqueue(conn, page, params, source)
+    if created:
+        _count(f"enqueued_{source}")
+        _wake.set()
+    return job_id, created
+
+
+def _enqueue(conn, page: str, params: dict, source: str) -> tuple[int, bool]:
+    params = validate(page, params)
+    # serialises identical enqueues, so two clicks cannot both insert
+    conn.execute(text("SELECT pg_advisory_xact_lock(hashtext(:k))"),
+                 {"k": page + json.dumps(params, sort_keys=True)})
+    existing = conn.execute(text("""
+        SELECT id FROM insight_jobs
+         WHERE page = :page AND params = CAST(:params AS JSONB) AND status IN ('queued', 'running')
+         ORDER BY id LIMIT 1
+    """), {"page": page, "params": json.dumps(params)}).scalar()
+    if existing is not None:
+        return existing, False
+    job_id = conn.execute(text("""
+        INSERT INTO insight_jobs (page, params, source) VALUES (:page, CAST(:params AS JSONB), :source)
+        RETURNING id
+    """), {"page": page, "params": json.dumps(params), "source": source}).scalar()
+    return job_id, True
+
+
+def get_job(job_id: int) -> Optional[dict]:
+    with shared_engine().begin() as conn:
+        _ensure_schema(conn)
+        row = conn.execute(text("""
+            SELECT id, page, params, source, status, attempts, result, error,
+                   created_at, started_at, finished_at, run_after
+              FROM insight_jobs WHERE id = :id
+        """), {"id": job_id}).mappings().first()
+    return dict(row) if row is not None else None
+
+
+def recent_jobs(limit: int = 50, status: Optional[str] = None) -> list[dict]:
+    with shared_engine().begin() as conn:
+        _ensure_schema(conn)
+        rows = conn.execute(text("""
+            SELECT id, page, params, source, status, attempts, error, created_at, finished_at
+              FROM insight_jobs
+             WHERE CAST(:status AS TEXT) IS NULL OR status = :status
+             ORDER BY id DESC LIMIT :limit
+        """), {"status": status, "limit": limit}).mappings().all()
+    return [dict(r) for r in rows]
+
+
+def queue_depth() -> dict:
+    """Jobs per status."""
+    with shared_engine().begin() as conn:
+        _ensure_schema(conn)
+        rows = conn.execute(text("SELECT status, COUNT(*) AS n FROM insight_jobs GROUP BY status")).all()
+    return {r.status: r.n for r in rows}
+
+
+def _claim() -> Optional[dict]:
+    with shared_engine().begin() as conn:
+        _ensure_schema(conn)
+        row = conn.execute(text("""
+            UPDATE insight_jobs
+               SET status = 'running', attempts = attempts + 1, started_at = now()
+             WHERE id = (
+                   SELECT id FROM insight_jobs
+                    WHERE (status = 'queued' AND run_after <= now())
+                       OR (status = 'running' AND started_at < now() - make_interval(secs => :timeout))
+                    ORDER BY run_after, id
+                    LIMIT 1
+                      FOR UPDATE SKIP LOCKED)
+            RETURNING id, page, params, attempts
+        """), {"timeout": INSIGHT_JOB_TIMEOUT}).mappings().first()
+    return dict(row) if row is not None else None
+
+
+def _finish(job_id: int, result: dict):
+    with shared_engine().begin() as conn:
+        conn.execute(text("""
+            UPDATE insight_jobs
+               SET status = 'done', result = CAST(:result AS JSONB), error = NULL, finished_at = now()
+             WHERE id = :id
+        """), {"id": job_id, "result": json.dumps(result, default=str)})
+
+
+def _fail(job_id: int, attempts: int, error: str, retry: bool):
+    retry = retry and attempts < INSIGHT_JOB_ATTEMPTS
+    with shared_engine().begin() as conn:
+        conn.execute(text("""
+            UPDATE insight_jobs
+               SET status = :status, error = :error,
+                   run_after = now() + make_interval(secs => :backoff),
+                   finished_at = CASE WHEN CAST(:status AS TEXT) = 'failed' THEN now() END
+             WHERE id = :id
+        """), {"id": job_id, "status": "queued" if retry else "failed", "error": error[:2000],
+               "backoff": INSIGHT_JOB_BACKOFF * 2 ** (attempts - 1)})
+    _count("retried" if retry else "failed")
+
+
+def run_one() -> bool:
+    """Claims and runs one job; False when none is due."""
+    job = _claim()
+    if job is None:
+        return False
+    try:
+        result = _run_page(job["page"], job["params"])
+    except ValueError as e:
+        _fail(job["id"], job["attempts"], str(e), retry=False)  # bad parameters do not get better
+        return True
+    except Exception as e:
+        _fail(job["id"], job["attempts"], f"{type(e).__name__}: {e}", retry=True)
+        return True
+    if result.get("error"):
+        _fail(job["id"], job["attempts"], result["error"], retry=False)
+    elif str(result.get("insight", "")).startswith(FAILED_PREFIX):
+        _fail(job["id"], job["attempts"], result["insight"], retry=True)
+    else:
+        _finish(job["id"], result)
+        _count("done")
+    return True
+
+
+def _work_loop():
+    while True:
+        try:
+            while run_one():
+                pass
+        except Exception as e:
+            print(f"🔴 Insight job worker failed: {e}")
+        _wake.wait(INSIGHT_JOB_POLL_SECONDS)
+        _wake.clear()
+
+
+# ─── Precompute ──────────────────────────────────────────────────
+def precompute_jobs(filters: list = INSIGHT_PRECOMPUTE_FILTERS) -> list[tuple[str, dict]]:
+    """(page, params) for every insight page × standard filter × precomputed merchant."""
+    from KPI.customer_insight import MERCHANT_ID, get_customer_insights_data
+
+    merchants = [None, *INSIGHT_PRECOMPUTE_MERCHANTS]
+    jobs = []
+    for filter_type in filters:
+        for merchant_id in merchants:
+            base = {"filter_type": filter_type, "merchant_id": merchant_id}
+            if PAGE_FILTERS["demographic"] is None or filter_type in PAGE_FILTERS["demographic"]:
+                jobs.append(("demographic", base))
+            if filter_type in PAGE_FILTERS["gateway_fee"]:
+                jobs.append(("gateway_fee", base))
+            if filter_type in PAGE_FILTERS["customer"]:
+                charts = get_customer_insights_data(filter_type, None, merchant_id or MERCHANT_ID)["charts"]
+                jobs += [("customer", {**base, "chart_id": chart["title"]}) for chart in charts]
+    return jobs
+
+
+def precompute(day: Optional[date] = None, force: bool = False) -> int:
+    """
+    Queues the day's precompute jobs; returns how many. Without `force`, a
+    day another worker (or an earlier run) already claimed queues nothing.
+    The claim and the jobs commit together, so a failed run leaves the day
+    unclaimed for the next attempt.
+    """
+    day = day or date.today()
+    with shared_engine().begin() as conn:
+        _ensure_schema(conn)
+        # a concurrent claim of the same day waits on this row until we commit, then finds it taken
+        claimed = conn.execute(text("""
+            INSERT INTO insight_precompute_runs (day) VALUES (:day) ON CONFLICT (day) DO NOTHING RETURNING day
+        """), {"day": day}).scalar()
+        if claimed is None and not force:
+            return 0
+        created = sum(_enqueue(conn, page, params, "precompute")[1] for page, params in precompute_jobs())
+        conn.execute(text("UPDATE insight_precompute_runs SET jobs = :jobs, queued_at = now() WHERE day = :day"),
+                     {"day": day, "jobs": created})
+    _count("enqueued_precompute", created)
+    _count("precompute_runs")
+    _wake.set()
+    return created
+
+
+def _schedule_loop():
+    at = datetime.strptime(INSIGHT_PRECOMPUTE_AT, "%H:%M").time()
+    last_day = None
+    while True:
+        try:
+            if datetime.now().time() >= at and last_day != date.today():
+                queued = precompute()
+                last_day = date.today()
+                if queued:
+                    print(f"Queued {queued} precomputed insight(s) for {last_day}")
+        except Exception as e:
+            print(f"🔴 Insight precompute failed: {e}")
+        time.sleep(60)
+
+
+def start_insight_jobs() -> list:
+    """Worker threads (INSIGHT_JOBS_ENABLED) and the precompute scheduler (INSIGHT_PRECOMPUTE_ENABLED)."""
+    global _scheduler
+    with _lock:
+        if INSIGHT_JOBS_ENABLED and not _workers:
+            for i in range(INSIGHT_JOB_WORKERS):
+                worker = threading.Thread(target=_work_loop, name=f"insight-job-{i}", daemon=True)
+                worker.start()
+                _workers.append(worker)
+        if INSIGHT_JOBS_ENABLED and INSIGHT_PRECOMPUTE_ENABLED and _scheduler is None:
+            _scheduler = threading.Thread(target=_schedule_loop, name="insight-precompute", daemon=True)
+            _scheduler.start()
+    return [*_workers, *([_scheduler] if _scheduler else [])]
+
+
+def stats() -> dict:
+    """enqueued_<source>, done, retried, failed and precompute_runs since start, and this process's worker count."""
+    with _lock:
+        return {"workers": sum(w.is_alive() for w in _workers), **_counters}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Queue precomputed insights or run insight job workers.")
+    parser.add_argument("--precompute", action="store_true", help="queue today's precompute jobs")
+    parser.add_argument("--force", action="store_true", help="queue them even if today was already precomputed")
+    parser.add_argument("--work", action="store_true", help="run job workers until interrupted")
+    parser.add_argument("--workers", type=int, default=INSIGHT_JOB_WORKERS)
+    args = parser.parse_args()
+
+    if args.precompute:
+        print(f"Queued {precompute(force=args.force)} insight job(s)")
+    if args.work:
+        threads = [threading.Thread(target=_work_loop, name=f"insight-job-{i}", daemon=True) for i in range(args.workers)]
+        for thread in threads:
+            thread.start()
+        try:
+            while True:
+                time.sleep(30)
+                print(json.dumps({**stats(), "queue": queue_depth()}))
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,151 @@
+# backend/LLM/prompt_compaction.py
+"""
+Compact, token-budgeted data sections for the insight prompts.
+
+Chart and metric payloads are not pasted into prompts as raw dicts. Each
+chart becomes one line: its total, the PROMPT_TOP_K largest categories
+with their shares, and the rest folded into "other". Rates and averages
+get their mean instead of a total and no shares. Time series get their
+first, last, min and max. Each metric becomes its value, its change against
+the comparison period and its stat-test result.
+
+compact_prompt() holds a template to its PROMPT_TOKEN_BUDGETS entry. It
+halves the top-k down to 1, then drops metric lines and finally chart
+lines from the end, until the prompt fits. It reports the token count of
+the same template with the payloads inlined raw ("before") next to the
+compacted prompt's ("after").
+"""
+
+import numbers
+import re
+import threading
+from collections import defaultdict
+from typing import Optional
+
+from config import PROMPT_TOKEN_BUDGETS, PROMPT_TOP_K
+from LLM.grok_client import count_tokens
+
+NOT_ADDITIVE = re.compile(r"rate|avg|average|ratio|%|share", re.IGNORECASE)
+TIME_SERIES = ("line", "area")
+
+_lock = threading.Lock()
+_totals: dict = defaultdict(lambda: defaultdict(int))
+
+
+def _fmt(value) -> str:
+    if isinstance(value, bool) or not isinstance(value, numbers.Real):
+        return str(value)
+    if float(value).is_integer():
+        return f"{int(value):,}"
+    return f"{value:,.2f}"
+
+
+def chart_series(chart: dict) -> list[tuple]:
+    """(series name or None, labels, numeric values) for the chart shapes the pages return."""
+    if isinstance(chart.get("data"), list):
+        points = [p for p in chart["data"] if isinstance(p, dict)]
+        return [(None, [p.get("name") for p in points], [p.get("value") or 0 for p in points])]
+    labels = chart.get("x")
+    if labels is not None and isinstance(chart.get("y"), list):
+        return [(None, labels, chart["y"])]
+    labels = labels if labels is not None else chart.get("y", [])
+    return [(s.get("name"), labels, s.get("data", [])) for s in chart.get("series", [])]
+
+
+def _categories(title: str, labels: list, values: list, top_k: int) -> str:
+    pairs = sorted(((label, float(v or 0)) for label, v in zip(labels, values)), key=lambda p: p[1], reverse=True)
+    if not pairs:
+        return "no data"
+    top, rest = pairs[:top_k], pairs[top_k:]
+    if NOT_ADDITIVE.search(title):
+        mean = sum(v for _, v in pairs) / len(pairs)
+        parts = [f"{label} {_fmt(round(v, 2))}" for label, v in top]
+        if rest:
+            parts.append(f"other {len(rest)} avg {_fmt(round(sum(v for _, v in rest) / len(rest), 2))}")
+        return f"{len(pairs)} categories, mean {_fmt(round(mean, 2))}: " + "; ".join(parts)
+    total = sum(v for _, v in pairs) or 1.0
+    parts = [f"{label} {_fmt(round(v, 2))} ({100 * v / total:.1f}%)" for label, v in top]
+    if rest:
+        other = sum(v for _, v in rest)
+        parts.append(f"other {len(rest)} {_fmt(round(other, 2))} ({100 * other / total:.1f}%)")
+    return f"{len(pairs)} categories, total {_fmt(round(total, 2))}: " + "; ".join(parts)
+
+
+def _trend(labels: list, values: list) -> str:
+    points = [(label, float(v or 0)) for label, v in zip(labels, values)]
+    if not points:
+        return "no data"
+    (first_label, first), (last_label, last) = points[0], points[-1]
+    low, high = min(points, key=lambda p: p[1]), max(points, key=lambda p: p[1])
+    change = f" ({100 * (last - first) / first:+.1f}%)" if first else ""
+    return (f"{len(points)} points, {first_label} {_fmt(round(first, 2))} -> {last_label} {_fmt(round(last, 2))}{change}; "
+            f"min {_fmt(round(low[1], 2))} at {low[0]}, max {_fmt(round(high[1], 2))} at {high[0]}")
+
+
+def summarize_chart(chart: dict, top_k: int = PROMPT_TOP_K) -> str:
+    """One line per series: totals and top-k with shares, or the trend of a time series."""
+    title = chart.get("title", "Chart") + (f" ({chart['region']})" if chart.get("region") else "")
+    lines = []
+    for name, labels, values in chart_series(chart):
+        label = f"{title} - {name}" if name else title
+        body = _trend(labels, values) if chart.get("type") in TIME_SERIES else _categories(label, labels, values, top_k)
+        lines.append(f"{label}: {body}")
+    return "\n".join(lines) or f"{title}: no data"
+
+
+def summarize_metric(metric: dict) -> str:
+    """Value, change vs the comparison period and the stat-test result of a metric card."""
+    line = f"{metric.get('title', 'Metric')}: {_fmt(metric.get('value'))}"
+    if metric.get("diff") is not None:
+        line += f" ({metric['diff']:+.1f}% vs previous period)"
+    if metric.get("historical_avg") is not None:
+        line += f", historical avg {_fmt(metric['historical_avg'])}"
+    if metric.get("z_score") is not None:
+        verdict = "significant" if metric.get("is_significant") else "not significant"
+        line += f", z {metric['z_score']:+.2f}, p {metric.get('p_value', 0):.3f} ({verdict})"
+    return line
+
+
+def _join(*sections) -> str:
+    return "\n\n".join(s.strip("\n") for s in sections if s)
+
+
+def compact_prompt(template: str, instructions: str, charts: list = (), metrics: list = (),
+                   footer: str = "", budget: Optional[int] = None) -> tuple[str, dict]:
+    """The prompt (instructions, compact data section, footer) and its token report."""
+    budget = budget or PROMPT_TOKEN_BUDGETS.get(template)
+    before = count_tokens(_join(instructions, "\n".join(map(str, [*metrics, *charts])), footer))
+
+    top_k = max(PROMPT_TOP_K, 1)
+    while True:
+        lines = [summarize_metric(m) for m in metrics] + [summarize_chart(c, top_k) for c in charts]
+        prompt = _join(instructions, "\n".join(lines), footer)
+        tokens = count_tokens(prompt)
+        if budget is None or tokens <= budget or top_k == 1:
+            break
+        top_k = max(top_k // 2, 1)
+
+    # still over at top-1: drop metric lines, then chart lines, from the end
+    dropped = 0
+    droppable = [*reversed(range(len(metrics))), *reversed(range(len(metrics), len(lines)))]
+    while budget is not None and tokens > budget and len(droppable) > 1:
+        lines[droppable.pop(0)] = None
+        dropped += 1
+        prompt = _join(instructions, "\n".join(line for line in lines if line is not None), footer)
+        tokens = count_tokens(prompt)
+
+    report = {"template": template, "budget": budget, "tokens_before": before, "tokens_after": tokens,
+              "top_k": top_k, "dropped_lines": dropped, "over_budget": budget is not None and tokens > budget}
+    with _lock:
+        totals = _totals[template]
+        totals["prompts"] += 1
+        totals["tokens_before"] += before
+        totals["tokens_after"] += tokens
+        totals["over_budget"] += report["over_budget"]
+    return prompt, report
+
+
+def stats() -> dict:
+    """Per template: prompts built, summed tokens before / after compaction, prompts left over budget."""
+    with _lock:
+        return {template: dict(totals) for template, totals in _totals.items()}
@@ -4,3 +4,262 @@ import os
 load_dotenv()
 
 GROK_API_KEY = os.getenv("GROK_API_KEY")
+
+# ─── KPI Query Backend ───────────────────────────────────────────
+# "postgres" answers every window from live_transactions; "hybrid" reads
+# closed days from the Parquet export (DB/parquet_export.py) through DuckDB
+# and only the still-open days from Postgres.
+KPI_QUERY_BACKEND = os.getenv("KPI_QUERY_BACKEND", "postgres")
+PARQUET_DIR = os.getenv("PARQUET_DIR", os.path.join(os.path.dirname(__file__), "data", "parquet"))
+
+# ─── Columnar Cube (recent days, shared mmap) ────────────────────
+# When enabled, windows fully inside the last CUBE_DAYS days are answered
+# from memory-mapped NumPy arrays instead of Postgres.
+CUBE_ENABLED = os.getenv("CUBE_ENABLED", "false").lower() == "true"
+CUBE_DIR = os.getenv("CUBE_DIR", os.path.join(os.path.dirname(__file__), "data", "cube"))
+CUBE_DAYS = int(os.getenv("CUBE_DAYS", "64"))
+CUBE_REFRESH_SECONDS = float(os.getenv("CUBE_REFRESH_SECONDS", "15"))
+CUBE_MAX_STALENESS_SECONDS = float(os.getenv("CUBE_MAX_STALENESS_SECONDS", "120"))
+# rows created this recently are re-checked on every refresh, so one whose
+# lower id committed after a higher one (id past the watermark) is still loaded
+CUBE_LATE_SECONDS = float(os.getenv("CUBE_LATE_SECONDS", "300"))
+
+
+# ─── Approximate Query Mode ──────────────────────────────────────
+# accuracy=approx evaluates additive KPI queries on APPROX_REPLICATES
+# independent TABLESAMPLE SYSTEM samples totalling APPROX_SAMPLE_PERCENT of
+# live_transactions; accuracy=auto switches to it when the planner's cost
+# estimate for the page's windows exceeds APPROX_COST_BUDGET.
+APPROX_SAMPLE_PERCENT = float(os.getenv("APPROX_SAMPLE_PERCENT", "2"))
+APPROX_REPLICATES = int(os.getenv("APPROX_REPLICATES", "8"))
+APPROX_COST_BUDGET = float(os.getenv("APPROX_COST_BUDGET", "1000000"))
+APPROX_RESULT_TTL_SECONDS = float(os.getenv("APPROX_RESULT_TTL_SECONDS", "600"))
+
+# ─── Prefix-Sum Index ────────────────────────────────────────────
+# When enabled, additive KPI queries are answered for closed days from
+# in-process cumulative sums over the last PREFIX_INDEX_DAYS days
+# (KPI/utils/prefix_index.py), one entry per query and merchant.
+PREFIX_INDEX_ENABLED = os.getenv("PREFIX_INDEX_ENABLED", "false").lower() == "true"
+PREFIX_INDEX_DAYS = int(os.getenv("PREFIX_INDEX_DAYS", "800"))
+PREFIX_INDEX_MAX_ENTRIES = int(os.getenv("PREFIX_INDEX_MAX_ENTRIES", "256"))
+
+# ─── Time-Sharded Scans ──────────────────────────────────────────
+# When enabled, additive queries over windows of at least SHARD_MIN_DAYS
+# are split into month-aligned shards (or fixed SHARD_DAYS-day shards when
+# SHARD_DAYS > 0) and run in parallel on SHARD_WORKERS pooled connections.
+SHARD_ENABLED = os.getenv("SHARD_ENABLED", "false").lower() == "true"
+SHARD_DAYS = int(os.getenv("SHARD_DAYS", "0"))
+SHARD_MIN_DAYS = int(os.getenv("SHARD_MIN_DAYS", "62"))
+SHARD_WORKERS = int(os.getenv("SHARD_WORKERS", "4"))
+
+# ─── Live Push (WebSocket / SSE) ─────────────────────────────────
+# The tailer polls live_transactions past its id watermark every
+# LIVE_POLL_SECONDS, LIVE_BATCH_ROWS rows at a time.
+LIVE_POLL_SECONDS = float(os.getenv("LIVE_POLL_SECONDS", "2"))
+LIVE_BATCH_ROWS = int(os.getenv("LIVE_BATCH_ROWS", "5000"))
+LIVE_QUEUE_SIZE = int(os.getenv("LIVE_QUEUE_SIZE", "100"))
+
+# ─── Dashboard Running Totals ────────────────────────────────────
+# All-time dashboard figures are kept as counters (DB/dashboard_counters.py)
+# advanced from an id watermark and rebuilt by a periodic full reconciliation.
+DASHBOARD_COUNTERS_ENABLED = os.getenv("DASHBOARD_COUNTERS_ENABLED", "false").lower() == "true"
+DASHBOARD_COUNTERS_SECONDS = float(os.getenv("DASHBOARD_COUNTERS_SECONDS", "10"))
+DASHBOARD_COUNTERS_BATCH_ROWS = int(os.getenv("DASHBOARD_COUNTERS_BATCH_ROWS", "50000"))
+DASHBOARD_RECONCILE_SECONDS = float(os.getenv("DASHBOARD_RECONCILE_SECONDS", "86400"))
+
+# ─── Daily Sketches ──────────────────────────────────────────────
+# Distinct counts and ticket-size percentiles are merged from per-day
+# HyperLogLog / t-digest sketches (DB/daily_sketches.py) once they exist.
+# Build the history once with `python -m DB.daily_sketches` before enabling;
+# then every DAILY_SKETCHES_SECONDS one worker sketches the days closed
+# since the last build, so the pages keep off raw COUNT(DISTINCT) /
+# percentile_cont scans.
+DAILY_SKETCHES_ENABLED = os.getenv("DAILY_SKETCHES_ENABLED", "false").lower() == "true"
+DAILY_SKETCHES_SECONDS = float(os.getenv("DAILY_SKETCHES_SECONDS", "3600"))
+
+# ─── Daily Geo Aggregate ─────────────────────────────────────────
+# The demographic page reads closed days from geo_daily (DB/geo_daily.py)
+# and aggregates only the days after its watermark from live_transactions.
+# Build it once with `python -m DB.geo_daily` before enabling; then every
+# GEO_DAILY_SECONDS one worker adds the days closed since the last refresh.
+GEO_DAILY_ENABLED = os.getenv("GEO_DAILY_ENABLED", "false").lower() == "true"
+GEO_DAILY_SECONDS = float(os.getenv("GEO_DAILY_SECONDS", "3600"))
+
+# ─── Dimension Dictionary ────────────────────────────────────────
+# Acquirer and merchant names and enum labels are held in process
+# (KPI/utils/dimensions.py) so KPI queries group by ids without joining;
+# a cheap version query checks for changes at most every
+# DIMENSION_CHECK_SECONDS.
+DIMENSION_CHECK_SECONDS = float(os.getenv("DIMENSION_CHECK_SECONDS", "30"))
+
+# ─── Query Deadlines ─────────────────────────────────────────────
+# Each /api request (except the live feeds) runs its queries under a
+# deadline (KPI/utils/query_guard.py): in-flight statements are cancelled
+# when it expires or the client disconnects, later ones are skipped, and
+# the same value is the transaction's statement_timeout. QUERY_DEADLINES
+# ("path=seconds,...") overrides the per-endpoint defaults below; the
+# longest matching path prefix wins.
+QUERY_DEADLINE_SECONDS = float(os.getenv("QUERY_DEADLINE_SECONDS", "30"))
+QUERY_DEADLINES = {
+    "/api/dashboard":              10.0,
+    "/api/financial-performance":  20.0,
+    "/api/operational-efficiency": 15.0,
+    "/api/risk-and-fraud":         15.0,
+    "/api/gateway-fee":            15.0,
+    "/api/demographic":            15.0,
+    "/api/customer-insights":      15.0,
+    "/api/portfolio":              30.0,
+    **{path: float(seconds) for path, seconds in
+       (item.split("=", 1) for item in os.getenv("QUERY_DEADLINES", "").split(",") if item)},
+}
+QUERY_DEADLINE_EXEMPT = ("/api/live", "/api/exact-results")
+
+# ─── Admission Control ───────────────────────────────────────────
+# /api requests are classed by cost (KPI/utils/admission.py): "insight"
+# (LLM calls), "heavy" (windows spanning more than ADMISSION_HEAVY_DAYS,
+# batches, the all-time dashboard without counters) and "cheap". Each class
+# runs at most <limit> requests at once with up to <queue> waiting at most
+# ADMISSION_QUEUE_SECONDS; the rest get 503 + Retry-After. With
+# ADMISSION_CLIENT_LIMIT > 0 a client (X-Client-Id header, else its IP) may
+# have at most that many requests in flight and gets 429 beyond it.
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "true").lower() == "true"
+ADMISSION_LIMITS = {  # class → (concurrent, queued)
+    "cheap":   (int(os.getenv("ADMISSION_CHEAP_LIMIT", "16")),  int(os.getenv("ADMISSION_CHEAP_QUEUE", "64"))),
+    "heavy":   (int(os.getenv("ADMISSION_HEAVY_LIMIT", "4")),   int(os.getenv("ADMISSION_HEAVY_QUEUE", "8"))),
+    "insight": (int(os.getenv("ADMISSION_INSIGHT_LIMIT", "4")), int(os.getenv("ADMISSION_INSIGHT_QUEUE", "8"))),
+}
+ADMISSION_HEAVY_DAYS = int(os.getenv("ADMISSION_HEAVY_DAYS", "62"))
+ADMISSION_QUEUE_SECONDS = float(os.getenv("ADMISSION_QUEUE_SECONDS", "5"))
+ADMISSION_CLIENT_LIMIT = int(os.getenv("ADMISSION_CLIENT_LIMIT", "0"))
+# how often the days the cube / prefix index answer are re-read for classifying
+# requests, off the event loop
+ADMISSION_COVERAGE_SECONDS = float(os.getenv("ADMISSION_COVERAGE_SECONDS", "30"))
+
+# ─── Slow-Query Plan Capture ─────────────────────────────────────
+# A SELECT slower than SLOW_QUERY_SECONDS is re-run under EXPLAIN (ANALYZE,
+# BUFFERS) on a background thread, with probability PLAN_CAPTURE_SAMPLE and
+# at most once per PLAN_CAPTURE_INTERVAL seconds per query label
+# (KPI/utils/plan_capture.py). The plan is compared with the label's last
+# known-good plan; an index scan turned seq scan, a row estimate off by
+# PLAN_MISESTIMATE_FACTOR or more, or PLAN_SLOWDOWN_FACTOR times the
+# execution time is reported as a regression under /api/admin/plans.
+# Statements of a psycopg 3 pipeline are timed as one round trip; when it is
+# slow, each is offered under its own "[i/n]" label. Off by default: each
+# capture re-executes a slow query on the server that was just slow.
+PLAN_CAPTURE_ENABLED = os.getenv("PLAN_CAPTURE_ENABLED", "false").lower() == "true"
+SLOW_QUERY_SECONDS = float(os.getenv("SLOW_QUERY_SECONDS", "0.5"))
+PLAN_CAPTURE_SAMPLE = float(os.getenv("PLAN_CAPTURE_SAMPLE", "0.25"))
+PLAN_CAPTURE_INTERVAL = float(os.getenv("PLAN_CAPTURE_INTERVAL", "600"))
+PLAN_CAPTURE_TIMEOUT = float(os.getenv("PLAN_CAPTURE_TIMEOUT", "60"))
+PLAN_MISESTIMATE_FACTOR = float(os.getenv("PLAN_MISESTIMATE_FACTOR", "10"))
+PLAN_SLOWDOWN_FACTOR = float(os.getenv("PLAN_SLOWDOWN_FACTOR", "2"))
+
+# ─── Admin Endpoints ─────────────────────────────────────────────
+# /api/admin/* answers only requests carrying this token (X-Admin-Token
+# header or admin_token query parameter); unset, the endpoints are off.
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+# ─── Sampling Profiler ───────────────────────────────────────────
+# An admin request with `X-Profile: 1` (or ?profile=1) is sampled every
+# PROFILE_INTERVAL seconds while its handler runs; the speedscope profile is
+# kept in memory (the last PROFILE_KEEP) and linked from the response's
+# X-Profile header. PROFILE_CONTINUOUS samples all request threads every
+# PROFILE_CONTINUOUS_INTERVAL seconds and aggregates hot frames.
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.002"))
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "20"))
+PROFILE_CONTINUOUS = os.getenv("PROFILE_CONTINUOUS", "false").lower() == "true"
+PROFILE_CONTINUOUS_INTERVAL = float(os.getenv("PROFILE_CONTINUOUS_INTERVAL", "0.02"))
+
+# ─── Connection Pool & Worker Startup ────────────────────────────
+# The KPI modules share one lazily created engine (DB/connector.py) whose
+# pool is sized for the admission limits above. Before a worker accepts
+# traffic, the warm-up hook (KPI/utils/warmup.py) opens WARMUP_CONNECTIONS
+# pool connections and loads the dimension dictionary, the token encoder and
+# the LLM client.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "true").lower() == "true"
+WARMUP_CONNECTIONS = int(os.getenv("WARMUP_CONNECTIONS", "4"))
+
+# ─── Read Replicas ───────────────────────────────────────────────
+# Comma-separated "host[:port]" list of read replicas (same user, password
+# and database as the primary). Request-scoped KPI and GraphQL reads are
+# routed to the least busy replica (KPI/utils/replicas.py); writes and
+# background jobs stay on the primary. A monitor compares each replica's
+# newest transaction with the primary's every REPLICA_LAG_CHECK_SECONDS:
+# windows that include today fall back to the primary while a replica lags
+# more than REPLICA_MAX_LAG_SECONDS, closed windows read from any replica
+# that has replayed past their end.
+DB_REPLICA_HOSTS = [h.strip() for h in os.getenv("DB_REPLICA_HOSTS", "").split(",") if h.strip()]
+REPLICA_MAX_LAG_SECONDS = float(os.getenv("REPLICA_MAX_LAG_SECONDS", "5"))
+REPLICA_LAG_CHECK_SECONDS = float(os.getenv("REPLICA_LAG_CHECK_SECONDS", "2"))
+
+# ─── Insight Prompt Compaction ───────────────────────────────────
+# Chart and metric payloads are summarized before they go into an insight
+# prompt (LLM/prompt_compaction.py): the PROMPT_TOP_K largest categories
+# with their shares, the rest folded into "other", plus totals, deltas and
+# stat-test flags. Each template is held to its token budget; the top-k
+# shrinks, then metric lines are dropped, until the prompt fits.
+# PROMPT_TOKEN_BUDGETS ("template=tokens,...") overrides the defaults below.
+PROMPT_TOP_K = int(os.getenv("PROMPT_TOP_K", "8"))
+PROMPT_TOKEN_BUDGETS = {
+    "customer":    500,
+    "demographic": 800,
+    "gateway_fee": 600,
+    **{name: int(tokens) for name, tokens in
+       (item.split("=", 1) for item in os.getenv("PROMPT_TOKEN_BUDGETS", "").split(",") if item)},
+}
+
+# ─── Insight Cache ───────────────────────────────────────────────
+# /demographic/insight and /gateway-fee/insight reuse an earlier insight
+# while the page's data has not changed materially (LLM/insight_cache.py).
+# The key is a fingerprint of the charts and metrics: values in relative
+# buckets INSIGHT_CACHE_TOLERANCE wide (changes in percent in steps of
+# 100 × that many points), the order of each chart's top
+# INSIGHT_CACHE_RANKS categories and the stat-test significance flags.
+# Insights are kept in insight_cache for INSIGHT_CACHE_TTL seconds, with
+# the last INSIGHT_CACHE_SIZE in memory.
+INSIGHT_CACHE_ENABLED = os.getenv("INSIGHT_CACHE_ENABLED", "true").lower() == "true"
+INSIGHT_CACHE_TOLERANCE = float(os.getenv("INSIGHT_CACHE_TOLERANCE", "0.02"))
+INSIGHT_CACHE_RANKS = int(os.getenv("INSIGHT_CACHE_RANKS", "5"))
+INSIGHT_CACHE_TTL = float(os.getenv("INSIGHT_CACHE_TTL", "86400"))
+INSIGHT_CACHE_SIZE = int(os.getenv("INSIGHT_CACHE_SIZE", "512"))
+
+# ─── Background Insight Jobs ─────────────────────────────────────
+# POST /api/insight-jobs queues an insight in insight_jobs; every app worker
+# runs INSIGHT_JOB_WORKERS threads that claim queued jobs (SKIP LOCKED), so
+# any worker can answer the poll. A job that fails is retried up to
+# INSIGHT_JOB_ATTEMPTS times with exponential backoff from
+# INSIGHT_JOB_BACKOFF seconds; one left running for INSIGHT_JOB_TIMEOUT
+# seconds (its worker died) is claimed again. Results also land in the
+# insight cache, so clicks on the same data are answered from it.
+# Without INSIGHT_JOBS_ENABLED, queued jobs wait for a standalone
+# `python -m LLM.insight_jobs --work` process.
+# With INSIGHT_PRECOMPUTE_ENABLED (paid LLM calls for every page), after the
+# daily close (INSIGHT_PRECOMPUTE_AT, local time) one worker queues every
+# insight page for INSIGHT_PRECOMPUTE_FILTERS, for each page's default
+# merchant and INSIGHT_PRECOMPUTE_MERCHANTS.
+INSIGHT_JOBS_ENABLED = os.getenv("INSIGHT_JOBS_ENABLED", "false").lower() == "true"
+INSIGHT_JOB_WORKERS = int(os.getenv("INSIGHT_JOB_WORKERS", "2"))
+INSIGHT_JOB_ATTEMPTS = int(os.getenv("INSIGHT_JOB_ATTEMPTS", "3"))
+INSIGHT_JOB_BACKOFF = float(os.getenv("INSIGHT_JOB_BACKOFF", "30"))
+INSIGHT_JOB_TIMEOUT = float(os.getenv("INSIGHT_JOB_TIMEOUT", "300"))
+INSIGHT_JOB_POLL_SECONDS = float(os.getenv("INSIGHT_JOB_POLL_SECONDS", "2"))
+INSIGHT_PRECOMPUTE_ENABLED = os.getenv("INSIGHT_PRECOMPUTE_ENABLED", "false").lower() == "true"
+INSIGHT_PRECOMPUTE_AT = os.getenv("INSIGHT_PRECOMPUTE_AT", "00:30")
+INSIGHT_PRECOMPUTE_FILTERS = [f.strip() for f in
+                              os.getenv("INSIGHT_PRECOMPUTE_FILTERS", "Yesterday,Daily,Weekly,MTD,Monthly,YTD").split(",")
+                              if f.strip()]
+INSIGHT_PRECOMPUTE_MERCHANTS = [int(m) for m in os.getenv("INSIGHT_PRECOMPUTE_MERCHANTS", "").split(",") if m.strip()]
+
+# ─── Report Export ───────────────────────────────────────────────
+# Bulk export of KPI pages for many merchants and windows
+# (KPI/report_export.py). EXPORT_WORKERS processes split a budget of
+# EXPORT_DB_CONNECTIONS pooled connections between them, so a large export
+# cannot take more of the database than the budget allows. Each report is
+# written to its own file under EXPORT_DIR in EXPORT_FORMAT (csv, parquet
+# or json); a rerun skips the reports whose files already exist.
+EXPORT_WORKERS = int(os.getenv("EXPORT_WORKERS", "4"))
+EXPORT_DB_CONNECTIONS = int(os.getenv("EXPORT_DB_CONNECTIONS", "4"))
+EXPORT_FORMAT = os.getenv("EXPORT_FORMAT", "csv")
+EXPORT_DIR = os.getenv("EXPORT_DIR", os.path.join(os.path.dirname(__file__), "data", "exports"))
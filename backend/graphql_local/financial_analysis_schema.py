@@ -1,12 +1,12 @@
 from datetime import date
 from typing import List, Optional
 from sqlalchemy import text
-from DB.connector import get_engine
+from DB.connector import lazy_engine
 from KPI.utils.time_utils import get_date_ranges  # Custom util for date filtering
 import strawberry
 
 # --- DB Engine ---
-engine = get_engine()
+engine = lazy_engine()
 
 # --- Output Types ---
 @strawberry.type
@@ -0,0 +1,88 @@
+# backend/loadtest/grok_stub.py
+
+import random
+import sys
+import time
+import types
+from dataclasses import dataclass
+
+
+@dataclass
+class StubSettings:
+    """
+    Behaviour of the offline Grok stand-in.
+    latency_ms ± jitter_ms is slept per sample(); error_rate is the share of
+    calls that raise, mimicking upstream timeouts / 5xx from the xai API.
+    """
+    latency_ms: float = 800.0
+    jitter_ms: float = 400.0
+    error_rate: float = 0.0
+    calls: int = 0
+    failures: int = 0
+
+
+settings = StubSettings()
+
+
+class _Response:
+    def __init__(self, content: str):
+        self.content = content
+
+
+class _StubChat:
+    def __init__(self, model: str):
+        self.model = model
+        self.messages = []
+
+    def append(self, message):
+        self.messages.append(message)
+
+    def sample(self) -> _Response:
+        settings.calls += 1
+        delay = max(0.0, settings.latency_ms + random.uniform(-settings.jitter_ms, settings.jitter_ms))
+        time.sleep(delay / 1000.0)
+
+        if random.random() < settings.error_rate:
+            settings.failures += 1
+            raise RuntimeError("stub xai: upstream unavailable")
+
+        prompt = next((text for role, text in reversed(self.messages) if role == "user"), "")
+        return _Response(
+            "- Volume is concentrated in a few acquirers; monitor concentration risk.\n"
+            "- Success rates are stable versus the comparison window.\n"
+            f"- (stub insight for a {len(prompt)}-char prompt)"
+        )
+
+
+class _StubChatFactory:
+    def create(self, model: str = "grok-4") -> _StubChat:
+        return _StubChat(model)
+
+
+class StubClient:
+    """Drop-in replacement for xai_sdk.Client used by LLM/grok_client.py."""
+
+    def __init__(self, api_key: str | None = None, **_):
+        self.api_key = api_key
+        self.chat = _StubChatFactory()
+
+
+def install(latency_ms: float = 800.0, jitter_ms: float = 400.0, error_rate: float = 0.0) -> StubSettings:
+    """
+    Registers fake `xai_sdk` and `xai_sdk.chat` modules in sys.modules.
+    Must be called before anything imports LLM.grok_client.
+    """
+    settings.latency_ms = latency_ms
+    settings.jitter_ms = jitter_ms
+    settings.error_rate = error_rate
+
+    sdk = types.ModuleType("xai_sdk")
+    chat = types.ModuleType("xai_sdk.chat")
+    sdk.Client = StubClient
+    chat.user = lambda text: ("user", text)
+    chat.system = lambda text: ("system", text)
+    sdk.chat = chat
+
+    sys.modules["xai_sdk"] = sdk
+    sys.modules["xai_sdk.chat"] = chat
+    return settings
@@ -0,0 +1,235 @@
+# backend/loadtest/run.py
+"""
+End-to-end load test: boots `main.app` in-process with uvicorn against the
+Postgres configured through DB_* (seed it first with `python -m loadtest.seed`),
+replaces the xai SDK with an offline stub, replays the traffic mix from
+loadtest/traffic.py and reports per-endpoint throughput, latency percentiles,
+error rates and DB pool saturation.
+
+    cd backend
+    python -m loadtest.seed --days 400 --rows-per-day 2000
+    python -m loadtest.run --users 32 --duration 60 --llm-latency-ms 1500
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from loadtest import grok_stub
+from loadtest.traffic import next_call
+
+
+# ─── Pool Saturation Sampler ─────────────────────────────────────
+class PoolSampler(threading.Thread):
+    """
+    Periodically samples every SQLAlchemy engine created by the app modules
+    and records checked-out connections against the pool capacity.
+    """
+
+    def __init__(self, interval: float = 0.05):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.samples = defaultdict(list)
+        self._stop_event = threading.Event()
+
+    @staticmethod
+    def engines() -> dict:
+        from sqlalchemy.engine import Engine
+        from DB.connector import LazyEngine, shared_engine
+
+        found = {}
+        for name, module in list(sys.modules.items()):
+            engine = getattr(module, "engine", None)
+            if isinstance(engine, LazyEngine):
+                engine = shared_engine()
+            if isinstance(engine, Engine) and id(engine) not in {id(e) for e in found.values()}:
+                found[name] = engine
+        return found
+
+    def run(self):
+        while not self._stop_event.is_set():
+            for name, engine in self.engines().items():
+                pool = engine.pool
+                capacity = pool.size() + max(getattr(pool, "_max_overflow", 0), 0)
+                self.samples[name].append((pool.checkedout(), capacity))
+            time.sleep(self.interval)
+
+    def stop(self):
+        self._stop_event.set()
+
+    def report(self) -> dict:
+        out = {}
+        for name, points in self.samples.items():
+            used = np.array([p[0] for p in points], dtype=float)
+            capacity = points[-1][1] or 1
+            out[name] = {
+                "capacity": capacity,
+                "max_checked_out": int(used.max()) if used.size else 0,
+                "mean_utilisation_pct": round(float(used.mean() / capacity * 100), 1) if used.size else 0.0,
+                "saturated_pct": round(float((used >= capacity).mean() * 100), 1) if used.size else 0.0,
+            }
+        return out
+
+
+# ─── App Boot ────────────────────────────────────────────────────
+def start_server(host: str, port: int):
+    import uvicorn
+    from main import app
+
+    server = uvicorn.Server(uvicorn.Config(app, host=host, port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+
+    deadline = time.time() + 30
+    while not server.started:
+        if time.time() > deadline:
+            raise RuntimeError("uvicorn did not start within 30s")
+        time.sleep(0.05)
+    return server, thread
+
+
+# ─── Traffic Replay ──────────────────────────────────────────────
+def send(base_url: str, call, timeout: float) -> tuple[int, float]:
+    url = base_url + call.path
+    data = None
+    headers = {"Accept": "application/json"}
+    if call.params:
+        url += "?" + urllib.parse.urlencode(call.params)
+    if call.json is not None:
+        data = json.dumps(call.json).encode()
+        headers["Content-Type"] = "application/json"
+
+    req = urllib.request.Request(url, data=data, headers=headers, method=call.method)
+    t0 = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            body = resp.read()
+            status = resp.status
+        # GraphQL reports resolver failures with HTTP 200 and an `errors` array
+        if call.json is not None and b'"errors"' in body:
+            status = 500
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except Exception:
+        status = 0
+    return status, time.perf_counter() - t0
+
+
+def run_load(base_url: str, users: int, duration: float, think_ms: float, timeout: float, seed: int) -> dict:
+    results = defaultdict(list)
+    lock = threading.Lock()
+    stop_at = time.time() + duration
+
+    def user(idx: int):
+        rng = random.Random(seed + idx)
+        while time.time() < stop_at:
+            call = next_call(rng)
+            status, elapsed = send(base_url, call, timeout)
+            with lock:
+                results[call.label].append((status, elapsed))
+            if think_ms:
+                time.sleep(rng.expovariate(1000.0 / think_ms))
+
+    started = time.time()
+    with ThreadPoolExecutor(max_workers=users) as pool:
+        list(pool.map(user, range(users)))
+    return {"elapsed": time.time() - started, "results": results}
+
+
+def summarize(load: dict) -> dict:
+    elapsed = load["elapsed"]
+    endpoints = {}
+    for label, samples in sorted(load["results"].items()):
+        latencies = np.array([s[1] for s in samples]) * 1000
+        errors = sum(1 for s in samples if not 200 <= s[0] < 400)
+        endpoints[label] = {
+            "requests": len(samples),
+            "rps": round(len(samples) / elapsed, 2),
+            "error_rate_pct": round(errors / len(samples) * 100, 2),
+            "p50_ms": round(float(np.percentile(latencies, 50)), 1),
+            "p90_ms": round(float(np.percentile(latencies, 90)), 1),
+            "p95_ms": round(float(np.percentile(latencies, 95)), 1),
+            "p99_ms": round(float(np.percentile(latencies, 99)), 1),
+            "max_ms": round(float(latencies.max()), 1),
+        }
+    total = sum(e["requests"] for e in endpoints.values())
+    return {
+        "duration_s": round(elapsed, 1),
+        "total_requests": total,
+        "throughput_rps": round(total / elapsed, 2) if elapsed else 0.0,
+        "endpoints": endpoints,
+    }
+
+
+def print_report(summary: dict):
+    print(f"\n{summary['total_requests']} requests in {summary['duration_s']}s "
+          f"→ {summary['throughput_rps']} req/s")
+    header = f"{'endpoint':<45}{'n':>7}{'rps':>8}{'err%':>7}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}"
+    print(header)
+    print("─" * len(header))
+    for label, e in summary["endpoints"].items():
+        print(f"{label:<45}{e['requests']:>7}{e['rps']:>8}{e['error_rate_pct']:>7}"
+              f"{e['p50_ms']:>9}{e['p95_ms']:>9}{e['p99_ms']:>9}{e['max_ms']:>9}")
+
+    print("\nDB pool saturation")
+    for name, p in summary["pools"].items():
+        print(f"  {name:<40} cap={p['capacity']:<4} max_out={p['max_checked_out']:<4} "
+              f"mean={p['mean_utilisation_pct']}%  saturated={p['saturated_pct']}% of samples")
+
+    llm = summary["llm_stub"]
+    print(f"\nLLM stub: {llm['calls']} calls, {llm['failures']} injected failures")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the dashboard API with an offline Grok stub.")
+    parser.add_argument("--users", type=int, default=16, help="concurrent virtual users")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds of traffic")
+    parser.add_argument("--think-ms", type=float, default=250.0, help="mean pause between a user's requests")
+    parser.add_argument("--timeout", type=float, default=60.0, help="per-request client timeout (s)")
+    parser.add_argument("--llm-latency-ms", type=float, default=800.0)
+    parser.add_argument("--llm-jitter-ms", type=float, default=400.0)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", help="also write the summary to this file")
+    args = parser.parse_args()
+
+    # The stub has to be in place before main imports LLM.grok_client.
+    os.environ.setdefault("XAI_API_KEY", "offline-stub")
+    grok_stub.install(args.llm_latency_ms, args.llm_jitter_ms, args.llm_error_rate)
+
+    server, thread = start_server(args.host, args.port)
+    sampler = PoolSampler()
+    sampler.start()
+    try:
+        load = run_load(f"http://{args.host}:{args.port}", args.users, args.duration,
+                        args.think_ms, args.timeout, args.seed)
+    finally:
+        sampler.stop()
+        server.should_exit = True
+        thread.join(timeout=10)
+
+    summary = summarize(load)
+    summary["pools"] = sampler.report()
+    summary["llm_stub"] = {"calls": grok_stub.settings.calls, "failures": grok_stub.settings.failures}
+    print_report(summary)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
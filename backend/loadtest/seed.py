@@ -0,0 +1,151 @@
+# backend/loadtest/seed.py
+
+import argparse
+from sqlalchemy import text
+from DB.connector import get_engine
+
+# Mirrors the columns the KPI modules read; not a full copy of production DDL.
+SCHEMA_SQL = [
+    """
+    DO $$ BEGIN
+        CREATE TYPE region_enum AS ENUM ('North America', 'Europe', 'Asia Pacific', 'Latin America', 'Middle East & Africa');
+    EXCEPTION WHEN duplicate_object THEN NULL;
+    END $$;
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS acquirer (
+        id   SERIAL PRIMARY KEY,
+        name TEXT NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS merchant (
+        id      INTEGER PRIMARY KEY,
+        name    TEXT NOT NULL,
+        country TEXT NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS live_transactions (
+        id                   BIGSERIAL PRIMARY KEY,
+        created_at           TIMESTAMP NOT NULL,
+        merchant_id          INTEGER NOT NULL,
+        acquirer_id          INTEGER NOT NULL,
+        amount               NUMERIC(14, 2) NOT NULL,
+        usd_value            NUMERIC(14, 2) NOT NULL,
+        transaction_currency TEXT NOT NULL,
+        transaction_type     TEXT NOT NULL,
+        creation_type        TEXT NOT NULL,
+        credit_card_type     TEXT NOT NULL,
+        funding_source       TEXT NOT NULL,
+        sca_type             TEXT NOT NULL,
+        country_code         TEXT NOT NULL,
+        state_or_province    TEXT,
+        issuer_country_code  TEXT,
+        region               region_enum NOT NULL,
+        payment_successful   BOOLEAN NOT NULL,
+        fraud                BOOLEAN NOT NULL,
+        pred_fraud           BOOLEAN NOT NULL,
+        pricing_ic           NUMERIC(6, 3) NOT NULL,
+        gateway_fee          NUMERIC(10, 4) NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS live_transactions_created_at_idx ON live_transactions (created_at)",
+    "CREATE INDEX IF NOT EXISTS live_transactions_merchant_created_idx ON live_transactions (merchant_id, created_at)",
+]
+
+ACQUIRERS = ["Adyen", "Stripe", "Worldpay", "Checkout.com", "Braintree", "Nuvei", "Global Payments", "Fiserv"]
+MERCHANT_IDS = list(range(20, 40))  # includes the hardcoded MERCHANT_ID = 26
+
+# Generates `rows_per_day` transactions for every day in [now - days, now]
+# entirely server-side, so seeding millions of rows is a single statement.
+SEED_SQL = """
+    INSERT INTO live_transactions (
+        created_at, merchant_id, acquirer_id, amount, usd_value, transaction_currency,
+        transaction_type, creation_type, credit_card_type, funding_source, sca_type,
+        country_code, state_or_province, issuer_country_code, region,
+        payment_successful, fraud, pred_fraud, pricing_ic, gateway_fee
+    )
+    SELECT
+        b.day + (random() * INTERVAL '1 day'),
+        (ARRAY[:merchants])[1 + floor(random() * :n_merchants)::int],
+        (SELECT min(id) FROM acquirer) + floor(random() * :n_acquirers)::int,
+        b.usd,
+        b.usd,
+        (ARRAY['USD','USD','USD','GBP','GBP','EUR','CAD','AUD'])[1 + floor(random() * 8)::int],
+        (ARRAY['SALE','SALE','SALE','AUTH','REFUND','RECURRING'])[1 + floor(random() * 6)::int],
+        (ARRAY['ECOM','ECOM','MOTO','POS','API'])[1 + floor(random() * 5)::int],
+        (ARRAY['VISA','VISA','MASTERCARD','MASTERCARD','AMEX','DISCOVER','JCB'])[1 + floor(random() * 7)::int],
+        (ARRAY['CREDIT','CREDIT','DEBIT','PREPAID'])[1 + floor(random() * 4)::int],
+        (ARRAY['THREEDS_2_0','THREEDS_2_0','NONE'])[1 + floor(random() * 3)::int],
+        b.country,
+        CASE b.country
+            WHEN 'US' THEN (ARRAY['CA','NY','TX','FL','WA','IL','GA','MA'])[1 + floor(random() * 8)::int]
+            WHEN 'GB' THEN (ARRAY['England','Scotland','Wales','Northern Ireland'])[1 + floor(random() * 4)::int]
+        END,
+        (ARRAY['US','US','GB','DE','FR','CA','IN'])[1 + floor(random() * 7)::int],
+        CAST(CASE WHEN b.country IN ('US','CA') THEN 'North America'
+                  WHEN b.country IN ('GB','DE','FR') THEN 'Europe'
+                  WHEN b.country = 'BR' THEN 'Latin America'
+                  WHEN b.country = 'IN' THEN 'Asia Pacific'
+                  ELSE 'Middle East & Africa' END AS region_enum),
+        random() < 0.93,
+        random() < 0.015,
+        random() < 0.012,
+        1.5 + random() * 1.5,
+        0.10 + random() * 0.25
+      FROM (
+        SELECT d.day,
+               round((exp(random() * 6) + 1)::numeric, 2) AS usd,
+               (ARRAY['US','US','US','GB','GB','DE','FR','CA','BR','IN','AE'])[1 + floor(random() * 11)::int] AS country
+          FROM generate_series(CURRENT_DATE - :days * INTERVAL '1 day', CURRENT_DATE, INTERVAL '1 day') AS d(day)
+         CROSS JOIN generate_series(1, :rows_per_day) AS r(n)
+      ) AS b
+"""
+
+
+def seed(engine=None, days: int = 400, rows_per_day: int = 2000, reset: bool = False) -> int:
+    """
+    Creates the minimal schema and fills live_transactions with synthetic rows.
+    Returns the number of transaction rows in the table afterwards.
+    """
+    engine = engine or get_engine()
+
+    with engine.begin() as conn:
+        for stmt in SCHEMA_SQL:
+            conn.execute(text(stmt))
+
+        if reset:
+            conn.execute(text("TRUNCATE live_transactions, acquirer, merchant RESTART IDENTITY"))
+
+        if not conn.execute(text("SELECT COUNT(*) FROM acquirer")).scalar():
+            conn.execute(text("INSERT INTO acquirer (name) SELECT unnest(CAST(:names AS text[]))"),
+                         {"names": ACQUIRERS})
+        conn.execute(text("""
+            INSERT INTO merchant (id, name, country)
+            SELECT m, 'Merchant ' || m, (ARRAY['US','GB','DE','CA'])[1 + m % 4]
+              FROM unnest(CAST(:ids AS int[])) AS m
+            ON CONFLICT (id) DO NOTHING
+        """), {"ids": MERCHANT_IDS})
+
+        if reset or not conn.execute(text("SELECT EXISTS (SELECT 1 FROM live_transactions)")).scalar():
+            conn.execute(text(SEED_SQL.replace(":merchants", ",".join(map(str, MERCHANT_IDS)))), {
+                "n_merchants": len(MERCHANT_IDS),
+                "n_acquirers": len(ACQUIRERS),
+                "days": days,
+                "rows_per_day": rows_per_day,
+            })
+
+        conn.execute(text("ANALYZE live_transactions"))
+        return conn.execute(text("SELECT COUNT(*) FROM live_transactions")).scalar()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Seed a local Postgres for load testing (uses DB_* from .env).")
+    parser.add_argument("--days", type=int, default=400)
+    parser.add_argument("--rows-per-day", type=int, default=2000)
+    parser.add_argument("--reset", action="store_true", help="truncate existing tables first")
+    args = parser.parse_args()
+
+    total = seed(days=args.days, rows_per_day=args.rows_per_day, reset=args.reset)
+    print(f"live_transactions rows: {total}")
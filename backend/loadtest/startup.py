@@ -0,0 +1,144 @@
+# backend/loadtest/startup.py
+"""
+Worker startup benchmark: how long `import main` takes and how long a fresh
+uvicorn worker needs to answer its first requests.
+
+Each run starts from a cold interpreter:
+  import      `import main` in a new process, plus its -X importtime tree,
+              which gives the slowest modules.
+  ready       time from spawning `uvicorn main:app` until GET --ready-path
+              answers. This includes the startup hooks (warm-up).
+  first page  latency of the first --path request on that worker, and the
+              time from spawn until it answered.
+
+Medians over --runs are printed. With --history they are appended to a
+JSONL file, together with the difference from the previous entry.
+
+    cd backend
+    python -m loadtest.startup --runs 5 --history startup_history.jsonl
+"""
+
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime, timezone
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _env() -> dict:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [BACKEND_DIR, env.get("PYTHONPATH")]))
+    return env
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def import_time() -> tuple[float, list]:
+    """Seconds to `import main` in a fresh interpreter and its ten slowest direct imports (cumulative)."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c",
+         "import time; t0 = time.perf_counter(); import main; print(time.perf_counter() - t0)"],
+        cwd=BACKEND_DIR, env=_env(), capture_output=True, text=True, check=True)
+    modules = []
+    for line in proc.stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            _, cumulative, name = line[len("import time:"):].split("|")
+            if cumulative.strip().isdigit():
+                modules.append((int(cumulative) / 1e6, name.rstrip()))
+    # direct imports of main: the name is indented by one level (" " + two spaces per level)
+    top = sorted(((s, n.strip()) for s, n in modules if n.startswith("   ") and n[3] != " "), reverse=True)[:10]
+    return float(proc.stdout.strip().splitlines()[-1]), top
+
+
+def _get(url: str, timeout: float = 60) -> int:
+    with urllib.request.urlopen(url, timeout=timeout) as r:
+        r.read()
+        return r.status
+
+
+def first_response(path: str, ready_path: str, timeout: float = 120) -> dict:
+    """Spawns a worker; seconds until it is ready and until its first `path` response."""
+    port = _free_port()
+    base = f"http://127.0.0.1:{port}"
+    t0 = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+                            cwd=BACKEND_DIR, env=_env(), stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    try:
+        while True:
+            if proc.poll() is not None:
+                raise RuntimeError(f"worker exited: {proc.stderr.read().decode()[-2000:]}")
+            if time.perf_counter() - t0 > timeout:
+                raise TimeoutError(f"worker not ready after {timeout}s")
+            try:
+                _get(base + ready_path, timeout=5)
+                break
+            except (urllib.error.URLError, ConnectionError):
+                time.sleep(0.02)
+        ready = time.perf_counter() - t0
+
+        t1 = time.perf_counter()
+        _get(base + path)
+        done = time.perf_counter()
+        return {"ready_s": ready, "first_page_s": done - t1, "spawn_to_first_page_s": done - t0}
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+
+
+def benchmark(runs: int, path: str, ready_path: str) -> dict:
+    imports, results, top = [], [], []
+    for i in range(runs):
+        seconds, slowest = import_time()
+        imports.append(seconds)
+        top = top or slowest
+        results.append(first_response(path, ready_path))
+        print(f"run {i + 1}/{runs}: import {seconds:.3f}s, ready {results[-1]['ready_s']:.3f}s, "
+              f"first page {results[-1]['first_page_s']:.3f}s")
+    summary = {"import_s": statistics.median(imports)}
+    for key in results[0]:
+        summary[key] = statistics.median(r[key] for r in results)
+    return {"summary": summary, "slowest_imports": top}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark worker import time and time to first response.")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--path", default="/api/financial-performance?filter_type=Today",
+                        help="first real request sent to each worker")
+    parser.add_argument("--ready-path", default="/api/query-stats", help="cheap route polled until the worker answers")
+    parser.add_argument("--history", help="JSONL file to append the medians to (and compare with its last entry)")
+    args = parser.parse_args()
+
+    result = benchmark(args.runs, args.path, args.ready_path)
+    summary = result["summary"]
+
+    previous = None
+    if args.history and os.path.exists(args.history):
+        with open(args.history) as f:
+            lines = [line for line in f if line.strip()]
+        previous = json.loads(lines[-1])["summary"] if lines else None
+
+    print(f"\nmedian of {args.runs} runs, seconds")
+    for key, value in summary.items():
+        delta = f"  ({value - previous[key]:+.3f} vs last)" if previous and key in previous else ""
+        print(f"  {key:<24}{value:>8.3f}{delta}")
+    print("\nslowest imports of main (cumulative, first run)")
+    for seconds, name in result["slowest_imports"]:
+        print(f"  {seconds:>8.3f}  {name}")
+
+    if args.history:
+        with open(args.history, "a") as f:
+            f.write(json.dumps({"at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                                "path": args.path, "runs": args.runs, **result}) + "\n")
@@ -0,0 +1,88 @@
+# backend/loadtest/traffic.py
+
+import random
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+
+FILTERS = ["Today", "Yesterday", "Daily", "Weekly", "MTD", "Monthly", "YTD"]
+FILTER_WEIGHTS = [25, 10, 15, 15, 15, 8, 12]
+REPORT_FILTERS = ["Daily", "Weekly", "MTD", "YTD"]
+
+CUSTOMER_CHARTS = ["Transactions by Acquirer", "Transaction Type Distribution", "Payment Creation Patterns"]
+
+DRILL_QUERY = """
+  query RevenueBreakdown($date: Date!) {
+    revenueBreakdownByDate(date: $date) {
+      paymentMethods { label value }
+      transactionTypes { label value }
+      currencies { label value }
+    }
+  }
+"""
+
+
+@dataclass
+class Call:
+    """One HTTP request of the traffic mix. `label` groups calls in the report."""
+    label: str
+    method: str
+    path: str
+    params: dict = field(default_factory=dict)
+    json: dict | None = None
+
+
+def _filter_params(rng: random.Random, custom_share: float = 0.1) -> dict:
+    if rng.random() < custom_share:
+        end = date.today() - timedelta(days=rng.randint(1, 30))
+        start = end - timedelta(days=rng.randint(7, 365))
+        return {"filter_type": "custom", "start": start.isoformat(), "end": end.isoformat()}
+    return {"filter_type": rng.choices(FILTERS, FILTER_WEIGHTS)[0]}
+
+
+def page_load(rng: random.Random) -> Call:
+    page = rng.choices(
+        ["dashboard", "financial", "operational", "risk", "demographic", "customer", "report"],
+        [20, 15, 12, 15, 12, 14, 12],
+    )[0]
+    if page == "dashboard":
+        return Call("GET /api/dashboard", "GET", "/api/dashboard")
+    if page == "report":
+        return Call("GET /api/gateway-fee", "GET", "/api/gateway-fee",
+                    {"filter_type": rng.choice(REPORT_FILTERS)})
+
+    path = {
+        "financial":   "/api/financial-performance",
+        "operational": "/api/operational-efficiency",
+        "risk":        "/api/risk-and-fraud",
+        "demographic": "/api/demographic",
+        "customer":    "/api/customer-insights",
+    }[page]
+    return Call(f"GET {path}", "GET", path, _filter_params(rng))
+
+
+def insight_click(rng: random.Random) -> Call:
+    kind = rng.choice(["demographic", "customer", "report"])
+    if kind == "demographic":
+        return Call("GET /api/demographic/insight", "GET", "/api/demographic/insight", _filter_params(rng, 0))
+    if kind == "customer":
+        params = _filter_params(rng, 0)
+        params["chart_id"] = rng.choice(CUSTOMER_CHARTS)
+        return Call("GET /api/customer-insights/insight", "GET", "/api/customer-insights/insight", params)
+    return Call("GET /api/gateway-fee/insight", "GET", "/api/gateway-fee/insight",
+                {"filter_type": rng.choice(REPORT_FILTERS)})
+
+
+def graphql_drilldown(rng: random.Random) -> Call:
+    day = date.today() - timedelta(days=rng.randint(0, 90))
+    return Call("POST /graphql revenueBreakdownByDate", "POST", "/graphql",
+                json={"query": DRILL_QUERY, "variables": {"date": day.isoformat()}})
+
+
+# Share of each interaction type in a realistic session: mostly page loads
+# and filter flips, occasional drill-downs, and comparatively rare AI clicks.
+MIX = [(page_load, 0.78), (graphql_drilldown, 0.14), (insight_click, 0.08)]
+
+
+def next_call(rng: random.Random) -> Call:
+    makers, weights = zip(*MIX)
+    return rng.choices(makers, weights)[0](rng)
@@ -11,26 +11,119 @@ from API.DemoGraphic import router as demographic_router
 from API.risk_and_fraud_management import router as risk_and_fraud_router
 from API.customer_insight import router as customer_insight_router
 from API.report import router as report_router
+from API.exact_results import router as exact_results_router
+from API.live import router as live_router
+from API.portfolio import router as portfolio_router
+from API.query_stats import router as query_stats_router
+from API.admin import router as admin_router
+from API.insight_jobs import router as insight_jobs_router
+
+# Background loaders, worker warm-up
+from DB.connector import shared_engine
+from KPI.utils.columnar_cube import start_refresher
+from DB.dashboard_counters import start_counter_job
+from DB.daily_sketches import start_sketch_job
+from DB.geo_daily import start_geo_daily_job
+from KPI.utils.warmup import warm_up
+from LLM.insight_jobs import start_insight_jobs
+
+# Query instrumentation, replica routing, deadlines / cancellation, admission control
+from KPI.utils.instrumentation import RequestTimingMiddleware, TimedJSONResponse
+from KPI.utils.profiler import ProfilingMiddleware, pin_handler_threads, start_continuous_profiler
+from KPI.utils.query_guard import QueryCancelled, QueryDeadlineMiddleware, query_cancelled_handler
+from KPI.utils.admission import AdmissionMiddleware, start_coverage_monitor
+from KPI.utils.replicas import ReplicaRoutingMiddleware, start_lag_monitor
+from config import ADMISSION_ENABLED, WARMUP_ENABLED
 
 # GraphQL Schema
 from graphql_local.financial_analysis_schema import Query  # This includes your `drillDown` field
 
-# ─── Setup FastAPI ───────────────────────────────────────────────
-app = FastAPI(title="A360 Prototype Dashboard API")
+# ─── App Factory ─────────────────────────────────────────────────
+def create_app() -> FastAPI:
+    """
+    Builds the app. Nothing here connects anywhere: engines, the LLM client
+    and the token encoder are created on first use or by the warm-up hook.
+    `uvicorn --factory main:create_app` builds a fresh app per worker.
+    """
+    # ─── Setup FastAPI ───────────────────────────────────────────
+    app = FastAPI(title="A360 Prototype Dashboard API", default_response_class=TimedJSONResponse)
+
+    # ─── Request Timing ──────────────────────────────────────────
+    # innermost, so Server-Timing covers the handler only, not queueing
+    app.add_middleware(RequestTimingMiddleware)
+
+    # ─── Profiling ───────────────────────────────────────────────
+    # admin requests with X-Profile: 1 are sampled while their handler runs
+    app.add_middleware(ProfilingMiddleware)
+
+    # ─── Read Replicas ───────────────────────────────────────────
+    # picks the engine each request reads from (no-op without DB_REPLICA_HOSTS)
+    app.add_middleware(ReplicaRoutingMiddleware)
+
+    # ─── Query Deadlines ─────────────────────────────────────────
+    app.add_middleware(QueryDeadlineMiddleware)
+    app.add_exception_handler(QueryCancelled, query_cancelled_handler)
+
+    # ─── Admission Control ───────────────────────────────────────
+    # wraps the deadline middleware, so time spent queued does not count
+    # against a request's query deadline
+    if ADMISSION_ENABLED:
+        app.add_middleware(AdmissionMiddleware)
+
+    # ─── CORS Middleware ─────────────────────────────────────────
+    # added last, so it is outermost and shed or cancelled responses carry its headers too
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["http://localhost:5173"],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+        expose_headers=["Server-Timing", "X-Profile"],
+    )
+
+    # ─── Warm-up & Background Jobs ───────────────────────────────
+    # startup hooks finish before uvicorn accepts connections
+    @app.on_event("startup")
+    def start_background_jobs():
+        if WARMUP_ENABLED:
+            app.state.warmup = warm_up()
+        start_refresher(shared_engine())  # no-op unless CUBE_ENABLED
+        start_counter_job(shared_engine())  # no-op unless DASHBOARD_COUNTERS_ENABLED
+        start_sketch_job(shared_engine())  # no-op unless DAILY_SKETCHES_ENABLED
+        start_geo_daily_job(shared_engine())  # no-op unless GEO_DAILY_ENABLED
+        start_continuous_profiler()  # no-op unless PROFILE_CONTINUOUS
+        start_lag_monitor()  # no-op without DB_REPLICA_HOSTS
+        start_coverage_monitor()  # no-op unless ADMISSION_ENABLED
+        start_insight_jobs()  # no-op unless INSIGHT_JOBS_ENABLED
+
+    # ─── REST API Routes ─────────────────────────────────────────
+    for router in (
+        dashboard_router,
+        financial_analysis_router,
+        operational_efficiency_router,
+        demographic_router,
+        risk_and_fraud_router,
+        customer_insight_router,
+        report_router,
+        exact_results_router,
+        live_router,
+        portfolio_router,
+        query_stats_router,
+        admin_router,
+        insight_jobs_router,
+    ):
+        app.include_router(router, prefix="/api")
+
+    # ─── Mount Correct GraphQL Schema ────────────────────────────
+    schema = strawberry.Schema(query=Query)
+    graphql_app = GraphQLRouter(schema)
+    app.include_router(graphql_app, prefix="/graphql")
 
-# ─── CORS Middleware ─────────────────────────────────────────────
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["http://localhost:5173"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+    # ─── Profiled Handler Threads ────────────────────────────────
+    # lets a per-request profile sample only the thread running its handler
+    pin_handler_threads(app)
 
-# ─── REST API Routes ─────────────────────────────────────────────
+    return app
 
 
-# ─── Mount Correct GraphQL Schema ────────────────────────────────
-schema = strawberry.Schema(query=Query)
-graphql_app = GraphQLRouter(schema)
-app.include_router(graphql_app, prefix="/graphql")
+app = create_app()